@@ -0,0 +1,100 @@
+import time
+import binascii
+
+class ChunkCoalescer:
+    """
+    Coalesces small streamed audio chunks into fixed-size frames.
+
+    Incoming chunks are copied into a preallocated frame buffer through
+    memoryviews, and a frame is only emitted once it is full or once the
+    oldest buffered byte has waited longer than the latency deadline. This
+    turns many tiny response writes into a few frame-sized ones.
+
+    The deadline is checked whenever a chunk arrives, and the very first bytes
+    of a stream are emitted immediately so time to first byte does not grow.
+    """
+
+    def __init__(self, frame_size=8192, max_latency=0.05, clock=time.monotonic):
+        """
+        Initialize the ChunkCoalescer.
+
+        Args:
+            frame_size (int, optional): Size of the emitted frames in bytes. Defaults to 8192.
+            max_latency (float, optional): Maximum time in seconds a byte is held back. Defaults to 0.05.
+            clock (callable, optional): Monotonic clock returning seconds. Defaults to time.monotonic.
+        """
+        self.frame_size = frame_size
+        self.max_latency = max_latency
+        self._clock = clock
+
+        self._buffer = bytearray(frame_size)
+        self._view = memoryview(self._buffer)
+        self._fill = 0
+        self._oldest = None
+        self._started = False
+
+    def feed_base64(self, data):
+        """
+        Decode a base64 chunk and add it to the buffer.
+
+        Args:
+            data (str or bytes): The base64 encoded audio chunk.
+
+        Returns:
+            list: The frames that are ready to be sent.
+        """
+        # The stdlib has no decode-into API, the decoded chunk is copied into the frame buffer right away
+        return self.feed(binascii.a2b_base64(data))
+
+    def feed(self, data):
+        """
+        Add a decoded chunk to the buffer.
+
+        Args:
+            data (bytes-like): The audio chunk.
+
+        Returns:
+            list: The frames that are ready to be sent.
+        """
+        frames = []
+        view = memoryview(data)
+
+        # Send the first bytes right away to keep time to first byte low
+        if not self._started:
+            self._started = True
+            if len(view):
+                frames.append(bytes(view))
+            return frames
+
+        offset = 0
+        while offset < len(view):
+            if self._fill == 0:
+                self._oldest = self._clock()
+
+            size = min(self.frame_size - self._fill, len(view) - offset)
+            self._view[self._fill:self._fill + size] = view[offset:offset + size]
+            self._fill += size
+            offset += size
+
+            if self._fill == self.frame_size:
+                frames.append(bytes(self._view))
+                self._fill = 0
+
+        if self._fill and self._clock() - self._oldest >= self.max_latency:
+            frames.append(self.flush())
+
+        return frames
+
+    def flush(self):
+        """
+        Emit whatever is buffered, e.g. at the end of a stream.
+
+        Returns:
+            bytes: The buffered audio, or None if the buffer is empty.
+        """
+        if not self._fill:
+            return None
+
+        frame = bytes(self._view[:self._fill])
+        self._fill = 0
+        return frame
@@ -0,0 +1,242 @@
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+
+class AudioCache:
+    """
+    A content-addressed, size-bounded disk cache for synthesized audio.
+
+    Each entry is stored as a single file named after the hash of the segment
+    text, voice and model. The least recently used files are evicted once the
+    total size exceeds the limit.
+
+    The directory may be shared by several processes, e.g. the workers of the
+    server. Every hit refreshes the modification time of its file, and each
+    process rescans the directory whenever it wrote a tenth of the limit, and
+    before evicting, so the limit applies to the files of all processes and the
+    least recently used of them go first. Between rescans, the directory may
+    exceed the limit by a tenth of it per process.
+    """
+
+    # Eviction frees space down to this fraction of the limit, and a process rescans the directory
+    # after writing the rest, so it is not rescanned on every put
+    EVICT_TO = 0.9
+
+    def __init__(self, cache_dir=os.path.join("cache", "audio"), max_bytes=256 * 1024 * 1024, url_prefix="/api/tts-cache/"):
+        """
+        Initialize the AudioCache.
+
+        Args:
+            cache_dir (str, optional): Directory to store audio files. Defaults to "cache/audio".
+            max_bytes (int, optional): Maximum total size of the cached files. Defaults to 256 MiB.
+            url_prefix (str, optional): URL prefix under which the server exposes cached files.
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.url_prefix = url_prefix
+
+        self._entries = OrderedDict()
+        self._total_bytes = 0
+        # Bytes this process wrote since the directory was last scanned
+        self._unscanned_bytes = 0
+        self._lock = threading.Lock()
+
+        # Create cache directory if it doesn't exist
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        with self._lock:
+            self._scan()
+            self._evict()
+
+    @staticmethod
+    def normalize_text(text):
+        """
+        Normalize a text segment so that whitespace differences share one entry.
+
+        Args:
+            text (str): The text segment.
+
+        Returns:
+            str: The normalized text.
+        """
+        return " ".join(text.split())
+
+    @classmethod
+    def make_key(cls, text, voice, model, kind="wav"):
+        """
+        Build the content address of a synthesized segment.
+
+        Args:
+            text (str): The text segment.
+            voice (str): The voice used for TTS.
+            model (str): The model used for TTS.
+            kind (str, optional): "wav" for complete files, "stream" for concatenated stream chunks.
+
+        Returns:
+            str: The hex digest identifying the audio.
+        """
+        payload = "\x00".join([cls.normalize_text(text), voice, model, kind])
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def is_valid_key(key):
+        """
+        Check that a key looks like one produced by make_key.
+
+        Args:
+            key (str): The key to check.
+
+        Returns:
+            bool: True if the key is a sha256 hex digest.
+        """
+        return len(key) == 64 and all(c in "0123456789abcdef" for c in key)
+
+    def path_for(self, key):
+        """
+        Get the file path of a cache entry.
+
+        Args:
+            key (str): The cache key.
+
+        Returns:
+            str: Path to the audio file.
+        """
+        return os.path.join(self.cache_dir, f"{key}.wav")
+
+    def url_for(self, key):
+        """
+        Get the URL under which the server exposes a cache entry.
+
+        Args:
+            key (str): The cache key.
+
+        Returns:
+            str: URL of the cached audio file.
+        """
+        return f"{self.url_prefix}{key}.wav"
+
+    def contains(self, key):
+        """
+        Check whether an entry is cached, marking it as recently used.
+
+        Args:
+            key (str): The cache key.
+
+        Returns:
+            bool: True if the entry is cached, also when another process stored it.
+        """
+        path = self.path_for(key)
+        try:
+            size = os.stat(path).st_size
+        except OSError:
+            # Never stored, or evicted by another process
+            self._forget(key)
+            return False
+
+        try:
+            # The modification time is the last use seen by every process
+            os.utime(path)
+        except OSError:
+            pass
+
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+            else:
+                self._entries[key] = size
+                self._total_bytes += size
+        return True
+
+    def get(self, key):
+        """
+        Read a cached audio file.
+
+        Args:
+            key (str): The cache key.
+
+        Returns:
+            bytes: The audio data, or None if it is not cached.
+        """
+        if not self.contains(key):
+            return None
+
+        try:
+            with open(self.path_for(key), 'rb') as f:
+                return f.read()
+        except OSError:
+            # The file was removed behind our back
+            self._forget(key)
+            return None
+
+    def put(self, key, data):
+        """
+        Store audio data in the cache.
+
+        Args:
+            key (str): The cache key.
+            data (bytes): The audio data.
+        """
+        if not data or len(data) > self.max_bytes:
+            return
+
+        path = self.path_for(key)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, path)
+
+        with self._lock:
+            if key in self._entries:
+                self._total_bytes -= self._entries.pop(key)
+            self._entries[key] = len(data)
+            self._total_bytes += len(data)
+            self._unscanned_bytes += len(data)
+
+            self._evict()
+
+    def _forget(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._total_bytes -= self._entries.pop(key)
+
+    def _evict(self):
+        """
+        Remove the least recently used files once the cache exceeds its size limit. Called with the lock held.
+        """
+        if self._total_bytes <= self.max_bytes and self._unscanned_bytes < self.max_bytes * (1 - self.EVICT_TO):
+            return
+
+        # Other processes add and remove files too, the directory tells the actual size
+        self._scan()
+        if self._total_bytes <= self.max_bytes:
+            return
+
+        target = self.max_bytes * self.EVICT_TO
+        while self._total_bytes > target and self._entries:
+            key, size = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            try:
+                os.remove(self.path_for(key))
+            except OSError:
+                pass
+
+    def _scan(self):
+        """
+        Index the files of the directory, least recently used first. Called with the lock held.
+        """
+        files = []
+        for entry in os.scandir(self.cache_dir):
+            key, ext = os.path.splitext(entry.name)
+            if ext != ".wav" or not self.is_valid_key(key):
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                # Evicted by another process meanwhile
+                continue
+            files.append((stat.st_mtime, key, stat.st_size))
+
+        self._entries = OrderedDict((key, size) for _, key, size in sorted(files))
+        self._total_bytes = sum(self._entries.values())
+        self._unscanned_bytes = 0
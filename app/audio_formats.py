@@ -0,0 +1,326 @@
+import math
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from app.wav_stream import wav_header, WavFormatError
+
+# WAV format tags of the supported encodings
+WAVE_FORMAT_PCM = 1
+WAVE_FORMAT_MULAW = 7
+
+# Output formats of the TTS endpoints. A framerate of None keeps the synthesized rate,
+# mono downmixes multichannel audio.
+OUTPUT_FORMATS = {
+    # As synthesized, 24 kHz 16-bit PCM for Qwen-TTS
+    "wav": {"framerate": None, "encoding": "pcm", "mono": False},
+    "wav-mono": {"framerate": None, "encoding": "pcm", "mono": True},
+    # Wideband speech, two thirds of the bytes
+    "wav-16k": {"framerate": 16000, "encoding": "pcm", "mono": True},
+    # Narrowband speech, a third of the bytes
+    "wav-8k": {"framerate": 8000, "encoding": "pcm", "mono": True},
+    # G.711 telephony audio, one byte per sample, a sixth of the bytes
+    "ulaw-8k": {"framerate": 8000, "encoding": "ulaw", "mono": True},
+}
+
+DEFAULT_FORMAT = "wav"
+
+# Taps of the anti-aliasing filter per polyphase branch
+FILTER_TAPS = 48
+
+# Passband of the anti-aliasing filter, as a fraction of the output Nyquist frequency
+FILTER_CUTOFF = 0.9
+
+# Scale of the supported input sample widths to the 16-bit range, and their offset
+_SAMPLE_TYPES = {1: (np.uint8, 256.0, 128), 2: (np.dtype('<i2'), 1.0, 0), 4: (np.dtype('<i4'), 1 / 65536, 0)}
+
+# G.711 μ-law constants, on 14-bit magnitudes, and the segment of every magnitude >> 6
+_ULAW_BIAS = 0x21
+_ULAW_CLIP = 8159
+_ULAW_SEGMENT = np.array([min(7, i.bit_length()) for i in range(129)], dtype=np.int32)
+
+def ulaw_encode(samples, out):
+    """
+    Encode 16-bit samples with G.711 μ-law, bit-exact with the reference implementation.
+
+    Args:
+        samples (numpy.ndarray): The int32 samples. They are overwritten.
+        out (numpy.ndarray): The uint8 array receiving the encoded bytes, of the same length.
+
+    Returns:
+        numpy.ndarray: out.
+    """
+    samples >>= 2
+    sign = np.signbit(samples)
+    np.abs(samples, out=samples)
+    np.minimum(samples, _ULAW_CLIP, out=samples)
+    samples += _ULAW_BIAS
+
+    segment = _ULAW_SEGMENT[samples >> 6]
+    mantissa = (np.minimum(samples, 0x1FFF) >> (segment + 1)) & 0x0F
+    np.invert(((segment << 4) | mantissa | (sign.astype(np.int32) << 7)).astype(np.uint8), out=out)
+    return out
+
+def lowpass_filter(up, down, taps=FILTER_TAPS, cutoff=FILTER_CUTOFF):
+    """
+    Design the anti-aliasing filter of a rational resampler, split into its polyphase branches.
+
+    Args:
+        up (int): Upsampling factor.
+        down (int): Downsampling factor.
+        taps (int, optional): Taps per branch. Defaults to FILTER_TAPS.
+        cutoff (float, optional): Passband as a fraction of the output Nyquist frequency.
+
+    Returns:
+        numpy.ndarray: A (up, taps) float32 array. Row p holds the coefficients of the
+            outputs at phase p, in the order of the input samples they multiply.
+    """
+    length = taps * up
+    # Cutoff in cycles per sample of the upsampled signal
+    fc = cutoff * 0.5 / max(up, down)
+    k = np.arange(length) - (length - 1) / 2
+    h = 2 * fc * np.sinc(2 * fc * k) * np.kaiser(length, 8.0)
+    # Zero stuffing divides the signal by the upsampling factor
+    h *= up / h.sum()
+
+    # Output at phase p is sum(h[p + j * up] * x[q - j]), the windows hold x[q - taps + 1 .. q]
+    return np.ascontiguousarray(h.reshape(taps, up).T[:, ::-1], dtype=np.float32)
+
+class AudioConverter:
+    """
+    Converts a stream of raw audio frames to an output format, chunk by chunk.
+
+    Samples are decoded straight from the incoming chunk and downmixed into a
+    preallocated float32 work buffer, which also keeps the filter history of
+    the previous chunk. The resampler is a polyphase FIR filter that computes
+    each output phase with one strided matrix product, so no upsampled or
+    intermediate copy of the audio is ever built. Chunks may split frames, the
+    remainder is carried over to the next chunk.
+    """
+
+    def __init__(self, params, audio_format=DEFAULT_FORMAT):
+        """
+        Initialize the AudioConverter.
+
+        Args:
+            params (dict): The channels, sample_width and framerate of the input frames, as returned by parse_wav.
+            audio_format (str, optional): A key of OUTPUT_FORMATS. Defaults to "wav".
+        """
+        if audio_format not in OUTPUT_FORMATS:
+            raise ValueError(f"Unknown audio format: {audio_format}")
+        if params['sample_width'] not in _SAMPLE_TYPES:
+            raise WavFormatError(f"Unsupported sample width: {params['sample_width']}")
+
+        spec = OUTPUT_FORMATS[audio_format]
+        self.audio_format = audio_format
+        self.params = params
+        self.channels = 1 if spec['mono'] else params['channels']
+        self.framerate = spec['framerate'] or params['framerate']
+        self.encoding = spec['encoding']
+        self.sample_width = 1 if self.encoding == 'ulaw' else 2
+
+        self._dtype, self._scale, self._offset = _SAMPLE_TYPES[params['sample_width']]
+        self._frame_size = params['channels'] * params['sample_width']
+        self._remainder = b""
+
+        # The output is the input when nothing changes
+        self.passthrough = (self.encoding == 'pcm' and params['sample_width'] == 2 and
+                            self.channels == params['channels'] and self.framerate == params['framerate'])
+
+        divisor = math.gcd(self.framerate, params['framerate'])
+        self._up = self.framerate // divisor
+        self._down = params['framerate'] // divisor
+        self._resample = self._up != 1 or self._down != 1
+        if self._resample:
+            self._filter = lowpass_filter(self._up, self._down)
+            self._history = self._filter.shape[1] - 1
+        else:
+            self._history = 0
+
+        # Global indices of the next input sample and of the next output sample
+        self._consumed = 0
+        self._produced = 0
+
+        self._work = np.zeros((0, self.channels), dtype=np.float32)
+        self._samples = np.zeros(0, dtype=np.float32)
+        self._scratch = np.zeros(0, dtype=np.int32)
+        self._out = np.zeros(0, dtype=np.uint8 if self.encoding == 'ulaw' else np.dtype('<i2'))
+
+    @property
+    def output_params(self):
+        """
+        dict: The channels, sample_width, framerate and WAV format tag of the output.
+        """
+        return {
+            'channels': self.channels,
+            'sample_width': self.sample_width,
+            'framerate': self.framerate,
+            'audio_format': WAVE_FORMAT_MULAW if self.encoding == 'ulaw' else WAVE_FORMAT_PCM,
+        }
+
+    def header(self, data_size=None):
+        """
+        Build the WAV header of the output.
+
+        Args:
+            data_size (int, optional): Size of the output frames in bytes. If None, the streaming convention is used.
+
+        Returns:
+            bytes: The 44 byte header.
+        """
+        params = self.output_params
+        return wav_header(params['channels'], params['sample_width'], params['framerate'], data_size,
+                          audio_format=params['audio_format'])
+
+    def convert(self, data):
+        """
+        Convert a chunk of input frames.
+
+        Args:
+            data (bytes-like): Raw input frames, possibly ending with a partial frame.
+
+        Returns:
+            bytes: The output frames available so far, possibly empty.
+        """
+        if self.passthrough:
+            return data
+
+        view = memoryview(data).cast('B')
+        head = b""
+        if self._remainder:
+            # Only the few bytes of the split frame are copied
+            carry = min(self._frame_size - len(self._remainder), len(view))
+            self._remainder += bytes(view[:carry])
+            view = view[carry:]
+            if len(self._remainder) < self._frame_size:
+                return b""
+            head = self._convert_frames(memoryview(self._remainder))
+            self._remainder = b""
+
+        usable = len(view) - len(view) % self._frame_size
+        if usable < len(view):
+            self._remainder = bytes(view[usable:])
+        body = self._convert_frames(view[:usable]) if usable else b""
+        return head + body if head else body
+
+    def _convert_frames(self, view):
+        """
+        Convert whole input frames.
+
+        Args:
+            view (memoryview): The frames.
+
+        Returns:
+            bytes: The output frames.
+        """
+        frames = np.frombuffer(view, dtype=self._dtype).reshape(-1, self.params['channels'])
+        count = len(frames)
+        history = self._history
+
+        if len(self._work) < history + count:
+            work = np.zeros((max(history + count, 2 * len(self._work)), self.channels), dtype=np.float32)
+            work[:history] = self._work[:history] if len(self._work) else 0
+            self._work = work
+
+        # Decode and downmix into the work buffer, after the history of the previous chunk
+        target = self._work[history:history + count]
+        if self.channels == frames.shape[1]:
+            np.copyto(target, frames, casting='unsafe')
+        else:
+            np.sum(frames, axis=1, dtype=np.float32, out=target[:, 0])
+            target *= 1 / frames.shape[1]
+        if self._offset:
+            target -= self._offset
+        if self._scale != 1.0:
+            target *= self._scale
+
+        if self._resample:
+            samples = self._polyphase(count)
+        else:
+            samples = target
+        self._consumed += count
+
+        if history:
+            # Keep the last input samples for the filter windows of the next chunk
+            self._work[:history] = self._work[count:count + history]
+
+        return self._encode(samples)
+
+    def _polyphase(self, count):
+        """
+        Resample the work buffer, whose history is followed by count new input samples.
+
+        Returns:
+            numpy.ndarray: The (outputs, channels) float32 output samples.
+        """
+        up, down = self._up, self._down
+        taps = self._filter.shape[1]
+        total = self._consumed + count
+
+        # Output n reads the input window ending at sample (n * down) // up
+        end = (total * up + down - 1) // down
+        outputs = end - self._produced
+        if len(self._samples) < outputs * self.channels:
+            self._samples = np.zeros(max(outputs * self.channels, 2 * len(self._samples)), dtype=np.float32)
+        samples = self._samples[:outputs * self.channels].reshape(outputs, self.channels)
+
+        # (count, channels, taps) view of the input windows, one per input sample
+        windows = sliding_window_view(self._work[:self._history + count], taps, axis=0)
+
+        # Outputs with the same index modulo up share a phase, and their windows are down samples apart
+        for residue in range(up):
+            first = self._produced + (residue - self._produced) % up
+            if first >= end:
+                continue
+            n = (end - 1 - first) // up + 1
+            phase = (first * down) % up
+            start = (first * down) // up - self._consumed
+            np.matmul(windows[start:start + (n - 1) * down + 1:down], self._filter[phase],
+                      out=samples[first - self._produced::up][:n])
+
+        self._produced = end
+        return samples
+
+    def _encode(self, samples):
+        """
+        Quantize float samples to the output encoding.
+
+        Args:
+            samples (numpy.ndarray): The (frames, channels) float32 samples in the 16-bit range.
+
+        Returns:
+            bytes: The encoded frames.
+        """
+        size = samples.size
+        if len(self._scratch) < size:
+            self._scratch = np.zeros(max(size, 2 * len(self._scratch)), dtype=np.int32)
+            self._out = np.zeros(len(self._scratch), dtype=self._out.dtype)
+
+        flat = samples.reshape(-1)
+        np.clip(flat, -32768, 32767, out=flat)
+        scratch = self._scratch[:size]
+        np.rint(flat, out=flat)
+        np.copyto(scratch, flat, casting='unsafe')
+
+        out = self._out[:size]
+        if self.encoding == 'ulaw':
+            ulaw_encode(scratch, out)
+        else:
+            np.copyto(out, scratch, casting='unsafe')
+        return out.tobytes()
+
+def convert_stream(chunks, params, audio_format=DEFAULT_FORMAT):
+    """
+    Convert a stream of raw audio frames.
+
+    Args:
+        chunks (iterable): The raw input frames.
+        params (dict): The channels, sample_width and framerate of the input.
+        audio_format (str, optional): A key of OUTPUT_FORMATS. Defaults to "wav".
+
+    Returns:
+        generator: A generator yielding the non-empty output chunks.
+    """
+    converter = AudioConverter(params, audio_format)
+    for chunk in chunks:
+        output = converter.convert(chunk)
+        if output:
+            yield output
@@ -0,0 +1,112 @@
+import os
+
+class DashScopeBackend:
+    """
+    The upstream backend calling the DashScope text generation and TTS APIs.
+
+    A backend provides generation_call and speech_call, which take the same
+    arguments and return the same responses as Generation.call and
+    SpeechSynthesizer.call, and fetch_audio to download a synthesized file.
+    """
+
+    def __init__(self, pool_maxsize=16):
+        """
+        Initialize the DashScopeBackend.
+
+        Args:
+            pool_maxsize (int, optional): Maximum number of pooled connections for audio downloads. Defaults to 16.
+        """
+        # Imported here, the fake backend does not need an HTTP client
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        # Audio downloads reuse pooled connections
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_maxsize)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+
+    @staticmethod
+    def preload():
+        """
+        Import the DashScope SDK ahead of the first call, which otherwise pays for the import.
+        """
+        import requests
+        from dashscope import Generation
+        from dashscope.audio.qwen_tts import SpeechSynthesizer
+
+    def generation_call(self, **kwargs):
+        """
+        Call the text generation API.
+
+        Args:
+            **kwargs: Arguments of Generation.call.
+
+        Returns:
+            The API response, or a generator of responses when streaming.
+        """
+        from dashscope import Generation
+        return Generation.call(**kwargs)
+
+    def speech_call(self, **kwargs):
+        """
+        Call the TTS API.
+
+        Args:
+            **kwargs: Arguments of SpeechSynthesizer.call.
+
+        Returns:
+            The API response, or a generator of responses when streaming.
+        """
+        from dashscope.audio.qwen_tts import SpeechSynthesizer
+        return SpeechSynthesizer.call(**kwargs)
+
+    def fetch_audio(self, url):
+        """
+        Download a synthesized audio file.
+
+        Args:
+            url (str): URL of the audio file.
+
+        Returns:
+            bytes: The audio data.
+        """
+        response = self._session.get(url)
+        response.raise_for_status()
+        return response.content
+
+def get_backend(name=None):
+    """
+    Create the backend selected by name or by the RECIPE_GEN_BACKEND environment variable.
+
+    Args:
+        name (str, optional): "dashscope" or "fake". Defaults to RECIPE_GEN_BACKEND, or "dashscope".
+
+    Returns:
+        The backend instance.
+    """
+    name = name or os.getenv("RECIPE_GEN_BACKEND", "dashscope")
+
+    if name == "dashscope":
+        return DashScopeBackend()
+    elif name == "fake":
+        from app.fake_backend import FakeBackend
+        return FakeBackend.from_env()
+    else:
+        raise ValueError(f"Unknown backend: {name}")
+
+def preload_backend(name=None):
+    """
+    Load the modules of the backend selected by name or by RECIPE_GEN_BACKEND, without creating it.
+
+    Args:
+        name (str, optional): "dashscope" or "fake". Defaults to RECIPE_GEN_BACKEND, or "dashscope".
+    """
+    name = name or os.getenv("RECIPE_GEN_BACKEND", "dashscope")
+
+    if name == "dashscope":
+        DashScopeBackend.preload()
+    elif name == "fake":
+        from app.fake_backend import FakeBackend
+    else:
+        raise ValueError(f"Unknown backend: {name}")
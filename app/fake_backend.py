@@ -0,0 +1,392 @@
+import os
+import re
+import glob
+import math
+import time
+import zlib
+import base64
+import contextlib
+import random
+import struct
+import threading
+from collections import OrderedDict
+from app.llm_logger import iter_log_entries
+from app.wav_stream import wav_header
+
+class FakeResponse(dict):
+    """
+    A dictionary with attribute access, shaped like the DashScope API responses.
+    """
+
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+def _wrap(value):
+    if isinstance(value, dict):
+        return FakeResponse({key: _wrap(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return [_wrap(item) for item in value]
+    return value
+
+class FakeBackend:
+    """
+    A deterministic local stand-in for the DashScope APIs.
+
+    It produces realistic recipe text and valid PCM/WAV audio with configurable
+    latency, time to first token, chunk sizes and error rates, so the services
+    and the server can be run and measured without an API key. Recorded
+    responses from the logs/ files can be replayed for matching prompts.
+    """
+
+    # Rough speaking rate used to size the synthesized audio
+    SECONDS_PER_CHARACTER = 0.06
+
+    # Number of synthesized files kept for fetch_audio
+    MAX_STORED_AUDIO = 1024
+
+    def __init__(self, first_token_latency=0.0, chunk_interval=0.0, chunk_size=16, error_rate=0.0,
+                 tts_latency=0.0, tts_chunk_interval=0.0, tts_chunk_bytes=4800, sample_rate=24000,
+                 seed=0, recordings=None, max_concurrent=0, tts_stream_headers=False):
+        """
+        Initialize the FakeBackend.
+
+        Args:
+            first_token_latency (float, optional): Seconds before the first text chunk. Defaults to 0.
+            chunk_interval (float, optional): Seconds between text chunks. Defaults to 0.
+            chunk_size (int, optional): Characters per streamed text chunk. Defaults to 16.
+            error_rate (float, optional): Probability that a call fails with a throttling error. Defaults to 0.
+            tts_latency (float, optional): Seconds before a TTS URL or the first audio chunk. Defaults to 0.
+            tts_chunk_interval (float, optional): Seconds between streamed audio chunks. Defaults to 0.
+            tts_chunk_bytes (int, optional): Bytes of PCM audio per streamed chunk. Defaults to 4800 (100 ms).
+            sample_rate (int, optional): Sample rate of the 16-bit mono audio. Defaults to 24000.
+            seed (int, optional): Seed of the error injection. Defaults to 0.
+            recordings (dict, optional): Recorded responses, mapping user prompts to response texts.
+            max_concurrent (int, optional): Simulated quota, calls beyond this many in progress are
+                throttled. 0 for no quota. Defaults to 0.
+            tts_stream_headers (bool, optional): Whether every streamed audio starts with a WAV header,
+                as some upstream models send it, instead of raw PCM. Defaults to False.
+        """
+        self.first_token_latency = first_token_latency
+        self.chunk_interval = chunk_interval
+        self.chunk_size = chunk_size
+        self.error_rate = error_rate
+        self.tts_latency = tts_latency
+        self.tts_chunk_interval = tts_chunk_interval
+        self.tts_chunk_bytes = tts_chunk_bytes
+        self.sample_rate = sample_rate
+        self.recordings = recordings or {}
+        self.max_concurrent = max_concurrent
+        self.tts_stream_headers = tts_stream_headers
+
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._audio = OrderedDict()
+        self._next_audio_id = 0
+        self._in_progress = 0
+
+        # One second of a quiet tone, repeated to build any duration
+        samples = (int(3000 * math.sin(2 * math.pi * 220 * i / sample_rate)) for i in range(sample_rate))
+        self._tone = struct.pack(f'<{sample_rate}h', *samples)
+
+    @property
+    def in_progress(self):
+        """
+        int: Number of calls in progress, e.g. to check that cancelled requests released their calls.
+        """
+        with self._lock:
+            return self._in_progress
+
+    @classmethod
+    def from_logs(cls, log_dir="logs", **kwargs):
+        """
+        Create a FakeBackend replaying the text generations recorded in a log directory.
+
+        Args:
+            log_dir (str, optional): Directory of the LLMLogger files. Defaults to "logs".
+            **kwargs: Other FakeBackend arguments.
+
+        Returns:
+            FakeBackend: The backend.
+        """
+        recordings = {}
+        for log_file in sorted(glob.glob(os.path.join(log_dir, "text_generation_*.json*"))):
+            for entry in iter_log_entries(log_file):
+                output = entry.get("output") or {}
+                if "content" in output:
+                    recordings[cls._user_prompt(entry.get("input") or [])] = output["content"]
+
+        return cls(recordings=recordings, **kwargs)
+
+    @classmethod
+    def from_env(cls):
+        """
+        Create a FakeBackend configured by FAKE_* environment variables.
+
+        Returns:
+            FakeBackend: The backend.
+        """
+        kwargs = {
+            "first_token_latency": float(os.getenv("FAKE_FIRST_TOKEN_LATENCY", "0.3")),
+            "chunk_interval": float(os.getenv("FAKE_CHUNK_INTERVAL", "0.02")),
+            "chunk_size": int(os.getenv("FAKE_CHUNK_SIZE", "16")),
+            "error_rate": float(os.getenv("FAKE_ERROR_RATE", "0")),
+            "tts_latency": float(os.getenv("FAKE_TTS_LATENCY", "0.3")),
+            "tts_chunk_interval": float(os.getenv("FAKE_TTS_CHUNK_INTERVAL", "0.05")),
+            "seed": int(os.getenv("FAKE_SEED", "0")),
+            "max_concurrent": int(os.getenv("FAKE_MAX_CONCURRENT", "0")),
+            "tts_stream_headers": os.getenv("FAKE_TTS_STREAM_HEADERS", "0") == "1",
+        }
+
+        replay_dir = os.getenv("FAKE_REPLAY_LOGS")
+        if replay_dir:
+            return cls.from_logs(replay_dir, **kwargs)
+        return cls(**kwargs)
+
+    def generation_call(self, messages, stream=False, **kwargs):
+        """
+        Stand-in for Generation.call.
+
+        Args:
+            messages (list): The messages sent to the LLM.
+            stream (bool, optional): Whether to stream incremental responses.
+            **kwargs: Other Generation.call arguments. max_tokens is honored, the others are ignored.
+
+        Returns:
+            The response, or a generator of incremental responses when streaming.
+        """
+        prompt = self._user_prompt(messages)
+        content = self.recordings.get(prompt) or self._recipe_text(prompt)
+
+        # Stop at the output budget, at the same rate of four characters per token as the usage
+        finish_reason = "stop"
+        max_tokens = kwargs.get("max_tokens")
+        if max_tokens and len(content) > max_tokens * 4:
+            content = content[:max_tokens * 4]
+            finish_reason = "length"
+
+        if stream:
+            return self._stream_generation(prompt, content, finish_reason)
+
+        with self._call() as failed:
+            if failed:
+                # Throttling is reported right away
+                return self._error_response()
+            time.sleep(self.first_token_latency + self.chunk_interval * (len(content) // self.chunk_size))
+
+        return _wrap({
+            "status_code": 200,
+            "code": "",
+            "message": "",
+            "output": {"choices": [{"finish_reason": finish_reason, "message": {"role": "assistant", "content": content}}]},
+            "usage": self._usage(prompt, content),
+        })
+
+    def speech_call(self, text, stream=False, **kwargs):
+        """
+        Stand-in for SpeechSynthesizer.call.
+
+        Args:
+            text (str): The text to synthesize.
+            stream (bool, optional): Whether to stream base64 PCM chunks.
+            **kwargs: Other SpeechSynthesizer.call arguments, ignored.
+
+        Returns:
+            The response, or a generator of audio chunk responses when streaming.
+        """
+        if stream:
+            return self._stream_speech(text)
+
+        with self._call() as failed:
+            if failed:
+                return self._error_response()
+            time.sleep(self.tts_latency)
+
+        with self._lock:
+            audio_id = self._next_audio_id
+            self._next_audio_id += 1
+
+            pcm = self._pcm(text)
+            self._audio[audio_id] = wav_header(1, 2, self.sample_rate, len(pcm)) + pcm
+            while len(self._audio) > self.MAX_STORED_AUDIO:
+                self._audio.popitem(last=False)
+
+        return _wrap({
+            "status_code": 200,
+            "output": {"audio": {"id": str(audio_id), "url": f"fake://tts/{audio_id}.wav"}},
+        })
+
+    def fetch_audio(self, url):
+        """
+        Download a file produced by speech_call.
+
+        Args:
+            url (str): The fake:// URL of the audio file.
+
+        Returns:
+            bytes: The WAV data.
+        """
+        match = re.fullmatch(r'fake://tts/(\d+)\.wav', url)
+        with self._lock:
+            audio_data = self._audio.get(int(match.group(1))) if match else None
+        if audio_data is None:
+            raise Exception(f"404 Not Found: {url}")
+        return audio_data
+
+    def _stream_generation(self, prompt, content, finish_reason):
+        with self._call() as failed:
+            if failed:
+                yield self._error_response()
+                return
+
+            time.sleep(self.first_token_latency)
+            for start in range(0, len(content), self.chunk_size):
+                if start:
+                    time.sleep(self.chunk_interval)
+                done = start + self.chunk_size >= len(content)
+                yield _wrap({
+                    "status_code": 200,
+                    "code": "",
+                    "message": "",
+                    "output": {"choices": [{
+                        "finish_reason": finish_reason if done else "null",
+                        "message": {"role": "assistant", "content": content[start:start + self.chunk_size]},
+                    }]},
+                    "usage": self._usage(prompt, content[:start + self.chunk_size]),
+                })
+
+    def _stream_speech(self, text):
+        with self._call() as failed:
+            if failed:
+                yield self._error_response()
+                return
+
+            time.sleep(self.tts_latency)
+            pcm = self._pcm(text)
+            if self.tts_stream_headers:
+                pcm = wav_header(1, 2, self.sample_rate, len(pcm)) + pcm
+            for start in range(0, len(pcm), self.tts_chunk_bytes):
+                if start:
+                    time.sleep(self.tts_chunk_interval)
+                data = base64.b64encode(pcm[start:start + self.tts_chunk_bytes]).decode()
+                yield _wrap({"status_code": 200, "output": {"audio": {"data": data}}})
+
+    @contextlib.contextmanager
+    def _call(self):
+        """
+        Track a call in progress, yielding whether it fails by error injection or over the quota.
+        """
+        with self._lock:
+            over_quota = self.max_concurrent and self._in_progress >= self.max_concurrent
+            failed = bool(over_quota) or self._random.random() < self.error_rate
+            self._in_progress += 1
+        try:
+            yield failed
+        finally:
+            with self._lock:
+                self._in_progress -= 1
+
+    @staticmethod
+    def _error_response():
+        return _wrap({
+            "status_code": 429,
+            "code": "Throttling.RateQuota",
+            "message": "Requests rate limit exceeded, please try again later.",
+            "output": None,
+        })
+
+    @staticmethod
+    def _usage(prompt, content):
+        # Roughly four characters per token
+        input_tokens = max(1, len(prompt) // 4)
+        output_tokens = max(1, len(content) // 4)
+        return {"input_tokens": input_tokens, "output_tokens": output_tokens, "total_tokens": input_tokens + output_tokens}
+
+    @staticmethod
+    def _user_prompt(messages):
+        for message in reversed(messages):
+            if message.get("role") == "user":
+                return message.get("content", "")
+        return ""
+
+    def _pcm(self, text):
+        """
+        Build 16-bit mono PCM audio with a duration matching the text length.
+        """
+        seconds = max(0.2, len(text) * self.SECONDS_PER_CHARACTER)
+        size = int(seconds * self.sample_rate) * 2
+        return self._tone * (size // len(self._tone)) + self._tone[:size % len(self._tone)]
+
+    def _recipe_text(self, prompt):
+        """
+        Write a plausible recipe for the ingredients named in a prompt, always the same for the same prompt.
+
+        Like an LLM, it adds an introduction and explanations unless the prompt
+        asks for a brief answer, and shortens the lists when asked to.
+        """
+        rng = random.Random(zlib.crc32(prompt.encode('utf-8')))
+        brief = "No introduction" in prompt
+        compact = "exactly this format" in prompt
+
+        match = re.search(r'ingredients: (.*?)\.( |$)', prompt)
+        ingredients = [item.strip() for item in match.group(1).split(',')] if match else ["chicken breast", "spinach", "tomatoes"]
+        ingredients = [item for item in ingredients if item] or ["rice"]
+
+        method = rng.choice(["Grilled", "Roasted", "Pan-Seared", "Baked", "Stir-Fried"])
+        side = rng.choice(["Salad", "Bowl", "Skillet", "Medley", "Plate"])
+        lines = [f"# {method} {ingredients[0].title()} {side}", ""]
+        if not brief:
+            lines += [
+                f"This {method.lower()} {side.lower()} brings together {', '.join(ingredients)} in a balanced, "
+                f"satisfying meal that is ready in about {rng.randint(20, 40)} minutes.",
+                "",
+            ]
+        lines.append("## Ingredients")
+
+        for item in ingredients:
+            lines.append(f"- {rng.choice([100, 150, 200, 250, 300])}g {item}")
+        lines.append(f"- {rng.randint(1, 2)} tbsp olive oil")
+        lines.append("- Salt and pepper to taste")
+
+        lines += ["", "## Instructions"]
+        steps = [
+            "Preheat the pan over medium-high heat and add the olive oil.",
+            f"Season the {ingredients[0]} with salt and pepper.",
+            f"Cook the {ingredients[0]} for {rng.randint(4, 8)} minutes on each side until cooked through.",
+        ]
+        steps += [f"Add the {item} and cook for {rng.randint(2, 5)} minutes." for item in ingredients[1:]]
+        steps.append("Let everything rest for 2 minutes, then plate and serve warm.")
+        if compact:
+            steps = steps[:4] + steps[-1:]
+        elif brief:
+            steps = steps[:5] + steps[-1:]
+        else:
+            steps = [step + " " + rng.choice([
+                "Stir occasionally so nothing sticks to the pan.",
+                "Keep an eye on the heat and lower it if anything starts to brown too quickly.",
+                "Taste as you go and adjust the seasoning to your liking.",
+            ]) for step in steps]
+        lines += [f"{index}. {step}" for index, step in enumerate(steps, 1)]
+
+        suggestions = [
+            "- Replace the olive oil with avocado oil for a higher smoke point.",
+            f"- Add a squeeze of lemon juice to brighten the {ingredients[-1]}.",
+            "- Reduce the portion size to lower the calories.",
+        ]
+        lines += [
+            "",
+            "## Nutritional Information",
+            f"- Calories: {rng.randint(300, 700)} kcal",
+            f"- Protein: {rng.randint(15, 60)}g",
+            f"- {'Carbs' if compact else 'Carbohydrates'}: {rng.randint(5, 60)}g",
+            f"- Fat: {rng.randint(5, 35)}g",
+            "",
+            "## Suggestions" if compact else "## Suggestions for Modifications",
+        ]
+        lines += suggestions[:1] if compact else suggestions[:2] if brief else suggestions
+
+        if not brief:
+            lines += ["", "Enjoy your meal, and feel free to swap in seasonal vegetables to keep it interesting!"]
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,358 @@
+import os
+import math
+import time
+import random
+import threading
+from app import metrics
+
+class UpstreamThrottled(Exception):
+    """
+    Raised when the upstream API keeps throttling a call, or a call waited too long for the governor.
+    """
+
+    def __init__(self, message, retry_after=1):
+        """
+        Initialize the error.
+
+        Args:
+            message (str): The error message.
+            retry_after (int, optional): Suggested delay in seconds before the client retries. Defaults to 1.
+        """
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class UpstreamGovernor:
+    """
+    Paces the calls to one upstream API to keep throughput just under its quota.
+
+    Every call takes a token from a token bucket, which caps the call rate, and
+    a slot of an adaptive concurrency limit. The limit grows by about one for
+    every limit successful calls and shrinks multiplicatively when the upstream
+    throttles or its recent latency rises well above its long-term average
+    (AIMD), at most once per round of calls in flight. Comparing averages
+    rather than single calls keeps long outputs from looking like congestion.
+    Throttled calls are retried after a jittered exponential backoff.
+    """
+
+    def __init__(self, name, rate=0, burst=None, initial_concurrency=8, min_concurrency=1, max_concurrency=64,
+                 max_retries=3, backoff_base=0.5, backoff_max=8.0, latency_tolerance=2.0, throttle_decrease=0.5,
+                 latency_decrease=0.9, queue_timeout=30.0, clock=time.monotonic, sleep=time.sleep, seed=None):
+        """
+        Initialize the UpstreamGovernor.
+
+        Args:
+            name (str): Name of the upstream, used in metrics and the status.
+            rate (float, optional): Maximum calls per second, 0 for no rate limit. Defaults to 0.
+            burst (int, optional): Capacity of the token bucket. Defaults to one second of calls.
+            initial_concurrency (int, optional): Initial concurrency limit. Defaults to 8.
+            min_concurrency (int, optional): Lowest concurrency limit. Defaults to 1.
+            max_concurrency (int, optional): Highest concurrency limit. Defaults to 64.
+            max_retries (int, optional): Retries of a throttled call. Defaults to 3.
+            backoff_base (float, optional): Backoff of the first retry in seconds. Defaults to 0.5.
+            backoff_max (float, optional): Maximum backoff in seconds. Defaults to 8.
+            latency_tolerance (float, optional): Recent latency, as a multiple of the long-term average,
+                above which the limit is decreased. 0 disables latency-driven decreases. Defaults to 2.
+            throttle_decrease (float, optional): Factor applied to the limit on throttling. Defaults to 0.5.
+            latency_decrease (float, optional): Factor applied to the limit on high latency. Defaults to 0.9.
+            queue_timeout (float, optional): Maximum time in seconds a call waits for a token and a slot. Defaults to 30.
+            clock (callable, optional): Monotonic clock returning seconds. Defaults to time.monotonic.
+            sleep (callable, optional): Sleep function used for the backoff. Defaults to time.sleep.
+            seed (int, optional): Seed of the backoff jitter.
+        """
+        self.name = name
+        self.rate = rate
+        self.burst = burst or max(1, math.ceil(rate))
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.latency_tolerance = latency_tolerance
+        self.throttle_decrease = throttle_decrease
+        self.latency_decrease = latency_decrease
+        self.queue_timeout = queue_timeout
+
+        self._clock = clock
+        self._sleep = sleep
+        self._random = random.Random(seed)
+
+        self._cond = threading.Condition()
+        self._limit = float(min(max(initial_concurrency, min_concurrency), max_concurrency))
+        self._in_flight = 0
+        self._waiting = 0
+        self._tokens = float(self.burst)
+        self._refilled = clock()
+        self._last_decrease = clock()
+        self._recent_latency = None
+        self._average_latency = None
+
+    @staticmethod
+    def is_throttled(response):
+        """
+        Check whether an upstream response reports throttling.
+
+        Args:
+            response: The API response.
+
+        Returns:
+            bool: True if the call was throttled.
+        """
+        if getattr(response, 'status_code', None) == 429:
+            return True
+        return str(getattr(response, 'code', None) or "").startswith("Throttling")
+
+    @property
+    def limit(self):
+        """
+        int: The current concurrency limit.
+        """
+        return max(1, int(self._limit))
+
+    def status(self):
+        """
+        Report the current limits and queue depth.
+
+        Returns:
+            dict: The status.
+        """
+        with self._cond:
+            self._refill(self._clock())
+            return {
+                'limit': self.limit,
+                'in_flight': self._in_flight,
+                'waiting': self._waiting,
+                'rate': self.rate,
+                'tokens': round(self._tokens, 2),
+                'recent_latency': self._recent_latency,
+                'average_latency': self._average_latency,
+            }
+
+    def retry_after(self):
+        """
+        Suggest how long a client should wait before retrying a throttled request.
+
+        Returns:
+            int: The delay in seconds.
+        """
+        with self._cond:
+            if self.rate:
+                return max(1, math.ceil((self._waiting + 1) / self.rate))
+            return max(1, math.ceil(min(self.backoff_max, self.backoff_base * 2 ** self.max_retries)))
+
+    def call(self, func, *args, **kwargs):
+        """
+        Make a call through the governor, retrying it while it is throttled.
+
+        Args:
+            func (callable): The upstream call, returning a response.
+            *args: Positional arguments for the call.
+            **kwargs: Keyword arguments for the call.
+
+        Returns:
+            The response of the last attempt, which is still throttled if the retries ran out.
+        """
+        attempt = 0
+        while True:
+            self._acquire()
+            start = self._clock()
+            try:
+                response = func(*args, **kwargs)
+            finally:
+                self._release()
+
+            throttled = self.is_throttled(response)
+            self._observe(start, self._clock() - start, throttled)
+
+            if not throttled or attempt >= self.max_retries:
+                return response
+
+            self._backoff(attempt)
+            attempt += 1
+
+    def stream(self, func, *args, **kwargs):
+        """
+        Make a streaming call through the governor.
+
+        A stream is retried while its first response reports throttling, and
+        holds its concurrency slot until it is exhausted or closed. The latency
+        of a stream is the time to its first response.
+
+        Args:
+            func (callable): The upstream call, returning an iterator of responses.
+            *args: Positional arguments for the call.
+            **kwargs: Keyword arguments for the call.
+
+        Returns:
+            generator: A generator yielding the responses.
+        """
+        attempt = 0
+        while True:
+            self._acquire()
+            start = self._clock()
+            responses = None
+            try:
+                responses = iter(func(*args, **kwargs))
+                first = next(responses, None)
+
+                throttled = first is not None and self.is_throttled(first)
+                self._observe(start, self._clock() - start, throttled)
+
+                if not throttled or attempt >= self.max_retries:
+                    if first is not None:
+                        yield first
+                    yield from responses
+                    return
+            finally:
+                close = getattr(responses, 'close', None)
+                if close is not None:
+                    close()
+                self._release()
+
+            self._backoff(attempt)
+            attempt += 1
+
+    def _acquire(self):
+        """
+        Wait for a token and a concurrency slot.
+        """
+        start = self._clock()
+        deadline = start + self.queue_timeout
+
+        with self._cond:
+            self._waiting += 1
+            try:
+                while True:
+                    now = self._clock()
+                    self._refill(now)
+
+                    has_token = not self.rate or self._tokens >= 1
+                    if has_token and self._in_flight < self.limit:
+                        if self.rate:
+                            self._tokens -= 1
+                        self._in_flight += 1
+                        break
+
+                    if now >= deadline:
+                        raise UpstreamThrottled(
+                            f"Upstream {self.name} is busy, please try again later",
+                            retry_after=max(1, math.ceil((self._waiting + 1) / (self.rate or self.limit)))
+                        )
+
+                    # Wake up when a token is due, or when a slot is released
+                    timeout = deadline - now
+                    if not has_token:
+                        timeout = min(timeout, (1 - self._tokens) / self.rate)
+                    self._cond.wait(timeout)
+            finally:
+                self._waiting -= 1
+
+        metrics.UPSTREAM_WAIT_SECONDS.observe(self._clock() - start, self.name)
+
+    def _release(self):
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify()
+
+    def _refill(self, now):
+        if self.rate:
+            self._tokens = min(self.burst, self._tokens + (now - self._refilled) * self.rate)
+        self._refilled = now
+
+    def _observe(self, start, latency, throttled):
+        """
+        Adapt the concurrency limit to the outcome of a call.
+
+        Args:
+            start (float): Clock time at which the call started.
+            latency (float): Latency of the call in seconds.
+            throttled (bool): Whether the upstream throttled the call.
+        """
+        if throttled:
+            metrics.UPSTREAM_THROTTLES.inc(self.name)
+
+        with self._cond:
+            congested = throttled
+            if not throttled and self.latency_tolerance:
+                if self._average_latency is None:
+                    self._recent_latency = self._average_latency = latency
+                else:
+                    # Moving averages over roughly the last 10 and 200 calls
+                    self._recent_latency += (latency - self._recent_latency) * 0.1
+                    self._average_latency += (latency - self._average_latency) * 0.005
+                congested = self._recent_latency > self._average_latency * self.latency_tolerance
+
+            if congested:
+                # Calls started before the last decrease saw the old limit, they do not decrease it again
+                if start >= self._last_decrease:
+                    factor = self.throttle_decrease if throttled else self.latency_decrease
+                    self._limit = max(self.min_concurrency, self._limit * factor)
+                    self._last_decrease = self._clock()
+            else:
+                old_limit = self.limit
+                self._limit = min(self.max_concurrency, self._limit + 1 / self._limit)
+                if self.limit > old_limit:
+                    self._cond.notify(self.limit - old_limit)
+
+    def _backoff(self, attempt):
+        metrics.UPSTREAM_RETRIES.inc(self.name)
+
+        # Full jitter spreads the retries of calls throttled at the same time
+        delay = min(self.backoff_max, self.backoff_base * 2 ** attempt)
+        self._sleep(self._random.uniform(0, delay))
+
+_governors = {}
+_governors_lock = threading.Lock()
+
+def _env(name, key, default):
+    return os.getenv(f"UPSTREAM_{name.upper()}_{key}", os.getenv(f"UPSTREAM_{key}", default))
+
+def get_governor(name):
+    """
+    Get the process-wide governor of an upstream API, creating it on first use.
+
+    It is configured by UPSTREAM_<NAME>_<SETTING> environment variables, which
+    fall back to UPSTREAM_<SETTING>: RATE, BURST, CONCURRENCY, MIN_CONCURRENCY,
+    MAX_CONCURRENCY, MAX_RETRIES and QUEUE_TIMEOUT.
+
+    Args:
+        name (str): Name of the upstream, e.g. "generation" or "tts".
+
+    Returns:
+        UpstreamGovernor: The governor.
+    """
+    with _governors_lock:
+        governor = _governors.get(name)
+        if governor is None:
+            burst = _env(name, "BURST", "")
+            governor = _governors[name] = UpstreamGovernor(
+                name,
+                rate=float(_env(name, "RATE", "0")),
+                burst=int(burst) if burst else None,
+                initial_concurrency=int(_env(name, "CONCURRENCY", "8")),
+                min_concurrency=int(_env(name, "MIN_CONCURRENCY", "1")),
+                max_concurrency=int(_env(name, "MAX_CONCURRENCY", "64")),
+                max_retries=int(_env(name, "MAX_RETRIES", "3")),
+                queue_timeout=float(_env(name, "QUEUE_TIMEOUT", "30")),
+            )
+        return governor
+
+def governor_status():
+    """
+    Report the status of every governor.
+
+    Returns:
+        dict: The status by upstream name.
+    """
+    with _governors_lock:
+        governors = list(_governors.values())
+    return {governor.name: governor.status() for governor in governors}
+
+def _gauge(field):
+    return lambda: {(name,): status[field] for name, status in governor_status().items()}
+
+metrics.REGISTRY.gauge(
+    "upstream_concurrency_limit", "Current adaptive concurrency limit.", ["upstream"], _gauge('limit'))
+metrics.REGISTRY.gauge(
+    "upstream_in_flight", "Upstream calls in progress.", ["upstream"], _gauge('in_flight'))
+metrics.REGISTRY.gauge(
+    "upstream_queue_depth", "Calls waiting for the upstream governor.", ["upstream"], _gauge('waiting'))
@@ -1,37 +1,384 @@
 import os
+import re
+import sys
 import json
+import glob
+import queue
+import atexit
 import logging
 import datetime
+import threading
+import time
 from pathlib import Path
+from app import metrics
+
+class JsonlLogWriter:
+    """
+    A background writer that appends JSON-Lines log entries in batches.
+
+    Entries are queued by the request threads and written by a single daemon
+    thread, which flushes once a batch is full or the oldest queued entry is
+    older than the flush interval. Every flush is one append per file, so the
+    cost of a write does not depend on the size of the log.
+    """
+
+    # Overflow policies applied when the queue is full
+    OVERFLOW_BLOCK = "block"
+    OVERFLOW_DROP = "drop"
+
+    _STOP = object()
+
+    def __init__(self, max_queue_size=10000, batch_size=100, flush_interval=1.0, overflow=OVERFLOW_DROP):
+        """
+        Initialize the JsonlLogWriter and start its writer thread.
+
+        Args:
+            max_queue_size (int, optional): Maximum number of queued entries. Defaults to 10000.
+            batch_size (int, optional): Number of entries that triggers a flush. Defaults to 100.
+            flush_interval (float, optional): Maximum time in seconds an entry waits before being written. Defaults to 1.0.
+            overflow (str, optional): "drop" to discard new entries when the queue is full,
+                "block" to make the caller wait for free space. Defaults to "drop".
+        """
+        if overflow not in (self.OVERFLOW_BLOCK, self.OVERFLOW_DROP):
+            raise ValueError(f"Unknown overflow policy: {overflow}")
+
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.overflow = overflow
+        self.dropped = 0
+
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="JsonlLogWriter", daemon=True)
+        self._thread.start()
+
+    def submit(self, log_file, log_entry):
+        """
+        Queue a log entry for writing.
+
+        Args:
+            log_file (str): Path to the JSON-Lines log file.
+            log_entry (dict): The log entry to append.
+
+        Returns:
+            bool: False if the entry was dropped because the queue is full or the writer is closed.
+        """
+        if self._closed:
+            return False
+
+        try:
+            self._queue.put((log_file, log_entry), block=self.overflow == self.OVERFLOW_BLOCK)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def flush(self, timeout=None):
+        """
+        Wait until every entry queued so far has been written.
+
+        Args:
+            timeout (float, optional): Maximum time to wait in seconds.
+
+        Returns:
+            bool: True if the entries were written within the timeout.
+        """
+        if self._closed:
+            return not self._thread.is_alive()
+
+        done = threading.Event()
+        try:
+            self._queue.put(done, timeout=timeout)
+        except queue.Full:
+            return False
+        return done.wait(timeout)
+
+    def close(self, timeout=5.0):
+        """
+        Write the remaining entries and stop the writer thread.
+
+        Args:
+            timeout (float, optional): Maximum time to wait in seconds. Defaults to 5.0.
+        """
+        if self._closed:
+            return
+        self._closed = True
+
+        # The stop marker must not be dropped, so wait for space in the queue
+        self._queue.put(self._STOP)
+        self._thread.join(timeout)
+
+    def _run(self):
+        """
+        Collect queued entries into batches and write them until stopped.
+        """
+        while True:
+            batch = []
+            waiters = []
+            stop = False
+
+            # Wait for the first entry of the batch, then fill it until it is full or too old
+            item = self._queue.get()
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                if item is self._STOP:
+                    stop = True
+                elif isinstance(item, threading.Event):
+                    waiters.append(item)
+                else:
+                    batch.append(item)
+
+                if stop or waiters or len(batch) >= self.batch_size:
+                    break
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+
+            if stop:
+                # Drain whatever was queued before the stop marker
+                while True:
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if isinstance(item, threading.Event):
+                        waiters.append(item)
+                    elif item is not self._STOP:
+                        batch.append(item)
+
+            self._write_batch(batch)
+
+            for waiter in waiters:
+                waiter.set()
+
+            if stop:
+                return
+
+    def _write_batch(self, batch):
+        """
+        Append a batch of entries, with a single write per log file.
+
+        Args:
+            batch (list): List of (log_file, log_entry) tuples.
+        """
+        with metrics.LOG_BATCH_WRITE_SECONDS.time():
+            self._write_lines(batch)
+
+    def _write_lines(self, batch):
+        lines_by_file = {}
+        for log_file, log_entry in batch:
+            lines_by_file.setdefault(log_file, []).append(json.dumps(log_entry, ensure_ascii=False) + "\n")
+
+        for log_file, lines in lines_by_file.items():
+            try:
+                with open(log_file, 'a', encoding='utf-8') as f:
+                    f.write("".join(lines))
+            except OSError as e:
+                # Never let a logging failure kill the writer thread
+                logging.getLogger("LLMLogger").error(f"Failed to write {log_file}: {str(e)}")
+
+_shared_writer = None
+_shared_writer_lock = threading.Lock()
+
+def get_shared_writer():
+    """
+    Get the process-wide JSON-Lines writer, starting it on first use.
+
+    Returns:
+        JsonlLogWriter: The shared writer.
+    """
+    global _shared_writer
+    with _shared_writer_lock:
+        if _shared_writer is None:
+            _shared_writer = JsonlLogWriter(
+                max_queue_size=int(os.getenv("LLM_LOG_QUEUE_SIZE", "10000")),
+                batch_size=int(os.getenv("LLM_LOG_BATCH_SIZE", "100")),
+                flush_interval=float(os.getenv("LLM_LOG_FLUSH_INTERVAL", "1.0")),
+                overflow=os.getenv("LLM_LOG_OVERFLOW", JsonlLogWriter.OVERFLOW_DROP),
+            )
+            # Flush the pending entries on interpreter shutdown
+            atexit.register(_shared_writer.close)
+        return _shared_writer
+
+def _reset_shared_writer():
+    # The writer thread of the parent does not exist in a forked child
+    global _shared_writer, _shared_writer_lock
+    _shared_writer = None
+    _shared_writer_lock = threading.Lock()
+
+os.register_at_fork(after_in_child=_reset_shared_writer)
+
+_logging_configured = False
+_logging_lock = threading.Lock()
+
+def configure_logging(log_dir="logs"):
+    """
+    Send the application log to the console and to llm_api.log, once per process.
+
+    Every logger instance used to call logging.basicConfig, which opened a new
+    file handler each time even though only the first one was installed.
+
+    Args:
+        log_dir (str, optional): Directory of the log file. Defaults to "logs".
+    """
+    global _logging_configured
+    with _logging_lock:
+        if _logging_configured:
+            return
+        _logging_configured = True
+
+        os.makedirs(log_dir, exist_ok=True)
+        logging.basicConfig(
+            level=logging.INFO,
+            format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+            handlers=[
+                logging.FileHandler(os.path.join(log_dir, "llm_api.log")),
+                logging.StreamHandler()
+            ]
+        )
+
+def iter_json_array(log_file, chunk_size=1024 * 1024):
+    """
+    Read the elements of a JSON array file one at a time, without loading the whole file.
+
+    Args:
+        log_file (str): Path to the JSON array file.
+        chunk_size (int, optional): Number of characters read at a time. Defaults to 1 MiB.
+
+    Returns:
+        generator: A generator yielding the elements.
+    """
+    decoder = json.JSONDecoder()
+    separators = re.compile(r'[\s,]*')
+
+    with open(log_file, 'r', encoding='utf-8') as f:
+        buffer = f.read(chunk_size).lstrip()
+        if not buffer:
+            return
+        if not buffer.startswith("["):
+            raise ValueError(f"{log_file} is not a JSON array")
+
+        position = 1
+        eof = False
+        while True:
+            # Skip the separators between the elements
+            position = separators.match(buffer, position).end()
+
+            if position < len(buffer) and buffer[position] == "]":
+                return
+
+            try:
+                element, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                # The element continues in the next chunk
+                if eof:
+                    raise
+                more = f.read(chunk_size)
+                eof = not more
+                buffer = buffer[position:] + more
+                position = 0
+                continue
+
+            yield element
+            position = end
+
+            # Drop the parsed part, so the buffer holds about one chunk
+            if position > chunk_size:
+                buffer = buffer[position:]
+                position = 0
+
+def iter_log_entries(log_file):
+    """
+    Read the entries of a log file in either format, one at a time.
+
+    Args:
+        log_file (str): Path to an array-format (.json) or JSON-Lines (.jsonl) log file.
+
+    Returns:
+        generator: A generator yielding the log entries.
+    """
+    if log_file.endswith(".jsonl"):
+        with open(log_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+    else:
+        yield from iter_json_array(log_file)
+
+def convert_json_log(json_path, output_path=None, remove_source=False):
+    """
+    Convert an array-format JSON log file into a JSON-Lines log file.
+
+    If the JSON-Lines file already exists, the converted entries are placed
+    before its content, since the array file was written before the switch.
+
+    Args:
+        json_path (str): Path to the array-format log file.
+        output_path (str, optional): Path to the JSON-Lines file. Defaults to the same name with a .jsonl extension.
+        remove_source (bool, optional): Whether to delete the array file after a successful conversion.
+
+    Returns:
+        int: The number of converted entries.
+    """
+    output_path = output_path or os.path.splitext(json_path)[0] + ".jsonl"
+
+    # The array is streamed, so a large log is never loaded as a whole
+    count = 0
+    temp_path = f"{output_path}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as out:
+        for entry in iter_json_array(json_path):
+            out.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            count += 1
+
+        if os.path.exists(output_path):
+            with open(output_path, 'r', encoding='utf-8') as existing:
+                for line in existing:
+                    out.write(line)
+
+    os.replace(temp_path, output_path)
+
+    if remove_source:
+        os.remove(json_path)
+
+    return count
 
 class LLMLogger:
     """
     A utility class for logging LLM API calls.
     """
-    
-    def __init__(self, log_dir="logs"):
+
+    # Lock serializing read-modify-write cycles of the array-format log files
+    _json_lock = threading.Lock()
+
+    def __init__(self, log_dir="logs", log_format=None):
         """
         Initialize the LLMLogger.
         
         Args:
             log_dir (str, optional): Directory to store logs. Defaults to "logs".
+            log_format (str, optional): "jsonl" to append JSON-Lines from a background writer, or "json" to
+                keep one JSON array per day. Defaults to the LLM_LOG_FORMAT environment variable, or "jsonl".
         """
         self.log_dir = log_dir
+        self.log_format = log_format or os.getenv("LLM_LOG_FORMAT", "jsonl")
+        if self.log_format not in ("json", "jsonl"):
+            raise ValueError(f"Unknown log format: {self.log_format}")
         
         # Create logs directory if it doesn't exist
         os.makedirs(self.log_dir, exist_ok=True)
         
         # Set up logging
-        logging.basicConfig(
-            level=logging.INFO,
-            format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-            handlers=[
-                logging.FileHandler(os.path.join(self.log_dir, "llm_api.log")),
-                logging.StreamHandler()
-            ]
-        )
+        configure_logging(self.log_dir)
         
         self.logger = logging.getLogger("LLMLogger")
+
+        self._writer = get_shared_writer() if self.log_format == "jsonl" else None
     
     def log_text_generation(self, input_data, output_data, model="qwen-plus"):
         """
@@ -52,13 +399,13 @@ class LLMLogger:
         }
         
         # Log to file
-        log_file = os.path.join(self.log_dir, f"text_generation_{datetime.datetime.now().strftime('%Y%m%d')}.json")
-        self._append_to_json_log(log_file, log_entry)
+        self._write_entry("text_generation", log_entry)
         
         # Log to standard logger
         self.logger.info(f"Text Generation API Call - Model: {model}")
     
-    def log_tts(self, input_text, output_url=None, output_data=None, voice="Ethan", model="qwen-tts"):
+    def log_tts(self, input_text, output_url=None, output_data=None, voice="Ethan", model="qwen-tts", cancelled=False,
+                error=None):
         """
         Log text-to-speech API calls.
         
@@ -68,6 +415,9 @@ class LLMLogger:
             output_data (bytes, optional): The raw audio data for streaming responses.
             voice (str, optional): The voice used for TTS. Defaults to "Ethan".
             model (str, optional): The model used for TTS. Defaults to "qwen-tts".
+            cancelled (bool, optional): Whether the call was stopped early because nobody
+                was consuming its audio anymore. Defaults to False.
+            error (str, optional): The error of a failed call, which marks the entry as its end.
         """
         timestamp = datetime.datetime.now().isoformat()
         log_entry = {
@@ -83,14 +433,48 @@ class LLMLogger:
             log_entry["output_url"] = output_url
         if output_data:
             log_entry["output_size"] = len(output_data) if output_data else 0
+        if cancelled:
+            log_entry["cancelled"] = True
+        if error is not None:
+            log_entry["error"] = error
         
         # Log to file
-        log_file = os.path.join(self.log_dir, f"tts_{datetime.datetime.now().strftime('%Y%m%d')}.json")
-        self._append_to_json_log(log_file, log_entry)
+        self._write_entry("tts", log_entry)
         
         # Log to standard logger
         self.logger.info(f"TTS API Call - Model: {model}, Voice: {voice}")
     
+    def _write_entry(self, log_type, log_entry):
+        """
+        Write a log entry to the daily log file of its type.
+
+        Args:
+            log_type (str): The log type, used as the file name prefix.
+            log_entry (dict): The log entry to write.
+        """
+        date = datetime.datetime.now().strftime('%Y%m%d')
+
+        start = time.perf_counter()
+        if self._writer is not None:
+            log_file = os.path.join(self.log_dir, f"{log_type}_{date}.jsonl")
+            if not self._writer.submit(log_file, log_entry):
+                self.logger.warning(f"Log queue full, dropped {log_type} entry")
+        else:
+            log_file = os.path.join(self.log_dir, f"{log_type}_{date}.json")
+            with self._json_lock:
+                self._append_to_json_log(log_file, log_entry)
+        metrics.LOG_WRITE_SECONDS.observe(time.perf_counter() - start, self.log_format)
+
+    def flush(self, timeout=None):
+        """
+        Wait until the queued log entries have been written.
+
+        Args:
+            timeout (float, optional): Maximum time to wait in seconds.
+        """
+        if self._writer is not None:
+            self._writer.flush(timeout)
+
     def _append_to_json_log(self, log_file, log_entry):
         """
         Append a log entry to a JSON log file.
@@ -114,4 +498,20 @@ class LLMLogger:
         
         # Write back to file
         with open(log_file, 'w', encoding='utf-8') as f:
-            json.dump(existing_logs, f, ensure_ascii=False, indent=2)
\ No newline at end of file
+            json.dump(existing_logs, f, ensure_ascii=False, indent=2)
+
+if __name__ == '__main__':
+    # Usage: python -m app.llm_logger convert [--remove] <log file or directory> ...
+    args = sys.argv[1:]
+    if not args or args[0] != "convert":
+        print("Usage: python -m app.llm_logger convert [--remove] <log file or directory> ...")
+        sys.exit(1)
+
+    remove_source = "--remove" in args
+    paths = [arg for arg in args[1:] if arg != "--remove"] or ["logs"]
+
+    for path in paths:
+        json_files = sorted(glob.glob(os.path.join(path, "*.json"))) if os.path.isdir(path) else [path]
+        for json_file in json_files:
+            count = convert_json_log(json_file, remove_source=remove_source)
+            print(f"Converted {count} entries from {json_file}")
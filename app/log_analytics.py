@@ -0,0 +1,394 @@
+import os
+import re
+import sys
+import glob
+import datetime
+import argparse
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.llm_logger import iter_log_entries
+
+# Log types and the columns of their partitions, besides ts, latency, status and model
+LOG_TYPES = {
+    "text_generation": ("ingredients",),
+    "tts": ("voice", "chars"),
+}
+
+# Values of the status column
+STATUS_OK, STATUS_ERROR, STATUS_UNFINISHED, STATUS_CANCELLED = 0, 1, 2, 3
+
+_LOG_FILE = re.compile(r"^(?P<type>text_generation|tts)_(?P<day>\d{8})\.jsonl?$")
+_INGREDIENTS = re.compile(r"ingredients: (.*?)\.(?: |\n|$)")
+
+def _prompt(entry):
+    messages = entry.get("input") or []
+    return next((message.get("content") for message in messages
+                 if isinstance(message, dict) and message.get("role") == "user"), None) or ""
+
+def _is_end(log_type, entry):
+    """
+    Tell the entry that ends a call from the one that starts it.
+    """
+    if log_type == "text_generation":
+        return entry.get("output") is not None
+    return "output_url" in entry or "output_size" in entry or "error" in entry or bool(entry.get("cancelled"))
+
+def read_calls(log_type, log_files):
+    """
+    Pair the entries of logged calls into one row per call.
+
+    Every call is logged when it starts and again when it ends, with its output
+    or its error. The end is matched to the oldest unfinished call of the same
+    input. A TTS call that failed ends with an error field, one stopped early
+    because its client went away with a cancelled field. Failed TTS calls of
+    older logs, written without the error field, stay unfinished.
+
+    Args:
+        log_type (str): "text_generation" or "tts".
+        log_files (list): The log files of the type, in time order.
+
+    Returns:
+        dict: The columns as lists: ts and end_ts (ISO timestamps of the start and end,
+            None for unfinished calls), status, model, and ingredients (lists of names)
+            or voice and chars.
+    """
+    columns = {name: [] for name in ("ts", "end_ts", "status", "model") + LOG_TYPES[log_type]}
+    pending = defaultdict(list)
+
+    for log_file in log_files:
+        for entry in iter_log_entries(log_file):
+            if log_type == "text_generation":
+                text = _prompt(entry)
+                key = text
+            else:
+                text = entry.get("input") or ""
+                key = (text, entry.get("voice"))
+
+            if not _is_end(log_type, entry):
+                row = len(columns["ts"])
+                pending[key].append(row)
+                columns["ts"].append(entry.get("timestamp"))
+                columns["end_ts"].append(None)
+                columns["status"].append(STATUS_UNFINISHED)
+                columns["model"].append(entry.get("model") or "")
+                if log_type == "text_generation":
+                    match = _INGREDIENTS.search(text)
+                    columns["ingredients"].append(
+                        [item.strip().lower() for item in match.group(1).split(",") if item.strip()] if match else [])
+                else:
+                    columns["voice"].append(entry.get("voice") or "")
+                    columns["chars"].append(len(text))
+                continue
+
+            if key not in pending:
+                # The start was logged in the file of the previous day, or lost
+                continue
+
+            row = pending[key].pop(0)
+            if not pending[key]:
+                del pending[key]
+
+            output = entry.get("output")
+            if log_type == "text_generation":
+                cancelled = isinstance(output, dict) and bool(output.get("cancelled"))
+                failed = isinstance(output, dict) and "error" in output
+            else:
+                cancelled = bool(entry.get("cancelled"))
+                failed = "error" in entry
+            columns["status"][row] = STATUS_CANCELLED if cancelled else STATUS_ERROR if failed else STATUS_OK
+            columns["end_ts"][row] = entry.get("timestamp")
+
+    return columns
+
+def _encode(values):
+    """
+    Dictionary-encode a list of strings.
+
+    Returns:
+        tuple: The distinct values and the code of every value.
+    """
+    if not values:
+        return np.array([], dtype=str), np.array([], dtype=np.int32)
+    dictionary, codes = np.unique(np.asarray(values, dtype=str), return_inverse=True)
+    return dictionary, codes.astype(np.int32)
+
+def write_partition(path, log_type, columns):
+    """
+    Write the calls of one day and type as a columnar .npz file.
+
+    Args:
+        path (str): Path of the .npz file.
+        log_type (str): "text_generation" or "tts".
+        columns (dict): The columns returned by read_calls.
+    """
+    ts = np.array([ts or "NaT" for ts in columns["ts"]], dtype="datetime64[us]")
+    end_ts = np.array([ts or "NaT" for ts in columns["end_ts"]], dtype="datetime64[us]")
+    arrays = {
+        "ts": ts,
+        # Unfinished calls have a NaN latency
+        "latency": ((end_ts - ts) / np.timedelta64(1, "s")).astype(np.float32),
+        "status": np.asarray(columns["status"], dtype=np.int8),
+    }
+    arrays["model_values"], arrays["model"] = _encode(columns["model"])
+
+    if log_type == "text_generation":
+        # Ingredient lists are stored flat, with the offset of every call's list
+        lengths = [len(items) for items in columns["ingredients"]]
+        arrays["ingredient_offsets"] = np.concatenate([[0], np.cumsum(lengths, dtype=np.int64)]).astype(np.int64)
+        arrays["ingredient_values"], arrays["ingredient"] = _encode([item for items in columns["ingredients"] for item in items])
+    else:
+        arrays["voice_values"], arrays["voice"] = _encode(columns["voice"])
+        arrays["chars"] = np.asarray(columns["chars"], dtype=np.int32)
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f"{path}.tmp.npz"
+    np.savez(temp_path, **arrays)
+    os.replace(temp_path, path)
+
+def _convert_partition(path, log_type, log_files):
+    write_partition(path, log_type, read_calls(log_type, log_files))
+    return path
+
+def convert_logs(log_dir="logs", out_dir=None, force=False, max_workers=None):
+    """
+    Convert the log files into columnar partitions, one per type and day.
+
+    A partition is only rewritten when one of its log files changed since it was
+    written. Partitions are converted in parallel processes.
+
+    Args:
+        log_dir (str, optional): Directory of the logs. Defaults to "logs".
+        out_dir (str, optional): Directory of the partitions. Defaults to "columnar" in the log directory.
+        force (bool, optional): Whether to rewrite every partition. Defaults to False.
+        max_workers (int, optional): Number of processes. Defaults to the number of CPUs.
+
+    Returns:
+        list: The paths of the partitions that were written.
+    """
+    out_dir = out_dir or os.path.join(log_dir, "columnar")
+
+    sources = defaultdict(list)
+    for log_file in glob.glob(os.path.join(log_dir, "*.json*")):
+        match = _LOG_FILE.match(os.path.basename(log_file))
+        if match:
+            sources[(match.group("type"), match.group("day"))].append(log_file)
+
+    tasks = []
+    for (log_type, day), log_files in sorted(sources.items()):
+        path = os.path.join(out_dir, log_type, f"{day}.npz")
+        if not force and os.path.exists(path) and os.path.getmtime(path) >= max(map(os.path.getmtime, log_files)):
+            continue
+
+        # The array file of a day was written before its JSON-Lines file
+        log_files.sort(key=lambda name: name.endswith(".jsonl"))
+        tasks.append((path, log_type, log_files))
+
+    if len(tasks) <= 1 or max_workers == 1:
+        return [_convert_partition(*task) for task in tasks]
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(_convert_partition, *zip(*tasks)))
+
+class LogStore:
+    """
+    Answers aggregate queries over the columnar partitions of the logs.
+
+    The partitions of the requested days are loaded and their columns
+    concatenated, with the dictionaries of the string columns merged, so every
+    query is a few vectorized operations over all calls of the time range.
+    """
+
+    def __init__(self, out_dir):
+        """
+        Initialize the LogStore.
+
+        Args:
+            out_dir (str): Directory of the partitions written by convert_logs.
+        """
+        self.out_dir = out_dir
+
+    def load(self, log_type, since=None, until=None, columns=("ts", "latency", "status")):
+        """
+        Load columns of the calls of a type in a range of days.
+
+        Only the requested columns are read from the partitions.
+
+        Args:
+            log_type (str): "text_generation" or "tts".
+            since (datetime.date, optional): First day, inclusive. Defaults to the first logged day.
+            until (datetime.date, optional): Last day, inclusive. Defaults to the last logged day.
+            columns (tuple, optional): Names of the columns: ts, latency, status, model, and
+                ingredient or voice and chars. Defaults to ts, latency and status.
+
+        Returns:
+            dict: The concatenated columns. String columns are returned as codes, with
+                their distinct values under "<name>_values".
+        """
+        parts = []
+        for path in sorted(glob.glob(os.path.join(self.out_dir, log_type, "*.npz"))):
+            day = datetime.datetime.strptime(os.path.basename(path)[:8], "%Y%m%d").date()
+            if (since is None or day >= since) and (until is None or day <= until):
+                with np.load(path) as partition:
+                    names = [name for name in partition.files
+                             if name in columns or name.rsplit("_", 1)[0] in columns]
+                    parts.append({name: partition[name] for name in names})
+
+        result = {}
+        for name in columns:
+            if not parts or name not in parts[0]:
+                continue
+            if f"{name}_values" in parts[0]:
+                result[f"{name}_values"], result[name] = self._merge_codes(parts, name)
+            else:
+                result[name] = np.concatenate([part[name] for part in parts])
+        return result
+
+    @staticmethod
+    def _merge_codes(parts, name):
+        values = np.unique(np.concatenate([part[f"{name}_values"] for part in parts]))
+        codes = [np.searchsorted(values, part[f"{name}_values"])[part[name]] if len(part[name]) else part[name]
+                 for part in parts]
+        return values, np.concatenate(codes).astype(np.int32)
+
+    def latency_percentiles(self, log_type, since=None, until=None, percentiles=(50, 90, 95, 99)):
+        """
+        Compute the latency percentiles of the successful calls.
+
+        Returns:
+            dict: The number of calls as "count", and the latency in seconds of every percentile as "p<n>".
+        """
+        calls = self.load(log_type, since, until, columns=("latency", "status"))
+        if not calls:
+            return {"count": 0, **{f"p{percentile}": float("nan") for percentile in percentiles}}
+        latency = calls["latency"][(calls["status"] == STATUS_OK) & ~np.isnan(calls["latency"])]
+
+        result = {"count": int(len(latency))}
+        values = np.percentile(latency, percentiles) if len(latency) else [np.nan] * len(percentiles)
+        for percentile, value in zip(percentiles, values):
+            result[f"p{percentile}"] = float(value)
+        return result
+
+    def counts_by(self, log_type, column, since=None, until=None):
+        """
+        Count the calls by the value of a column, e.g. "model" or "voice".
+
+        Returns:
+            dict: The number of calls by value, most frequent first.
+        """
+        if column != "model" and not (column == "voice" and log_type == "tts"):
+            raise ValueError(f"Unknown column for {log_type}: {column}")
+
+        calls = self.load(log_type, since, until, columns=(column,))
+        if column not in calls:
+            return {}
+
+        counts = np.bincount(calls[column], minlength=len(calls[f"{column}_values"]))
+        order = np.argsort(-counts, kind="stable")
+        return {str(calls[f"{column}_values"][i]): int(counts[i]) for i in order if counts[i]}
+
+    def ingredient_frequencies(self, since=None, until=None, top=20):
+        """
+        Count the ingredients of the recipe requests.
+
+        Returns:
+            list: (ingredient, count) tuples, most frequent first.
+        """
+        calls = self.load("text_generation", since, until, columns=("ingredient",))
+        if "ingredient" not in calls:
+            return []
+
+        counts = np.bincount(calls["ingredient"], minlength=len(calls["ingredient_values"]))
+        order = np.argsort(-counts, kind="stable")[:top]
+        return [(str(calls["ingredient_values"][i]), int(counts[i])) for i in order if counts[i]]
+
+    def error_rates(self, log_type, window="hour", since=None, until=None):
+        """
+        Compute the share of failed calls per time window.
+
+        Args:
+            log_type (str): "text_generation" or "tts".
+            window (str, optional): "minute", "hour" or "day". Defaults to "hour".
+
+        Returns:
+            list: (window start, calls, errors, error rate) tuples in time order.
+        """
+        units = {"minute": "m", "hour": "h", "day": "D"}
+        if window not in units:
+            raise ValueError(f"Unknown window: {window}")
+
+        calls = self.load(log_type, since, until, columns=("ts", "status"))
+        if not calls:
+            return []
+        finished = calls["status"] != STATUS_UNFINISHED
+        windows, inverse = np.unique(calls["ts"][finished].astype(f"datetime64[{units[window]}]"), return_inverse=True)
+        totals = np.bincount(inverse, minlength=len(windows))
+        errors = np.bincount(inverse, weights=calls["status"][finished] == STATUS_ERROR, minlength=len(windows))
+        return [(str(start), int(total), int(error), float(error / total))
+                for start, total, error in zip(windows, totals, errors)]
+
+def _parse_day(text):
+    return datetime.datetime.strptime(text, "%Y-%m-%d").date()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Query the LLM and TTS logs.")
+    parser.add_argument("--logs", default="logs", help="Directory of the logs (default: logs)")
+    parser.add_argument("--out", help="Directory of the columnar partitions (default: <logs>/columnar)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    convert = commands.add_parser("convert", help="Convert new or changed log files")
+    convert.add_argument("--force", action="store_true", help="Rewrite every partition")
+
+    queries = {
+        "latency": "Latency percentiles of the successful calls",
+        "counts": "Number of calls by model or voice",
+        "ingredients": "Most frequent ingredients of the recipe requests",
+        "errors": "Error rate per time window",
+    }
+    for name, help_text in queries.items():
+        query = commands.add_parser(name, help=help_text)
+        query.add_argument("--since", type=_parse_day, help="First day, YYYY-MM-DD")
+        query.add_argument("--until", type=_parse_day, help="Last day, YYYY-MM-DD")
+        query.add_argument("--days", type=int, help="Only the last N days, including today")
+        if name != "ingredients":
+            query.add_argument("--type", choices=sorted(LOG_TYPES), default="tts")
+        if name == "counts":
+            query.add_argument("--by", default="model", help="model or voice (default: model)")
+        if name == "ingredients":
+            query.add_argument("--top", type=int, default=20)
+        if name == "errors":
+            query.add_argument("--window", choices=["minute", "hour", "day"], default="hour")
+
+    args = parser.parse_args(argv)
+    out_dir = args.out or os.path.join(args.logs, "columnar")
+
+    # Queries first bring the partitions up to date, which only converts the changed days
+    written = convert_logs(args.logs, out_dir, force=getattr(args, "force", False))
+    if args.command == "convert":
+        print(f"Wrote {len(written)} partitions to {out_dir}")
+        return
+
+    since, until = args.since, args.until
+    if args.days:
+        since = datetime.date.today() - datetime.timedelta(days=args.days - 1)
+
+    store = LogStore(out_dir)
+    if args.command == "latency":
+        result = store.latency_percentiles(args.type, since, until)
+        print(f"{args.type} calls: {result.pop('count')}")
+        for name, value in result.items():
+            print(f"{name:>4}: {value * 1000:10.1f} ms")
+    elif args.command == "counts":
+        for value, count in store.counts_by(args.type, args.by, since, until).items():
+            print(f"{count:>8}  {value}")
+    elif args.command == "ingredients":
+        for ingredient, count in store.ingredient_frequencies(since, until, args.top):
+            print(f"{count:>8}  {ingredient}")
+    elif args.command == "errors":
+        for start, total, errors, rate in store.error_rates(args.type, args.window, since, until):
+            print(f"{start}  {total:>8} calls  {errors:>6} errors  {rate:6.1%}")
+
+if __name__ == '__main__':
+    main()
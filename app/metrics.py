@@ -0,0 +1,374 @@
+import time
+import bisect
+import threading
+
+# Latency buckets in seconds, from cache hits to slow upstream calls
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Buckets for small counts, e.g. segments per request
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000)
+
+class _Metric:
+    """
+    Base class of the metrics, recording into per-thread shards.
+
+    Every thread updates its own shard, so recording never takes a lock and
+    threads do not contend. The lock is only taken when a thread records for
+    the first time and when the shards are collected; shards of finished
+    threads are then folded into a retired total so they do not pile up.
+    """
+
+    type_name = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        """
+        Initialize the metric.
+
+        Args:
+            name (str): The metric name.
+            documentation (str): The help text.
+            labelnames (tuple, optional): The label names. Defaults to none.
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._shards = []
+        self._retired = {}
+
+    def _shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = {}
+            with self._lock:
+                self._fold_finished()
+                self._shards.append((threading.current_thread(), shard))
+        return shard
+
+    def _fold_finished(self):
+        alive = []
+        for thread, shard in self._shards:
+            if thread.is_alive():
+                alive.append((thread, shard))
+            else:
+                self._merge(self._retired, shard)
+        self._shards = alive
+
+    def collect(self):
+        """
+        Sum the shards of all threads.
+
+        Returns:
+            dict: The values by label values tuple.
+        """
+        with self._lock:
+            self._fold_finished()
+            total = {}
+            self._merge(total, self._retired)
+            for _, shard in self._shards:
+                # Copy first, the owning thread may add labels meanwhile
+                self._merge(total, dict(shard))
+        return total
+
+    def _merge(self, total, shard):
+        raise NotImplementedError
+
+    def render(self):
+        raise NotImplementedError
+
+    def _label_text(self, labels, extra=()):
+        return _label_text(self.labelnames, labels, extra)
+
+class Counter(_Metric):
+    """
+    A monotonically increasing count, e.g. of requests or tokens.
+    """
+
+    type_name = "counter"
+
+    def inc(self, *labels, amount=1):
+        """
+        Increase the counter.
+
+        Args:
+            *labels: The label values, in the order of the label names.
+            amount (float, optional): The increment. Defaults to 1.
+        """
+        shard = self._shard()
+        shard[labels] = shard.get(labels, 0) + amount
+
+    def _merge(self, total, shard):
+        for labels, value in shard.items():
+            total[labels] = total.get(labels, 0) + value
+
+    def render(self):
+        lines = []
+        for labels, value in sorted(self.collect().items()):
+            lines.append(f"{self.name}{self._label_text(labels)} {_format(value)}")
+        return lines
+
+class Histogram(_Metric):
+    """
+    A distribution of observed values in cumulative buckets, e.g. of latencies.
+    """
+
+    type_name = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        """
+        Initialize the histogram.
+
+        Args:
+            name (str): The metric name.
+            documentation (str): The help text.
+            labelnames (tuple, optional): The label names. Defaults to none.
+            buckets (tuple, optional): The sorted upper bounds of the buckets. Defaults to LATENCY_BUCKETS.
+        """
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        """
+        Record a value.
+
+        Args:
+            value (float): The observed value.
+            *labels: The label values, in the order of the label names.
+        """
+        shard = self._shard()
+        state = shard.get(labels)
+        if state is None:
+            # Bucket counts, then the +Inf bucket, then the sum
+            state = shard[labels] = [0] * (len(self.buckets) + 2)
+        state[bisect.bisect_left(self.buckets, value)] += 1
+        state[-1] += value
+
+    def time(self, *labels):
+        """
+        Measure the duration of a block.
+
+        Args:
+            *labels: The label values, in the order of the label names.
+
+        Returns:
+            A context manager observing the elapsed time in seconds on exit.
+        """
+        return _Timer(self, labels)
+
+    def _merge(self, total, shard):
+        for labels, state in shard.items():
+            merged = total.get(labels)
+            if merged is None:
+                total[labels] = list(state)
+            else:
+                for index, value in enumerate(state):
+                    merged[index] += value
+
+    def render(self):
+        lines = []
+        for labels, state in sorted(self.collect().items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), state):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{self._label_text(labels, [('le', _format(bound))])} {cumulative}")
+            lines.append(f"{self.name}_sum{self._label_text(labels)} {_format(state[-1])}")
+            lines.append(f"{self.name}_count{self._label_text(labels)} {cumulative}")
+        return lines
+
+class Gauge:
+    """
+    A current value, e.g. a limit or a queue depth, read from a callback on scrape.
+    """
+
+    type_name = "gauge"
+
+    def __init__(self, name, documentation, labelnames, callback):
+        """
+        Initialize the gauge.
+
+        Args:
+            name (str): The metric name.
+            documentation (str): The help text.
+            labelnames (tuple): The label names.
+            callback (callable): Returns the values by label values tuple.
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._callback = callback
+
+    def collect(self):
+        return self._callback()
+
+    def render(self):
+        lines = []
+        for labels, value in sorted(self.collect().items()):
+            lines.append(f"{self.name}{_label_text(self.labelnames, labels)} {_format(value)}")
+        return lines
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self._histogram = histogram
+        self._labels = labels
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._histogram.observe(time.perf_counter() - self._start, *self._labels)
+
+class MetricsRegistry:
+    """
+    A set of metrics rendered together in the Prometheus text format.
+    """
+
+    def __init__(self):
+        """
+        Initialize the MetricsRegistry.
+        """
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def counter(self, name, documentation, labelnames=()):
+        """
+        Create and register a counter.
+
+        Returns:
+            Counter: The counter.
+        """
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        """
+        Create and register a histogram.
+
+        Returns:
+            Histogram: The histogram.
+        """
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge(self, name, documentation, labelnames, callback):
+        """
+        Create and register a gauge.
+
+        Returns:
+            Gauge: The gauge.
+        """
+        return self._register(Gauge(name, documentation, labelnames, callback))
+
+    def _register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        """
+        Render all metrics in the Prometheus text exposition format.
+
+        Returns:
+            str: The metrics page.
+        """
+        with self._lock:
+            metrics = list(self._metrics)
+
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type_name}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+def _label_text(labelnames, labels, extra=()):
+    pairs = list(zip(labelnames, labels)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(str(value))}"' for name, value in pairs) + "}"
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value)) if abs(value) < 1e15 else repr(value)
+    return str(value)
+
+# Content type of the rendered metrics page
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# The registry of the application metrics
+REGISTRY = MetricsRegistry()
+
+LLM_FIRST_CHUNK_SECONDS = REGISTRY.histogram(
+    "recipe_llm_first_chunk_seconds", "Time from the LLM call to the first streamed chunk.")
+LLM_DURATION_SECONDS = REGISTRY.histogram(
+    "recipe_llm_duration_seconds", "Total duration of LLM calls.", ["mode"])
+LLM_STREAM_CHUNKS = REGISTRY.histogram(
+    "recipe_llm_stream_chunks", "Number of chunks per streamed LLM response.", buckets=COUNT_BUCKETS)
+LLM_TOKENS = REGISTRY.counter(
+    "recipe_llm_tokens_total", "Tokens reported by the upstream API.", ["model", "type"])
+LLM_CANCELLED_TOKENS = REGISTRY.counter(
+    "recipe_llm_cancelled_tokens_total",
+    "Output tokens of cancelled LLM streams, generated before the cancellation or left of their budget.", ["type"])
+
+TTS_SEGMENT_SECONDS = REGISTRY.histogram(
+    "tts_segment_seconds", "Upstream latency per synthesized segment.", ["mode"])
+TTS_FIRST_CHUNK_SECONDS = REGISTRY.histogram(
+    "tts_first_chunk_seconds", "Time from the streaming TTS call to the first audio chunk.")
+TTS_AUDIO_BYTES = REGISTRY.counter(
+    "tts_audio_bytes_total", "Audio bytes received from the upstream API.", ["mode"])
+TTS_OUTPUT_BYTES = REGISTRY.counter(
+    "tts_output_bytes_total", "Audio bytes sent to clients by output format.", ["format"])
+TTS_SEGMENTS = REGISTRY.histogram(
+    "tts_segments_per_request", "Number of segments a text is split into.", buckets=COUNT_BUCKETS)
+TTS_SEGMENTS_SKIPPED = REGISTRY.counter(
+    "tts_segments_skipped_total", "Segments of cancelled requests that were never synthesized.", ["mode"])
+
+SIMILARITY_LOOKUPS = REGISTRY.counter(
+    "recipe_similarity_lookups_total", "Lookups of similar previous requests by result.", ["result"])
+
+UPSTREAM_ERRORS = REGISTRY.counter(
+    "upstream_errors_total", "Failed upstream API calls.", ["service", "code"])
+UPSTREAM_THROTTLES = REGISTRY.counter(
+    "upstream_throttles_total", "Upstream responses that reported throttling.", ["upstream"])
+UPSTREAM_RETRIES = REGISTRY.counter(
+    "upstream_retries_total", "Upstream calls retried after throttling.", ["upstream"])
+UPSTREAM_WAIT_SECONDS = REGISTRY.histogram(
+    "upstream_wait_seconds", "Time a call waited for the upstream governor.", ["upstream"])
+UPSTREAM_CANCELLED = REGISTRY.counter(
+    "upstream_streams_cancelled_total", "Upstream streams closed early because nobody was consuming them.", ["upstream"])
+
+LOG_WRITE_SECONDS = REGISTRY.histogram(
+    "llm_log_write_seconds", "Time a request thread spends writing a log entry.", ["format"])
+LOG_BATCH_WRITE_SECONDS = REGISTRY.histogram(
+    "llm_log_batch_write_seconds", "Time the background writer spends writing a batch.")
+
+SCHEDULER_WAIT_SECONDS = REGISTRY.histogram(
+    "scheduler_wait_seconds", "Time an admitted request waited for the request scheduler.", ["class"])
+SCHEDULER_REJECTED = REGISTRY.counter(
+    "scheduler_rejected_total", "Requests shed by the request scheduler by reason.", ["class", "reason"])
+
+HTTP_REQUESTS = REGISTRY.counter(
+    "http_requests_total", "HTTP responses by endpoint and status.", ["endpoint", "status"])
+HTTP_STREAM_ERRORS = REGISTRY.counter(
+    "http_stream_errors_total", "Errors reported after a streaming response started.", ["endpoint"])
+HTTP_STREAMS_CANCELLED = REGISTRY.counter(
+    "http_streams_cancelled_total", "Streaming responses ended early because the client disconnected.", ["endpoint"])
+
+def record_usage(usage, model):
+    """
+    Count the tokens of an API response.
+
+    Args:
+        usage: The usage of the response, a mapping with input_tokens and output_tokens, or None.
+        model (str): The model name.
+    """
+    if not usage:
+        return
+
+    for kind in ("input_tokens", "output_tokens"):
+        value = usage.get(kind)
+        if value:
+            LLM_TOKENS.inc(model, kind[:-len("_tokens")], amount=value)
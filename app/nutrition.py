@@ -0,0 +1,374 @@
+import os
+import re
+import csv
+import difflib
+import threading
+import numpy as np
+
+# The bundled nutrient table, values per 100 g
+DEFAULT_TABLE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "foods.csv")
+
+# Grams per unit of mass
+MASS_UNITS = {
+    'g': 1.0, 'gr': 1.0, 'gram': 1.0, 'grams': 1.0,
+    'kg': 1000.0, 'kilogram': 1000.0, 'kilograms': 1000.0,
+    'mg': 0.001,
+    'oz': 28.35, 'ounce': 28.35, 'ounces': 28.35,
+    'lb': 453.6, 'lbs': 453.6, 'pound': 453.6, 'pounds': 453.6,
+}
+
+# Milliliters per unit of volume, converted to grams with the density of the food
+VOLUME_UNITS = {
+    'ml': 1.0, 'milliliter': 1.0, 'milliliters': 1.0, 'millilitre': 1.0, 'millilitres': 1.0,
+    'l': 1000.0, 'liter': 1000.0, 'liters': 1000.0, 'litre': 1000.0, 'litres': 1000.0,
+    'tsp': 4.93, 'teaspoon': 4.93, 'teaspoons': 4.93,
+    'tbsp': 14.79, 'tbs': 14.79, 'tablespoon': 14.79, 'tablespoons': 14.79,
+    'cup': 236.6, 'cups': 236.6,
+    'pinch': 0.3, 'pinches': 0.3, 'dash': 0.6, 'dashes': 0.6,
+}
+
+# Units counting pieces, weighed with the piece weight of the food
+COUNT_UNITS = {
+    'piece', 'pieces', 'whole', 'clove', 'cloves', 'slice', 'slices', 'fillet', 'fillets',
+    'stalk', 'stalks', 'sprig', 'sprigs', 'scoop', 'scoops', 'handful', 'handfuls', 'leaf', 'leaves',
+}
+
+# Size words scaling the piece weight
+SIZE_FACTORS = {'small': 0.7, 'medium': 1.0, 'large': 1.3}
+
+# Words describing the preparation rather than the food
+DESCRIPTORS = {
+    'fresh', 'freshly', 'chopped', 'diced', 'minced', 'sliced', 'grated', 'shredded', 'crushed',
+    'ground', 'boneless', 'skinless', 'organic', 'ripe', 'raw', 'finely', 'roughly', 'thinly',
+    'peeled', 'trimmed', 'halved', 'cubed', 'frozen', 'dried', 'lean', 'extra', 'virgin', 'about',
+    'of', 'small', 'medium', 'large', 'optional', 'to', 'taste', 'for', 'garnish', 'serving',
+}
+
+# Weight of a piece when the table has none, and density when the table has none
+DEFAULT_PIECE_GRAMS = 100.0
+DEFAULT_DENSITY = 1.0
+
+_FRACTIONS = {'½': 0.5, '⅓': 1 / 3, '⅔': 2 / 3, '¼': 0.25, '¾': 0.75, '⅛': 0.125}
+
+_NUMBER = r'(?:\d+(?:\.\d+)?(?:\s*/\s*\d+)?|\d*\s*[½⅓⅔¼¾⅛])'
+_QUANTITY = rf'{_NUMBER}(?:\s+{_NUMBER})?(?:\s*(?:-|–|to)\s*{_NUMBER})?'
+_UNIT = r'[a-zA-Z]+\.?'
+
+# "200g chicken breast", "1 1/2 cups rice", "2-3 cloves garlic"
+_LEADING = re.compile(rf'^(?P<quantity>{_QUANTITY})\s*(?P<unit>{_UNIT})?\s+(?P<name>.+)$')
+# "Chicken breast: 200g", "Olive oil - 1 tbsp"
+_TRAILING = re.compile(rf'^(?P<name>[^:]+?)\s*(?::|-|–)\s*(?P<quantity>{_QUANTITY})\s*(?P<unit>{_UNIT})?$')
+# "(about 400g)", "(7 oz)"
+_PARENTHETICAL_MASS = re.compile(rf'\((?:about|approx\.?|approximately|~)?\s*(?P<quantity>{_NUMBER})\s*(?P<unit>g|grams|kg|oz|ounces|lb|lbs)\b')
+_BULLET = re.compile(r'^\s*(?:[-*•]+|\d+[.)])\s*')
+
+def parse_quantity(text):
+    """
+    Parse a quantity such as "2", "1.5", "1/2", "1 1/2", "½" or a range like "2-3".
+
+    Args:
+        text (str): The quantity text.
+
+    Returns:
+        float: The quantity, the middle of a range.
+    """
+    parts = re.split(r'\s*(?:-|–|to)\s*', text.strip())
+    values = [_parse_number(part) for part in parts if part]
+    return sum(values) / len(values)
+
+def _parse_number(text):
+    total = 0.0
+    for token in text.split():
+        for symbol, value in _FRACTIONS.items():
+            if symbol in token:
+                total += value
+                token = token.replace(symbol, '')
+        if not token:
+            continue
+        if '/' in token:
+            numerator, denominator = token.split('/')
+            total += float(numerator) / float(denominator)
+        else:
+            total += float(token)
+    return total
+
+def parse_ingredient_line(line):
+    """
+    Split a generated ingredient line into quantity, unit and food name.
+
+    Args:
+        line (str): The line, e.g. "- 200g chicken breast, diced".
+
+    Returns:
+        tuple: A (quantity, unit, name, grams_hint) tuple. quantity is None if the
+            line has none (e.g. "Salt to taste"), unit is None for counted items,
+            and grams_hint is a weight in parentheses, e.g. "(about 400g)", or None.
+    """
+    line = _BULLET.sub('', line).replace('*', '').strip()
+    line = line.replace('/ ', '/').replace(' /', '/')
+
+    grams_hint = None
+    hint = _PARENTHETICAL_MASS.search(line)
+    if hint:
+        grams_hint = parse_quantity(hint.group('quantity')) * MASS_UNITS[hint.group('unit').lower()]
+
+    # Parentheticals and the preparation after a comma do not name the food
+    line = re.sub(r'\([^)]*\)', '', line).split(',')[0].strip()
+
+    match = _LEADING.match(line) or _TRAILING.match(line)
+    if not match:
+        return None, None, line.lower(), grams_hint
+
+    quantity = parse_quantity(match.group('quantity'))
+    unit = match.group('unit')
+    name = match.group('name').lower()
+
+    if unit:
+        unit = unit.lower().rstrip('.')
+        if unit not in MASS_UNITS and unit not in VOLUME_UNITS and unit not in COUNT_UNITS:
+            # Not a unit but the first word of the name, e.g. "2 eggs" or "1 large onion"
+            name = f"{unit} {name}" if _LEADING.match(line) else name
+            unit = None
+
+    return quantity, unit, name.strip(), grams_hint
+
+class NutritionTable:
+    """
+    A local nutrient table that computes recipe nutrition from ingredient lines.
+
+    The nutrients of all foods are one float32 array with a row per food and a
+    column per nutrient, so the totals of a recipe are a single matrix product
+    of its ingredient weights with the rows of its foods. Ingredient names are
+    resolved through an index of food names and aliases, then by dropping
+    preparation words and plurals, and finally by fuzzy matching. Resolved
+    names and lines are memoized, so repeated ingredients cost a dictionary lookup.
+    """
+
+    NUTRIENTS = ('calories', 'protein', 'carbs', 'fat')
+
+    # Maximum number of memoized ingredient names, and of memoized ingredient lines
+    MAX_LOOKUP_CACHE = 10000
+
+    def __init__(self, names, values, piece_grams, densities, aliases=None):
+        """
+        Initialize the NutritionTable.
+
+        Args:
+            names (list): Food names.
+            values (array-like): Nutrients per 100 g, one row per food in NUTRIENTS order.
+            piece_grams (array-like): Weight of one piece of each food in grams, NaN if unknown.
+            densities (array-like): Density of each food in g/ml, NaN if unknown.
+            aliases (dict, optional): Other names, mapped to food names.
+        """
+        self.names = list(names)
+        self.values = np.asarray(values, dtype=np.float32).reshape(len(self.names), len(self.NUTRIENTS))
+        self.piece_grams = np.nan_to_num(np.asarray(piece_grams, dtype=np.float32), nan=DEFAULT_PIECE_GRAMS)
+        self.densities = np.nan_to_num(np.asarray(densities, dtype=np.float32), nan=DEFAULT_DENSITY)
+
+        self._index = {name: i for i, name in enumerate(self.names)}
+        for alias, name in (aliases or {}).items():
+            self._index.setdefault(alias, self._index[name])
+        self._keys = list(self._index)
+
+        self._lookup_cache = {}
+        self._line_cache = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path=DEFAULT_TABLE_PATH):
+        """
+        Load a table from a CSV file.
+
+        The columns are name, aliases (separated by ";"), calories, protein,
+        carbs and fat per 100 g, piece_grams and density (g/ml), which may be empty.
+
+        Args:
+            path (str, optional): Path to the CSV file. Defaults to the bundled table.
+
+        Returns:
+            NutritionTable: The table.
+        """
+        names, values, piece_grams, densities, aliases = [], [], [], [], {}
+        with open(path, 'r', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                name = row['name'].strip().lower()
+                names.append(name)
+                values.append([float(row[nutrient]) for nutrient in cls.NUTRIENTS])
+                piece_grams.append(float(row['piece_grams']) if row['piece_grams'] else np.nan)
+                densities.append(float(row['density']) if row['density'] else np.nan)
+                for alias in filter(None, (alias.strip().lower() for alias in row['aliases'].split(';'))):
+                    aliases[alias] = name
+
+        return cls(names, values, piece_grams, densities, aliases)
+
+    def lookup(self, name):
+        """
+        Find the food matching an ingredient name.
+
+        Args:
+            name (str): The ingredient name, e.g. "boneless chicken breasts".
+
+        Returns:
+            int: The row of the food, or -1 if no food matches.
+        """
+        name = name.strip().lower()
+        index = self._lookup_cache.get(name)
+        if index is None:
+            index = self._resolve(name)
+            with self._lock:
+                if len(self._lookup_cache) >= self.MAX_LOOKUP_CACHE:
+                    self._lookup_cache.clear()
+                self._lookup_cache[name] = index
+        return index
+
+    def _resolve(self, name):
+        index = self._index
+        if name in index:
+            return index[name]
+
+        words = [word for word in re.findall(r"[a-z][a-z'-]*", name) if word not in DESCRIPTORS]
+        candidates = []
+        # Longest word sequences first, so "chicken breast" wins over "chicken"
+        for size in range(len(words), 0, -1):
+            for start in range(len(words) - size + 1):
+                candidates.append(" ".join(words[start:start + size]))
+
+        for candidate in candidates:
+            for form in (candidate, _singular(candidate)):
+                if form in index:
+                    return index[form]
+
+        if candidates:
+            match = difflib.get_close_matches(candidates[0], self._keys, n=1, cutoff=0.85)
+            if match:
+                return index[match[0]]
+
+        return -1
+
+    def ingredient_grams(self, line):
+        """
+        Resolve an ingredient line to a food and a weight.
+
+        Args:
+            line (str): The ingredient line.
+
+        Returns:
+            tuple: A (row, grams, name) tuple, where row is -1 for unknown foods and
+                grams is 0 when the line has no quantity.
+        """
+        result = self._line_cache.get(line)
+        if result is None:
+            result = self._resolve_line(line)
+            with self._lock:
+                if len(self._line_cache) >= self.MAX_LOOKUP_CACHE:
+                    self._line_cache.clear()
+                self._line_cache[line] = result
+        return result
+
+    def _resolve_line(self, line):
+        quantity, unit, name, grams_hint = parse_ingredient_line(line)
+        row = self.lookup(name)
+
+        if grams_hint is not None and unit not in MASS_UNITS:
+            return row, grams_hint, name
+        if quantity is None:
+            return row, 0.0, name
+
+        if unit in MASS_UNITS:
+            return row, quantity * MASS_UNITS[unit], name
+        if unit in VOLUME_UNITS:
+            density = self.densities[row] if row >= 0 else DEFAULT_DENSITY
+            return row, quantity * VOLUME_UNITS[unit] * float(density), name
+
+        # Counted pieces, e.g. "2 eggs" or "1 large onion"
+        piece = float(self.piece_grams[row]) if row >= 0 else DEFAULT_PIECE_GRAMS
+        size = next((factor for word, factor in SIZE_FACTORS.items() if word in name.split()), 1.0)
+        return row, quantity * piece * size, name
+
+    def analyze(self, ingredient_lines, servings=1):
+        """
+        Compute the nutrition of a recipe.
+
+        Args:
+            ingredient_lines (list): The ingredient lines of the recipe.
+            servings (int, optional): Number of servings the totals are divided by. Defaults to 1.
+
+        Returns:
+            dict: calories, protein, carbs and fat per serving, rounded to one decimal,
+                the servings, and the names of the ingredients with a quantity that
+                matched no food as 'unmatched'.
+        """
+        rows, grams, unmatched = [], [], []
+        for line in ingredient_lines:
+            row, weight, name = self.ingredient_grams(line)
+            if row >= 0 and weight > 0:
+                rows.append(row)
+                grams.append(weight)
+            elif row < 0 and weight > 0:
+                unmatched.append(name)
+
+        totals = np.asarray(grams, dtype=np.float32) @ self.values[rows] / (100.0 * max(1, servings))
+
+        facts = {nutrient: round(float(value), 1) for nutrient, value in zip(self.NUTRIENTS, totals)}
+        facts['servings'] = max(1, servings)
+        facts['unmatched'] = unmatched
+        return facts
+
+    def analyze_batch(self, recipes, servings=None):
+        """
+        Compute the nutrition of many recipes at once.
+
+        The lines of all recipes are resolved first, then the nutrients of every
+        line are weighted and summed per recipe in a few array operations.
+
+        Args:
+            recipes (list): A list of recipes, each a list of ingredient lines.
+            servings (array-like, optional): Servings per recipe. Defaults to 1 for every recipe.
+
+        Returns:
+            numpy.ndarray: An array with a row per recipe and a column per nutrient, per serving.
+        """
+        recipe_ids, rows, grams = [], [], []
+        for recipe_id, lines in enumerate(recipes):
+            for line in lines:
+                row, weight, _ = self.ingredient_grams(line)
+                if row >= 0 and weight > 0:
+                    recipe_ids.append(recipe_id)
+                    rows.append(row)
+                    grams.append(weight)
+
+        count = len(recipes)
+        contributions = self.values[rows] * (np.asarray(grams, dtype=np.float32) / 100.0)[:, None]
+
+        totals = np.empty((count, len(self.NUTRIENTS)), dtype=np.float64)
+        for column in range(len(self.NUTRIENTS)):
+            totals[:, column] = np.bincount(recipe_ids, weights=contributions[:, column], minlength=count)
+
+        if servings is not None:
+            totals /= np.maximum(1, np.asarray(servings, dtype=np.float64))[:, None]
+        return totals
+
+def _singular(name):
+    if name.endswith('ies'):
+        return name[:-3] + 'y'
+    if name.endswith(('oes', 'ches', 'shes')):
+        return name[:-2]
+    if name.endswith('s') and not name.endswith('ss'):
+        return name[:-1]
+    return name
+
+_default_table = None
+_default_table_lock = threading.Lock()
+
+def get_nutrition_table():
+    """
+    Get the process-wide table loaded from the bundled CSV file, loading it on first use.
+
+    Returns:
+        NutritionTable: The shared table.
+    """
+    global _default_table
+    with _default_table_lock:
+        if _default_table is None:
+            _default_table = NutritionTable.load()
+        return _default_table
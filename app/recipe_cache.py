@@ -0,0 +1,296 @@
+import os
+import json
+import time
+import atexit
+import logging
+import threading
+from collections import OrderedDict
+
+try:
+    import fcntl
+except ImportError:
+    # Windows, where the server runs in a single process
+    fcntl = None
+
+class RecipeCache:
+    """
+    An LRU cache with expiry for generated recipe texts.
+
+    Entries are keyed by a canonical form of the request, so requests that only
+    differ in ingredient order, case or duplicates share the same entry.
+
+    A persisted cache is written by a background thread, at most once per save
+    delay, so request threads never wait for the file. The processes sharing
+    the file merge their entries into it, so a worker does not overwrite the
+    recipes of the others.
+    """
+
+    def __init__(self, max_entries=256, ttl=24 * 60 * 60, persist_path=None, save_delay=1.0):
+        """
+        Initialize the RecipeCache.
+
+        Args:
+            max_entries (int, optional): Maximum number of cached recipes. Defaults to 256.
+            ttl (float, optional): Time to live of an entry in seconds. None disables expiry. Defaults to one day.
+            persist_path (str, optional): JSON file used to persist the cache across restarts.
+                If None, the cache only lives in memory.
+            save_delay (float, optional): Seconds a change waits before the file is written, so that the
+                changes arriving meanwhile are written at once. Defaults to 1.0.
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.persist_path = persist_path
+        self.save_delay = save_delay
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # Entries in the file created before the last clear are not merged back
+        self._cleared_at = None
+        # Modification time of the file when it was last read
+        self._file_mtime = None
+
+        # Set when the file is behind the entries, the saver thread is started on the first change
+        self._dirty = threading.Event()
+        self._save_lock = threading.Lock()
+        self._saver = None
+
+        if self.persist_path:
+            self._load()
+
+    @staticmethod
+    def make_key(ingredients, dietary_preference=None, goal=None, profile="full"):
+        """
+        Build the canonical cache key for a recipe request.
+
+        Args:
+            ingredients (list): List of ingredients available.
+            dietary_preference (str, optional): Dietary preference.
+            goal (str, optional): Nutritional goal.
+            profile (str, optional): Generation profile. Defaults to "full".
+
+        Returns:
+            str: The canonical key.
+        """
+        normalized = sorted({item.strip().lower() for item in ingredients if item and item.strip()})
+        parts = [
+            normalized,
+            (dietary_preference or "").strip().lower(),
+            (goal or "").strip().lower(),
+        ]
+
+        # Full recipes keep the keys they were persisted under before profiles existed
+        if profile != "full":
+            parts.append(profile)
+
+        return json.dumps(parts, ensure_ascii=False)
+
+    def get(self, key):
+        """
+        Look up a cached recipe text.
+
+        Args:
+            key (str): The cache key.
+
+        Returns:
+            str: The cached recipe text, or None if missing or expired.
+        """
+        with self._lock:
+            content = self._lookup(key)
+
+        # Another process, e.g. the warm-up, may have written the recipe to the file meanwhile
+        if content is None and self._refresh():
+            with self._lock:
+                content = self._lookup(key)
+        return content
+
+    def put(self, key, content):
+        """
+        Store a recipe text in the cache.
+
+        Args:
+            key (str): The cache key.
+            content (str): The raw recipe text returned by the LLM.
+        """
+        with self._lock:
+            self._entries[key] = {"content": content, "created": time.time()}
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+            self._schedule_save()
+
+    def clear(self):
+        """
+        Remove all entries from the cache.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._cleared_at = time.time()
+
+            self._schedule_save()
+
+    def flush(self):
+        """
+        Write the pending changes to disk now, e.g. before the process exits.
+        """
+        with self._save_lock:
+            if not self._dirty.is_set():
+                return
+            # Cleared before the copy, so a change made meanwhile is saved again
+            self._dirty.clear()
+            with self._lock:
+                entries = list(self._entries.items())
+                cleared_at = self._cleared_at
+            try:
+                self._save(entries, cleared_at)
+            except OSError as e:
+                logging.getLogger("RecipeCache").error(f"Failed to write {self.persist_path}: {str(e)}")
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _lookup(self, key):
+        """
+        Look up an entry in memory. Called with the lock held.
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        if self._is_expired(entry):
+            del self._entries[key]
+            return None
+
+        self._entries.move_to_end(key)
+        return entry["content"]
+
+    def _is_expired(self, entry):
+        return self.ttl is not None and time.time() - entry["created"] > self.ttl
+
+    def _load(self):
+        """
+        Load persisted entries, dropping the ones that already expired.
+        """
+        self._file_mtime = self._file_version()
+        self._entries.update(self._read())
+
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _refresh(self):
+        """
+        Adopt the entries other processes wrote to the file since it was last read.
+
+        They count as the least recently used entries, so they only fill the room that is left.
+
+        Returns:
+            bool: True if the file changed.
+        """
+        if not self.persist_path:
+            return False
+
+        version = self._file_version()
+        if version is None or version == self._file_mtime:
+            return False
+        self._file_mtime = version
+
+        entries = self._read()
+        with self._lock:
+            for key, entry in reversed(entries):
+                if self._cleared_at is not None and entry["created"] <= self._cleared_at:
+                    continue
+                current = self._entries.get(key)
+                if current is None:
+                    self._entries[key] = entry
+                    self._entries.move_to_end(key, last=False)
+                elif current["created"] < entry["created"]:
+                    self._entries[key] = entry
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return True
+
+    def _file_version(self):
+        try:
+            return os.stat(self.persist_path).st_mtime_ns
+        except OSError:
+            return None
+
+    def _read(self):
+        """
+        Read the persisted entries that have not expired.
+
+        Returns:
+            list: The (key, entry) pairs, from least to most recently used, or an empty list
+                if the file is missing or corrupted.
+        """
+        if not os.path.exists(self.persist_path):
+            return []
+
+        try:
+            with open(self.persist_path, 'r', encoding='utf-8') as f:
+                entries = json.load(f)
+        except (json.JSONDecodeError, OSError):
+            # If the file is corrupted, start with an empty cache
+            return []
+
+        return [(key, entry) for key, entry in entries if not self._is_expired(entry)]
+
+    def _schedule_save(self):
+        """
+        Mark the file as behind the entries for the saver thread. Called with the lock held.
+        """
+        if not self.persist_path:
+            return
+
+        self._dirty.set()
+        if self._saver is None:
+            self._saver = threading.Thread(target=self._run_saver, name="RecipeCacheSaver", daemon=True)
+            self._saver.start()
+            # Write the last changes on interpreter shutdown
+            atexit.register(self.flush)
+
+    def _run_saver(self):
+        """
+        Write the cache whenever it changed, once the save delay has passed.
+        """
+        while True:
+            self._dirty.wait()
+            time.sleep(self.save_delay)
+            self.flush()
+
+    def _save(self, entries, cleared_at=None):
+        """
+        Merge the cache into the file on disk and write it atomically so a crash never leaves a truncated file.
+
+        The entries other processes wrote to the file are kept, with the newer entry winning for a key
+        both have, and the entries of this process counting as the most recently used.
+
+        Args:
+            entries (list): The (key, entry) pairs, from least to most recently used.
+            cleared_at (float, optional): Time of the last clear, whose older entries in the file are dropped.
+        """
+        directory = os.path.dirname(self.persist_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        # Worker processes sharing the file take turns, so none of them misses what another one just wrote
+        with open(f"{self.persist_path}.lock", 'w') as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+
+            merged = OrderedDict((key, entry) for key, entry in self._read()
+                                 if cleared_at is None or entry["created"] > cleared_at)
+            for key, entry in entries:
+                current = merged.pop(key, None)
+                merged[key] = current if current is not None and current["created"] > entry["created"] else entry
+
+            while len(merged) > self.max_entries:
+                merged.popitem(last=False)
+
+            # Worker processes sharing the file each write their own temporary file
+            temp_path = f"{self.persist_path}.{os.getpid()}.tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(list(merged.items()), f, ensure_ascii=False)
+            os.replace(temp_path, self.persist_path)
@@ -1,29 +1,67 @@
 import os
-import dashscope
-from dashscope import Generation
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from app import metrics
 from app.llm_logger import LLMLogger
+from app.backends import DashScopeBackend, get_backend
+from app.governor import UpstreamThrottled, get_governor
+from app.recipe_cache import RecipeCache
+from app.single_flight import SingleFlight
+from app.recipe_parser import IncrementalRecipeParser
+from app.nutrition import get_nutrition_table
 
 class RecipeGenerator:
     """
     A class to generate recipes using the dashscope LLM API.
     """
 
-    def __init__(self, api_key=None, log_dir="logs"):
+    # Size of the chunks used when replaying a cached recipe as a stream
+    REPLAY_CHUNK_SIZE = 64
+
+    # Generation profiles and their maximum number of output tokens. Shorter
+    # profiles trade detail for a faster response, e.g. for mobile and voice clients.
+    PROFILES = {
+        "full": 1500,
+        "concise": 600,
+        "compact": 300,
+    }
+
+    def __init__(self, api_key=None, log_dir="logs", cache=None, backend=None, governor=None, nutrition_table=None,
+                 similarity_index=None):
         """
         Initialize the RecipeGenerator with an API key.
 
         Args:
             api_key (str, optional): The API key for dashscope. If None, it will use the environment variable.
             log_dir (str, optional): Directory to store logs. Defaults to "logs".
+            cache (RecipeCache, optional): Cache for generated recipes. If None, every request calls the LLM.
+            backend (optional): Upstream backend, e.g. a FakeBackend. If None, the backend selected by
+                RECIPE_GEN_BACKEND is used, which defaults to DashScope.
+            governor (UpstreamGovernor, optional): Paces the LLM calls. Defaults to the shared "generation" governor.
+            nutrition_table (NutritionTable, optional): Computes the nutrition facts of the ingredients.
+                Defaults to the bundled food table.
+            similarity_index (SimilarityIndex, optional): Index of generated recipes, serving requests
+                similar enough to a previous one. If None, only identical requests are served from the cache.
         """
+        self.backend = backend or get_backend()
+        self.governor = governor or get_governor("generation")
+
+        # A local backend does not need a key
         self.api_key = api_key or os.getenv("DASHSCOPE_API_KEY")
-        if not self.api_key:
+        if not self.api_key and isinstance(self.backend, DashScopeBackend):
             raise ValueError("API key is required. Set it as an argument or as DASHSCOPE_API_KEY environment variable.")
 
         # Initialize logger
         self.logger = LLMLogger(log_dir=log_dir)
 
-    def generate_recipe(self, ingredients, dietary_preference=None, goal=None, stream=False):
+        self.cache = cache
+        self.nutrition_table = nutrition_table or get_nutrition_table()
+        self.similarity_index = similarity_index
+
+        # Identical requests in flight at the same time share one LLM call
+        self._flights = SingleFlight()
+
+    def generate_recipe(self, ingredients, dietary_preference=None, goal=None, stream=False, profile="full"):
         """
         Generate a recipe based on the given ingredients and preferences.
 
@@ -32,12 +70,44 @@ class RecipeGenerator:
             dietary_preference (str, optional): Dietary preference (e.g., "low-carb", "vegan").
             goal (str, optional): Nutritional goal (e.g., "muscle gain", "weight loss").
             stream (bool, optional): Whether to stream the response.
+            profile (str, optional): Generation profile: "full" for the detailed recipe, "concise"
+                for a short one, or "compact" for a terse structured format. Defaults to "full".
 
         Returns:
-            dict: A dictionary containing the recipe and nutritional information.
+            dict: A dictionary containing the recipe and nutritional information. A recipe served
+                for a similar previous request has a 'match' with its 'type' "near", the
+                'similarity' and the 'ingredients' of that request.
         """
+        if profile not in self.PROFILES:
+            raise ValueError(f"Unknown generation profile: {profile}")
+
+        request_key = RecipeCache.make_key(ingredients, dietary_preference, goal, profile)
+
+        # Serve identical requests from the cache
+        cache_key = None
+        if self.cache is not None:
+            cache_key = request_key
+            content = self.cache.get(cache_key)
+            if content is not None:
+                if stream:
+                    return self._replay_stream(content)
+                return self._parse_recipe_response(content)
+
+        # Serve requests that differ only slightly from a previous one
+        if self.similarity_index is not None:
+            match = self.similarity_index.lookup(ingredients, dietary_preference, goal, profile)
+            metrics.SIMILARITY_LOOKUPS.inc("hit" if match else "miss")
+            if match is not None:
+                content, similarity, matched_ingredients = match
+                info = {'type': 'near', 'similarity': round(similarity, 3), 'ingredients': matched_ingredients}
+                if stream:
+                    return self._replay_stream(content, match=info)
+                recipe = self._parse_recipe_response(content)
+                recipe['match'] = info
+                return recipe
+
         # Construct the prompt
-        prompt = self._construct_prompt(ingredients, dietary_preference, goal)
+        prompt = self._construct_prompt(ingredients, dietary_preference, goal, profile)
 
         # Set up the messages for the LLM
         messages = [
@@ -45,13 +115,70 @@ class RecipeGenerator:
             {"role": "user", "content": prompt}
         ]
 
-        # Call the LLM API
+        # Call the LLM API, joining an identical request that is already in flight
+        max_tokens = self.PROFILES[profile]
+        request = (ingredients, dietary_preference, goal, profile)
         if stream:
-            return self._stream_generate(messages)
+            return self._flights.stream(("stream", request_key), self._stream_generate, messages,
+                                        cache_key=cache_key, max_tokens=max_tokens, request=request)
         else:
-            return self._generate(messages)
+            return self._flights.do(("generate", request_key), self._generate, messages,
+                                    cache_key=cache_key, max_tokens=max_tokens, request=request)
+
+    def generate_batch(self, items, max_concurrency=4, profile="full"):
+        """
+        Generate many recipes concurrently.
+
+        Args:
+            items (list): List of dicts with "ingredients" and optional "dietary_preference", "goal" and "profile".
+            max_concurrency (int, optional): Maximum number of recipes generated at the same time. Defaults to 4.
+            profile (str, optional): Generation profile of the items that do not name one. Defaults to "full".
+
+        Returns:
+            generator: A generator yielding (index, recipe, error) tuples in completion order, where
+                index is the position of the item in the input and error is None on success.
+                A failed item does not stop the others.
+        """
+        if not items:
+            return
+
+        executor = ThreadPoolExecutor(max_workers=max(1, min(max_concurrency, len(items))))
+        try:
+            futures = {}
+            for index, item in enumerate(items):
+                futures[executor.submit(self._generate_batch_item, item, profile)] = index
+
+            for future in as_completed(futures):
+                try:
+                    yield futures[future], future.result(), None
+                except Exception as e:
+                    yield futures[future], None, e
+        finally:
+            # Drop the items nobody is waiting for anymore
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _generate_batch_item(self, item, profile="full"):
+        """
+        Generate the recipe of a single batch item.
 
-    def _construct_prompt(self, ingredients, dietary_preference, goal):
+        Args:
+            item (dict): The item with "ingredients" and optional "dietary_preference", "goal" and "profile".
+            profile (str, optional): Generation profile if the item does not name one. Defaults to "full".
+
+        Returns:
+            dict: The recipe.
+        """
+        if not isinstance(item, dict) or not item.get('ingredients'):
+            raise ValueError("No ingredients provided")
+
+        return self.generate_recipe(
+            ingredients=item['ingredients'],
+            dietary_preference=item.get('dietary_preference'),
+            goal=item.get('goal'),
+            profile=item.get('profile') or profile
+        )
+
+    def _construct_prompt(self, ingredients, dietary_preference, goal, profile="full"):
         """
         Construct a prompt for the LLM based on the inputs.
 
@@ -59,6 +186,7 @@ class RecipeGenerator:
             ingredients (list): List of ingredients available.
             dietary_preference (str, optional): Dietary preference.
             goal (str, optional): Nutritional goal.
+            profile (str, optional): Generation profile. Defaults to "full".
 
         Returns:
             str: The constructed prompt.
@@ -72,6 +200,24 @@ class RecipeGenerator:
         if goal:
             prompt += f" The recipe should support {goal}."
 
+        if profile == "compact":
+            # A fixed layout of short lines, which _parse_recipe_response reads like the full format
+            prompt += " Reply in exactly this format, with no other text:\n"
+            prompt += "# <recipe name>\n"
+            prompt += "## Ingredients\n"
+            prompt += "- <quantity> <ingredient>\n"
+            prompt += "## Instructions\n"
+            prompt += "1. <one short sentence>\n"
+            prompt += "## Nutritional Information\n"
+            prompt += "- Calories: <number> kcal\n"
+            prompt += "- Protein: <number>g\n"
+            prompt += "- Carbs: <number>g\n"
+            prompt += "- Fat: <number>g\n"
+            prompt += "## Suggestions\n"
+            prompt += "- <one short suggestion>\n"
+            prompt += "Use at most 5 instructions and 1 suggestion. No introduction or closing remarks.\n"
+            return prompt
+
         prompt += " Please provide the following information:\n"
         prompt += "1. Recipe name\n"
         prompt += "2. Ingredients with quantities\n"
@@ -79,14 +225,21 @@ class RecipeGenerator:
         prompt += "4. Nutritional information (calories, protein, carbs, fat)\n"
         prompt += "5. Suggestions for modifications to better meet dietary preferences or goals\n"
 
+        if profile == "concise":
+            prompt += "Keep it brief: at most 6 short steps, one line per nutrition value and at most 2 suggestions. No introduction or closing remarks.\n"
+
         return prompt
 
-    def _generate(self, messages):
+    def _generate(self, messages, cache_key=None, max_tokens=None, request=None):
         """
         Generate a response from the LLM.
 
         Args:
             messages (list): The messages to send to the LLM.
+            cache_key (str, optional): Key under which the response is cached.
+            max_tokens (int, optional): Maximum number of output tokens. Defaults to the budget of the full profile.
+            request (tuple, optional): The (ingredients, dietary_preference, goal, profile) of the request,
+                under which the response is added to the similarity index.
 
         Returns:
             dict: The parsed response.
@@ -94,14 +247,19 @@ class RecipeGenerator:
         # Log the input
         self.logger.log_text_generation(input_data=messages, output_data=None, model="qwen-turbo")
 
-        response = Generation.call(
+        start = time.perf_counter()
+        response = self.governor.call(
+            self.backend.generation_call,
             api_key=self.api_key,
             model="qwen-turbo",
             messages=messages,
             result_format="message",
+            max_tokens=max_tokens or self.PROFILES["full"],
         )
+        metrics.LLM_DURATION_SECONDS.observe(time.perf_counter() - start, "full")
 
         if response.status_code == 200:
+            metrics.record_usage(getattr(response, 'usage', None), "qwen-turbo")
             content = response.output.choices[0].message.content
 
             # Log the output
@@ -111,6 +269,8 @@ class RecipeGenerator:
                 model="qwen-turbo"
             )
 
+            self._store(content, cache_key, request)
+
             return self._parse_recipe_response(content)
         else:
             # Log the error
@@ -120,14 +280,19 @@ class RecipeGenerator:
                 model="qwen-turbo"
             )
 
-            raise Exception(f"Error: {response.code} - {response.message}")
+            metrics.UPSTREAM_ERRORS.inc("generation", str(response.code))
+            self._raise_error(response)
 
-    def _stream_generate(self, messages):
+    def _stream_generate(self, messages, cache_key=None, max_tokens=None, request=None):
         """
         Generate a streaming response from the LLM.
 
         Args:
             messages (list): The messages to send to the LLM.
+            cache_key (str, optional): Key under which the complete response is cached.
+            max_tokens (int, optional): Maximum number of output tokens. Defaults to the budget of the full profile.
+            request (tuple, optional): The (ingredients, dietary_preference, goal, profile) of the request,
+                under which the complete response is added to the similarity index.
 
         Returns:
             generator: A generator yielding response chunks.
@@ -135,20 +300,56 @@ class RecipeGenerator:
         # Log the input
         self.logger.log_text_generation(input_data=messages, output_data=None, model="qwen-turbo")
 
-        responses = Generation.call(
+        start = time.perf_counter()
+        budget = max_tokens or self.PROFILES["full"]
+        responses = self.governor.stream(
+            self.backend.generation_call,
             api_key=self.api_key,
             model="qwen-turbo",
             messages=messages,
             result_format="message",
             stream=True,
             incremental_output=True,
+            max_tokens=budget,
         )
 
         full_content = ""
-        for response in responses:
-            chunk = response.output.choices[0].message.content
-            full_content += chunk
-            yield chunk
+        chunk_count = 0
+        usage = None
+        try:
+            for response in responses:
+                if response.status_code != 200:
+                    # Log the error
+                    self.logger.log_text_generation(
+                        input_data=messages,
+                        output_data={"error": f"{response.code} - {response.message}"},
+                        model="qwen-turbo"
+                    )
+
+                    metrics.UPSTREAM_ERRORS.inc("generation", str(response.code))
+                    self._raise_error(response)
+
+                if chunk_count == 0:
+                    metrics.LLM_FIRST_CHUNK_SECONDS.observe(time.perf_counter() - start)
+                chunk_count += 1
+
+                # The usage of a streamed response is cumulative, the last one counts
+                usage = getattr(response, 'usage', None) or usage
+
+                chunk = response.output.choices[0].message.content
+                full_content += chunk
+                yield chunk
+        except GeneratorExit:
+            # Every consumer went away, the rest of the response is never generated
+            self._log_cancelled(messages, chunk_count, usage, budget)
+            raise
+        finally:
+            # Give the governor slot back even if the consumer stops early
+            responses.close()
+
+        metrics.LLM_DURATION_SECONDS.observe(time.perf_counter() - start, "stream")
+        metrics.LLM_STREAM_CHUNKS.observe(chunk_count)
+        metrics.record_usage(usage, "qwen-turbo")
 
         # Log the complete output after streaming is done
         self.logger.log_text_generation(
@@ -157,8 +358,81 @@ class RecipeGenerator:
             model="qwen-turbo"
         )
 
+        self._store(full_content, cache_key, request)
+
         return self._parse_recipe_response(full_content)
 
+    def _log_cancelled(self, messages, chunk_count, usage, budget):
+        """
+        Log a streamed generation that was stopped early, with the output tokens it did not spend.
+
+        Args:
+            messages (list): The messages sent to the LLM.
+            chunk_count (int): Number of chunks received before the cancellation.
+            usage: The cumulative usage of the last chunk, or None.
+            budget (int): The maximum number of output tokens of the call.
+        """
+        generated = (usage.get('output_tokens') if usage else None) or 0
+        metrics.UPSTREAM_CANCELLED.inc("generation")
+        metrics.record_usage(usage, "qwen-turbo")
+        metrics.LLM_CANCELLED_TOKENS.inc("generated", amount=generated)
+        metrics.LLM_CANCELLED_TOKENS.inc("budget_left", amount=max(0, budget - generated))
+
+        self.logger.log_text_generation(
+            input_data=messages,
+            output_data={"cancelled": True, "chunks": chunk_count, "output_tokens": generated, "max_tokens": budget},
+            model="qwen-turbo"
+        )
+        self.logger.logger.info(f"Text Generation cancelled - Chunks: {chunk_count}, "
+                                f"Output tokens: {generated} of at most {budget}")
+
+    def _raise_error(self, response):
+        """
+        Raise the error of a failed API response.
+
+        Args:
+            response: The API response.
+        """
+        message = f"Error: {response.code} - {response.message}"
+        if self.governor.is_throttled(response):
+            raise UpstreamThrottled(message, retry_after=self.governor.retry_after())
+        raise Exception(message)
+
+    def _store(self, content, cache_key=None, request=None):
+        """
+        Keep a generated response for later requests.
+
+        Args:
+            content (str): The response text.
+            cache_key (str, optional): Key under which the response is cached.
+            request (tuple, optional): The (ingredients, dietary_preference, goal, profile) of the request.
+        """
+        if cache_key is not None:
+            self.cache.put(cache_key, content)
+
+        if self.similarity_index is not None and request is not None:
+            ingredients, dietary_preference, goal, profile = request
+            self.similarity_index.add(ingredients, content, dietary_preference, goal, profile)
+
+    def _replay_stream(self, content, match=None):
+        """
+        Replay a cached response in the same chunked form as a live stream.
+
+        Args:
+            content (str): The cached response text.
+            match (dict, optional): The match metadata of a recipe served for a similar request.
+
+        Returns:
+            generator: A generator yielding response chunks.
+        """
+        for start in range(0, len(content), self.REPLAY_CHUNK_SIZE):
+            yield content[start:start + self.REPLAY_CHUNK_SIZE]
+
+        recipe = self._parse_recipe_response(content)
+        if match is not None:
+            recipe['match'] = match
+        return recipe
+
     def _parse_recipe_response(self, content):
         """
         Parse the LLM response into a structured recipe format.
@@ -169,56 +443,13 @@ class RecipeGenerator:
         Returns:
             dict: A structured recipe dictionary.
         """
-        # This is a simple parsing implementation
-        # In a real application, you might want to use more sophisticated parsing
-        lines = content.strip().split('\n')
-
-        recipe = {
-            'name': '',
-            'ingredients': [],
-            'instructions': [],
-            'nutrition': {},
-            'suggestions': []
-        }
-
-        current_section = None
-
-        for line in lines:
-            line = line.strip()
-            if not line:
-                continue
-
-            # Try to identify sections
-            if "Recipe name" in line or line.startswith("# "):
-                recipe['name'] = line.replace("Recipe name:", "").replace("# ", "").strip()
-                current_section = 'name'
-            elif "Ingredients" in line or line.startswith("## Ingredients"):
-                current_section = 'ingredients'
-            elif "Instructions" in line or "Steps" in line or line.startswith("## Instructions"):
-                current_section = 'instructions'
-            elif "Nutritional" in line or line.startswith("## Nutrition"):
-                current_section = 'nutrition'
-            elif "Suggestions" in line or "Modifications" in line or line.startswith("## Suggestions"):
-                current_section = 'suggestions'
-            else:
-                # Add content to the current section
-                if current_section == 'ingredients':
-                    recipe['ingredients'].append(line)
-                elif current_section == 'instructions':
-                    recipe['instructions'].append(line)
-                elif current_section == 'nutrition':
-                    # Try to parse nutrition information
-                    if "calories" in line.lower():
-                        recipe['nutrition']['calories'] = line
-                    elif "protein" in line.lower():
-                        recipe['nutrition']['protein'] = line
-                    elif "carbs" in line.lower() or "carbohydrates" in line.lower():
-                        recipe['nutrition']['carbs'] = line
-                    elif "fat" in line.lower():
-                        recipe['nutrition']['fat'] = line
-                    else:
-                        recipe['nutrition'][f'other_{len(recipe["nutrition"])}'] = line
-                elif current_section == 'suggestions':
-                    recipe['suggestions'].append(line)
+        # The same state machine parses streamed recipes incrementally
+        parser = IncrementalRecipeParser()
+        parser.feed(content)
+        parser.close()
+
+        # Numeric nutrition computed locally from the ingredient lines
+        recipe = parser.recipe
+        recipe['nutrition_facts'] = self.nutrition_table.analyze(recipe['ingredients'])
 
         return recipe
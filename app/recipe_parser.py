@@ -0,0 +1,122 @@
+class IncrementalRecipeParser:
+    """
+    A state machine that parses a recipe while it is being streamed.
+
+    Chunks are consumed as they arrive and a typed event is emitted as soon as
+    a line is complete. Only the unfinished line is buffered, so the cost of a
+    chunk does not grow with the length of the text received so far.
+
+    Events are dictionaries with a 'type' of 'name', 'ingredient', 'instruction',
+    'nutrition' (with a 'field') or 'suggestion', and the line as 'value'.
+    """
+
+    def __init__(self):
+        """
+        Initialize the IncrementalRecipeParser.
+        """
+        self.recipe = {
+            'name': '',
+            'ingredients': [],
+            'instructions': [],
+            'nutrition': {},
+            'suggestions': []
+        }
+
+        self._section = None
+        self._partial = []
+
+    def feed(self, chunk):
+        """
+        Consume a chunk of the streamed recipe.
+
+        Args:
+            chunk (str): The next chunk of text.
+
+        Returns:
+            list: The events of the lines completed by this chunk.
+        """
+        if '\n' not in chunk:
+            self._partial.append(chunk)
+            return []
+
+        lines = chunk.split('\n')
+        self._partial.append(lines[0])
+        first_line = ''.join(self._partial)
+        self._partial = [lines[-1]]
+
+        events = []
+        for line in [first_line] + lines[1:-1]:
+            event = self._parse_line(line)
+            if event is not None:
+                events.append(event)
+        return events
+
+    def close(self):
+        """
+        Parse the last line at the end of the stream.
+
+        Returns:
+            list: The event of the last line, if any.
+        """
+        line = ''.join(self._partial)
+        self._partial = []
+
+        event = self._parse_line(line)
+        return [event] if event is not None else []
+
+    def _parse_line(self, line):
+        """
+        Parse a complete line, updating the recipe and the current section.
+
+        Args:
+            line (str): The line to parse.
+
+        Returns:
+            dict: The event for the line, or None for blank lines and section headings.
+        """
+        line = line.strip()
+        if not line:
+            return None
+
+        recipe = self.recipe
+
+        # Try to identify sections
+        if "Recipe name" in line or line.startswith("# "):
+            recipe['name'] = line.replace("Recipe name:", "").replace("# ", "").strip()
+            self._section = 'name'
+            return {'type': 'name', 'value': recipe['name']}
+        elif "Ingredients" in line or line.startswith("## Ingredients"):
+            self._section = 'ingredients'
+        elif "Instructions" in line or "Steps" in line or line.startswith("## Instructions"):
+            self._section = 'instructions'
+        elif "Nutritional" in line or line.startswith("## Nutrition"):
+            self._section = 'nutrition'
+        elif "Suggestions" in line or "Modifications" in line or line.startswith("## Suggestions"):
+            self._section = 'suggestions'
+        else:
+            # Add content to the current section
+            if self._section == 'ingredients':
+                recipe['ingredients'].append(line)
+                return {'type': 'ingredient', 'value': line}
+            elif self._section == 'instructions':
+                recipe['instructions'].append(line)
+                return {'type': 'instruction', 'value': line}
+            elif self._section == 'nutrition':
+                # Try to parse nutrition information
+                if "calories" in line.lower():
+                    field = 'calories'
+                elif "protein" in line.lower():
+                    field = 'protein'
+                elif "carbs" in line.lower() or "carbohydrates" in line.lower():
+                    field = 'carbs'
+                elif "fat" in line.lower():
+                    field = 'fat'
+                else:
+                    field = f'other_{len(recipe["nutrition"])}'
+                recipe['nutrition'][field] = line
+                return {'type': 'nutrition', 'field': field, 'value': line}
+            elif self._section == 'suggestions':
+                recipe['suggestions'].append(line)
+                return {'type': 'suggestion', 'value': line}
+
+        return None
@@ -0,0 +1,130 @@
+import re
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from app.text_segmenter import SentenceAccumulator
+
+# Markdown markers that should not be read out loud
+MARKDOWN_MARKERS = re.compile(r'^\s*(#+|[-*+]|>)\s+|\*\*|__|`')
+
+class RecipeSpeaker:
+    """
+    A class that speaks a recipe while it is being generated.
+
+    Streamed recipe text is cut into sentences or lines as soon as they are
+    final, and each of them is sent to the TTS service while the LLM keeps
+    generating, so the first audio is ready long before the recipe is complete.
+    """
+
+    def __init__(self, recipe_generator, tts_service, min_sentence_length=40):
+        """
+        Initialize the RecipeSpeaker.
+
+        Args:
+            recipe_generator (RecipeGenerator): The service generating the recipe text.
+            tts_service (TTSService): The service converting the text to speech.
+            min_sentence_length (int, optional): Length of a partial line before it is cut at a sentence boundary. Defaults to 40.
+        """
+        self.recipe_generator = recipe_generator
+        self.tts_service = tts_service
+        self.min_sentence_length = min_sentence_length
+
+    def speak_recipe(self, ingredients, dietary_preference=None, goal=None, voice="Ethan", profile="full"):
+        """
+        Generate a recipe and convert it to speech at the same time.
+
+        Args:
+            ingredients (list): List of ingredients available.
+            dietary_preference (str, optional): Dietary preference (e.g., "low-carb", "vegan").
+            goal (str, optional): Nutritional goal (e.g., "muscle gain", "weight loss").
+            voice (str, optional): The voice to use. Defaults to "Ethan".
+            profile (str, optional): Generation profile, see RecipeGenerator.generate_recipe. Defaults to "full".
+
+        Returns:
+            generator: A generator yielding events in the order they should be sent:
+                {'text': chunk} for generated text,
+                {'audio': {'index': i, 'text': sentence, 'url': url}} for audio, in sentence order,
+                {'audio': {'index': i, 'text': sentence, 'error': message}} for a failed sentence.
+        """
+        accumulator = SentenceAccumulator(
+            min_length=self.min_sentence_length,
+            max_length=self.tts_service.MAX_TOKEN_LENGTH,
+        )
+        executor = ThreadPoolExecutor(max_workers=self.tts_service.max_concurrency)
+        pending = deque()
+        next_index = 0
+
+        try:
+            for chunk in self.recipe_generator.generate_recipe(
+                ingredients=ingredients,
+                dietary_preference=dietary_preference,
+                goal=goal,
+                stream=True,
+                profile=profile
+            ):
+                yield {'text': chunk}
+
+                next_index = self._submit(executor, pending, accumulator.feed(chunk), voice, next_index)
+
+                # Send the audio that is ready, without overtaking an earlier sentence
+                while pending and pending[0][2].done():
+                    yield self._audio_event(*pending.popleft())
+
+            self._submit(executor, pending, accumulator.close(), voice, next_index)
+
+            # Generation is complete, wait for the remaining audio in order
+            while pending:
+                yield self._audio_event(*pending.popleft())
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _submit(self, executor, pending, units, voice, next_index):
+        """
+        Start the speech synthesis of completed units.
+
+        Args:
+            executor (ThreadPoolExecutor): The executor running the syntheses.
+            pending (deque): Queue of (index, text, future) tuples, in sentence order.
+            units (list): The completed units of text.
+            voice (str): The voice to use.
+            next_index (int): Index of the next sentence.
+
+        Returns:
+            int: Index of the sentence after the submitted ones.
+        """
+        for unit in units:
+            speech = self._clean_for_speech(unit)
+            if speech:
+                pending.append((next_index, speech, executor.submit(self.tts_service._tts_single, speech, voice)))
+                next_index += 1
+        return next_index
+
+    @staticmethod
+    def _audio_event(index, speech, future):
+        """
+        Build the event for a finished synthesis.
+
+        Args:
+            index (int): Index of the sentence.
+            speech (str): The spoken text.
+            future (Future): The synthesis result.
+
+        Returns:
+            dict: The audio event.
+        """
+        try:
+            return {'audio': {'index': index, 'text': speech, 'url': future.result()}}
+        except Exception as e:
+            return {'audio': {'index': index, 'text': speech, 'error': str(e)}}
+
+    @staticmethod
+    def _clean_for_speech(text):
+        """
+        Remove Markdown formatting from a unit of text.
+
+        Args:
+            text (str): The text to clean.
+
+        Returns:
+            str: The text to speak.
+        """
+        return MARKDOWN_MARKERS.sub('', text).strip()
@@ -0,0 +1,467 @@
+import os
+import math
+import time
+import asyncio
+import threading
+import contextlib
+from collections import OrderedDict, deque
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from app import metrics
+
+class Overloaded(Exception):
+    """
+    Raised when a request is not admitted: 429 for a client over its share, 503 when the server is saturated.
+    """
+
+    def __init__(self, message, status=503, retry_after=1):
+        """
+        Initialize the error.
+
+        Args:
+            message (str): The error message.
+            status (int, optional): The HTTP status of the response, 429 or 503. Defaults to 503.
+            retry_after (int, optional): Suggested delay in seconds before the client retries. Defaults to 1.
+        """
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+# Classes of the expensive endpoints in priority order, with the defaults of their maximum number of
+# running requests, queue bound and queue-wait SLO in seconds
+ENDPOINT_CLASSES = {
+    # Streams a user is watching or listening to
+    "interactive": {"max_active": 0, "max_queue": 32, "slo": 2.0},
+    # Single responses, e.g. a recipe without streaming
+    "standard": {"max_active": 0, "max_queue": 32, "slo": 5.0},
+    # Batches and downloads, which may take long and must not crowd out the others
+    "bulk": {"max_active": 4, "max_queue": 8, "slo": 30.0},
+}
+
+# The class of every scheduled endpoint, the other endpoints are admitted right away
+SCHEDULED_ENDPOINTS = {
+    "stream_recipe": "interactive",
+    "speak_recipe": "interactive",
+    "stream_tts": "interactive",
+    "stream_text_to_speech": "interactive",
+    "generate_recipe": "standard",
+    "text_to_speech": "standard",
+    "generate_recipes": "bulk",
+    "download_tts": "bulk",
+}
+
+class Admission:
+    """
+    A request's place in the scheduler, holding a slot from the time it is granted until it is released.
+    """
+
+    def __init__(self, scheduler, endpoint_class, client, enqueued):
+        self.endpoint_class = endpoint_class
+        self.client = client
+        self.enqueued = enqueued
+        self.granted = None
+        self._scheduler = scheduler
+        self._future = Future()
+        self._released = False
+        self._lent = False
+        # Seconds the slot was held before the current holding period, which started at _since
+        self._held = 0.0
+        self._since = None
+
+    def release(self):
+        """
+        Give the slot back once the response is complete. Releasing twice has no effect.
+        """
+        self._scheduler._release(self)
+
+    @contextlib.contextmanager
+    def waiting_on_client(self):
+        """
+        Lend the slot to other requests while the response waits for the client to take a chunk,
+        so that slow or idle readers do not hold a slot.
+
+        The slot is taken back as soon as the chunk is sent, even if all slots are in use, since an
+        admitted request is never queued again. New requests are only granted slots below the limit.
+        """
+        lent = self._scheduler._lend(self)
+        try:
+            yield
+        finally:
+            if lent:
+                self._scheduler._reclaim(self)
+
+class _ClassState:
+    """
+    The queues of one endpoint class, one FIFO per client served round-robin.
+    """
+
+    def __init__(self, name, priority, max_active, max_queue, slo):
+        self.name = name
+        self.priority = priority
+        self.max_active = max_active
+        self.max_queue = max_queue
+        self.slo = slo
+        self.active = 0
+        self.queued = 0
+        self.queues = OrderedDict()
+        # Moving average of the time a request holds its slot, None until one was released
+        self.service_time = None
+
+    def push(self, admission):
+        queue = self.queues.get(admission.client)
+        if queue is None:
+            queue = self.queues[admission.client] = deque()
+        queue.append(admission)
+        self.queued += 1
+
+    def pop(self):
+        # The first client gets one request and goes to the back of the round
+        client, queue = next(iter(self.queues.items()))
+        admission = queue.popleft()
+        if queue:
+            self.queues.move_to_end(client)
+        else:
+            del self.queues[client]
+        self.queued -= 1
+        return admission
+
+    def remove(self, admission):
+        queue = self.queues.get(admission.client)
+        if queue is None or admission not in queue:
+            return False
+        queue.remove(admission)
+        if not queue:
+            del self.queues[admission.client]
+        self.queued -= 1
+        return True
+
+class RequestScheduler:
+    """
+    Admits the requests of the expensive endpoints, so that overload queues and sheds requests
+    instead of slowing down every request in flight.
+
+    At most max_active requests run at the same time. A streaming response does
+    not count while it waits for its client to take a chunk, so the limit bounds
+    the requests working on the upstream, not the open connections. Waiting requests are kept
+    in bounded queues per endpoint class. Whenever a slot frees up, it goes to the
+    highest priority class with waiting requests that is under its own limit, so
+    interactive streams overtake bulk downloads. Within a class every client
+    has its own queue and the clients are served round-robin, so a client that
+    sends many requests waits for its own requests, not the others'.
+
+    A request is rejected right away, with a Retry-After, when its client
+    already has max_client_queue requests waiting (429), or when its class
+    queue is full or its estimated wait exceeds the SLO of its class (503). The
+    estimate is the work queued ahead of it, from the average time a request of
+    each class holds its slot. A request still waiting when its SLO runs out
+    is rejected as well (503).
+    """
+
+    def __init__(self, max_active=16, classes=None, max_client_queue=8, smoothing=0.2, clock=time.monotonic):
+        """
+        Initialize the RequestScheduler.
+
+        Args:
+            max_active (int, optional): Maximum number of admitted requests at the same time. Defaults to 16.
+            classes (dict, optional): The max_active (0 for no limit of its own), max_queue and slo of every
+                endpoint class, in priority order. Defaults to ENDPOINT_CLASSES.
+            max_client_queue (int, optional): Maximum number of waiting requests of one client. Defaults to 8.
+            smoothing (float, optional): Weight of the latest request in the average service time. Defaults to 0.2.
+            clock (callable, optional): Monotonic clock returning seconds. Defaults to time.monotonic.
+        """
+        self.max_active = max_active
+        self.max_client_queue = max_client_queue
+        self.smoothing = smoothing
+        self._clock = clock
+
+        self._lock = threading.Lock()
+        self._active = 0
+        self._clients = {}
+        self._classes = {}
+        for priority, (name, config) in enumerate((classes or ENDPOINT_CLASSES).items()):
+            self._classes[name] = _ClassState(name, priority, config['max_active'] or max_active,
+                                              config['max_queue'], config['slo'])
+
+    def admit(self, endpoint_class, client):
+        """
+        Wait until a request may run.
+
+        Args:
+            endpoint_class (str): A key of the classes, e.g. "interactive".
+            client (str): Identity of the client, e.g. its address.
+
+        Returns:
+            Admission: The admission, to be released when the response is complete.
+        """
+        admission = self._enqueue(endpoint_class, client)
+        remaining = admission.enqueued + self._classes[endpoint_class].slo - self._clock()
+        try:
+            admission._future.result(timeout=max(0.0, remaining))
+        except FutureTimeoutError:
+            self._expire(admission)
+        return self._granted(admission)
+
+    async def admit_async(self, endpoint_class, client):
+        """
+        Wait until a request may run, without blocking the event loop.
+
+        Args:
+            endpoint_class (str): A key of the classes, e.g. "interactive".
+            client (str): Identity of the client, e.g. its address.
+
+        Returns:
+            Admission: The admission, to be released when the response is complete.
+        """
+        admission = self._enqueue(endpoint_class, client)
+        remaining = admission.enqueued + self._classes[endpoint_class].slo - self._clock()
+        try:
+            # Shielded, so a timeout does not cancel the grant, which _expire settles under the lock
+            await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(admission._future)), max(0.0, remaining))
+        except asyncio.TimeoutError:
+            self._expire(admission)
+        except asyncio.CancelledError:
+            # The client went away while waiting
+            self._expire(admission, reject=False)
+            raise
+        return self._granted(admission)
+
+    def status(self):
+        """
+        Report the running and waiting requests of every class.
+
+        Returns:
+            dict: The status by class name.
+        """
+        with self._lock:
+            return {
+                name: {
+                    'active': state.active,
+                    'queued': state.queued,
+                    'clients': len(state.queues),
+                    'max_active': state.max_active,
+                    'service_time': state.service_time,
+                }
+                for name, state in self._classes.items()
+            }
+
+    def _enqueue(self, endpoint_class, client):
+        """
+        Queue a request, or reject it if it would wait too long.
+        """
+        state = self._classes[endpoint_class]
+        now = self._clock()
+
+        with self._lock:
+            waiting = self._clients.get(client, 0)
+            if waiting >= self.max_client_queue:
+                slots = min(self.max_active, state.max_active)
+                reason, status = "client_limit", 429
+                retry_after = (waiting * (state.service_time or 1.0)) / slots
+                message = "Too many requests from this client, please try again later"
+            else:
+                estimate = self._estimate_wait(state, client)
+                reason = None
+                if state.queued >= state.max_queue:
+                    reason = "queue_full"
+                elif estimate > state.slo:
+                    reason = "slo"
+                status, retry_after = 503, estimate
+                message = "The server is busy, please try again later"
+
+            if reason is None:
+                admission = Admission(self, endpoint_class, client, now)
+                state.push(admission)
+                self._clients[client] = waiting + 1
+                self._dispatch()
+                return admission
+
+        metrics.SCHEDULER_REJECTED.inc(endpoint_class, reason)
+        raise Overloaded(message, status=status, retry_after=max(1, math.ceil(retry_after)))
+
+    def _estimate_wait(self, state, client):
+        """
+        Estimate the queue wait of a new request of a class. Called with the lock held.
+
+        Returns:
+            float: The estimated wait in seconds.
+        """
+        slots = min(self.max_active, state.max_active)
+        free = min(self.max_active - self._active, state.max_active - state.active)
+
+        # Served before it: the waiting requests of higher classes, and of its own class
+        # one request per client for every request its client already has waiting
+        own = len(state.queues.get(client, ()))
+        ahead = sum(min(len(queue), own + 1) for other, queue in state.queues.items() if other != client) + own
+        work = ahead * (state.service_time or 0.0)
+        count = ahead
+        for other in self._classes.values():
+            if other.priority < state.priority:
+                work += other.queued * (other.service_time or 0.0)
+                count += other.queued
+
+        if count < free:
+            return 0.0
+        # Without a free slot, the request also waits for a running one to finish
+        return (work + (state.service_time or 0.0)) / slots
+
+    def _dispatch(self):
+        """
+        Grant free slots to the waiting requests, by class priority. Called with the lock held.
+        """
+        while self._active < self.max_active:
+            state = next((state for state in self._classes.values()
+                          if state.queued and state.active < state.max_active), None)
+            if state is None:
+                return
+            admission = state.pop()
+            self._clients[admission.client] -= 1
+            if not self._clients[admission.client]:
+                del self._clients[admission.client]
+            state.active += 1
+            self._active += 1
+            admission.granted = admission._since = self._clock()
+            admission._future.set_result(True)
+
+    def _expire(self, admission, reject=True):
+        """
+        Take a request out of the queue after its wait ran out, unless it was granted meanwhile.
+        """
+        state = self._classes[admission.endpoint_class]
+        with self._lock:
+            if not state.remove(admission):
+                # Granted just in time
+                if not reject:
+                    self._release_locked(admission)
+                return
+            self._clients[admission.client] -= 1
+            if not self._clients[admission.client]:
+                del self._clients[admission.client]
+            retry_after = (state.service_time or 1.0) / min(self.max_active, state.max_active)
+
+        if reject:
+            metrics.SCHEDULER_REJECTED.inc(admission.endpoint_class, "timeout")
+            raise Overloaded("The server is busy, please try again later", status=503,
+                             retry_after=max(1, math.ceil(retry_after)))
+
+    def _granted(self, admission):
+        metrics.SCHEDULER_WAIT_SECONDS.observe(admission.granted - admission.enqueued, admission.endpoint_class)
+        return admission
+
+    def _release(self, admission):
+        with self._lock:
+            self._release_locked(admission)
+
+    def _release_locked(self, admission):
+        if admission._released:
+            return
+        admission._released = True
+
+        state = self._classes[admission.endpoint_class]
+        held = admission._held
+        if not admission._lent:
+            held += self._clock() - admission._since
+        state.service_time = held if state.service_time is None else \
+            state.service_time + self.smoothing * (held - state.service_time)
+        if not admission._lent:
+            state.active -= 1
+            self._active -= 1
+        self._dispatch()
+
+    def _lend(self, admission):
+        """
+        Free the slot of an admitted request while it waits for its client.
+
+        Returns:
+            bool: Whether the slot was lent, False if it was released or lent already.
+        """
+        state = self._classes[admission.endpoint_class]
+        with self._lock:
+            if admission._released or admission._lent:
+                return False
+            admission._lent = True
+            admission._held += self._clock() - admission._since
+            state.active -= 1
+            self._active -= 1
+            self._dispatch()
+            return True
+
+    def _reclaim(self, admission):
+        """
+        Take the slot of a request back after its client took a chunk, without waiting.
+        """
+        state = self._classes[admission.endpoint_class]
+        with self._lock:
+            if admission._released or not admission._lent:
+                return
+            admission._lent = False
+            admission._since = self._clock()
+            state.active += 1
+            self._active += 1
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+def _env(name, key, default):
+    return os.getenv(f"SCHEDULER_{name.upper()}_{key}", default)
+
+def get_scheduler():
+    """
+    Get the process-wide request scheduler, creating it on first use.
+
+    It is configured by SCHEDULER_MAX_ACTIVE (0 disables admission control),
+    SCHEDULER_MAX_CLIENT_QUEUE, and SCHEDULER_<CLASS>_MAX_ACTIVE, _MAX_QUEUE
+    and _SLO for the interactive, standard and bulk classes.
+
+    Returns:
+        RequestScheduler: The scheduler, or None if admission control is disabled.
+    """
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            max_active = int(os.getenv("SCHEDULER_MAX_ACTIVE", "16"))
+            if max_active <= 0:
+                return None
+            _scheduler = RequestScheduler(
+                max_active=max_active,
+                classes={
+                    name: {
+                        'max_active': int(_env(name, "MAX_ACTIVE", str(config['max_active']))),
+                        'max_queue': int(_env(name, "MAX_QUEUE", str(config['max_queue']))),
+                        'slo': float(_env(name, "SLO", str(config['slo']))),
+                    }
+                    for name, config in ENDPOINT_CLASSES.items()
+                },
+                max_client_queue=int(os.getenv("SCHEDULER_MAX_CLIENT_QUEUE", "8")),
+            )
+        return _scheduler
+
+def client_identity(headers, remote_addr):
+    """
+    Identify the client of a request for fair queuing.
+
+    Args:
+        headers (mapping): The request headers, by lowercase name or case-insensitive.
+        remote_addr (str): The address of the peer.
+
+    Returns:
+        str: The value of the SCHEDULER_CLIENT_HEADER header if it is set and present, e.g. the first
+            address of X-Forwarded-For behind a proxy or an API key, and the peer address otherwise.
+    """
+    header = os.getenv("SCHEDULER_CLIENT_HEADER")
+    if header:
+        value = headers.get(header.lower())
+        if value:
+            return value.split(",")[0].strip()
+    return remote_addr or "unknown"
+
+def _gauge(field):
+    def collect():
+        scheduler = _scheduler
+        if scheduler is None:
+            return {}
+        return {(name,): status[field] for name, status in scheduler.status().items()}
+    return collect
+
+metrics.REGISTRY.gauge(
+    "scheduler_active_requests", "Admitted requests in progress.", ["class"], _gauge('active'))
+metrics.REGISTRY.gauge(
+    "scheduler_queued_requests", "Requests waiting for admission.", ["class"], _gauge('queued'))
@@ -0,0 +1,272 @@
+import re
+import zlib
+import threading
+from collections import OrderedDict
+import numpy as np
+
+# Words that do not change which recipe fits an ingredient list
+STOPWORDS = {
+    'a', 'an', 'and', 'of', 'or', 'with', 'some', 'fresh', 'freshly', 'chopped', 'diced', 'minced',
+    'sliced', 'grated', 'organic', 'raw', 'whole', 'large', 'small', 'medium', 'optional',
+}
+
+# Prime modulus of the MinHash permutations, just below 2**32
+_PRIME = np.uint64(4294967291)
+
+class SimilarityIndex:
+    """
+    An index of previous recipe requests that finds the most similar one in sublinear time.
+
+    Requests are compared ingredient by ingredient: two ingredients are the
+    same when the normalized words of one are all in the other, so "tomatoes"
+    matches "cherry tomato". The similarity is the Jaccard similarity of the
+    ingredient lists under that matching, so a list of three with one extra
+    garnish is 3/4 similar to the list without it, while one ingredient
+    replaced in a list of four is only 3/5 similar. Only requests with the same
+    dietary preference, goal and profile are compared.
+
+    Each request is summarized by a MinHash signature of the last word of every
+    ingredient, so that an extra ingredient changes one word however long its
+    name is. The signature is split into bands; requests sharing any band land
+    in the same bucket (locality sensitive hashing). A lookup only compares the requests in
+    its buckets, so its cost does not grow with the number of stored requests.
+    The candidates are then checked with their exact similarity.
+    """
+
+    def __init__(self, threshold=0.75, max_entries=100000, num_perm=192, bands=32, seed=1):
+        """
+        Initialize the SimilarityIndex.
+
+        Args:
+            threshold (float, optional): Minimum similarity of a match, between 0 and 1. Defaults to 0.75,
+                which accepts one extra or missing ingredient in a list of three or more.
+            max_entries (int, optional): Maximum number of stored requests; the oldest are dropped first.
+                Defaults to 100000.
+            num_perm (int, optional): Length of the MinHash signatures. Defaults to 192.
+            bands (int, optional): Number of bands the signatures are split into. More bands find
+                less similar candidates at the cost of more comparisons. Defaults to 32, bands of six
+                rows that find a list of three with one extra ingredient nearly always.
+            seed (int, optional): Seed of the hash permutations. Defaults to 1.
+        """
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.bands = bands
+
+        rng = np.random.default_rng(seed)
+        # Multipliers below 2**31 keep a * x + b within 64 bits for 32-bit token hashes
+        self._a = rng.integers(1, 2 ** 31, size=(num_perm, 1), dtype=np.uint64)
+        self._b = rng.integers(0, 2 ** 31, size=(num_perm, 1), dtype=np.uint64)
+
+        self._entries = OrderedDict()
+        self._buckets = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def tokens(ingredients):
+        """
+        Normalize an ingredient list into a set of words.
+
+        Args:
+            ingredients (list): List of ingredients.
+
+        Returns:
+            frozenset: The lowercase, singular ingredient words without stopwords.
+        """
+        return frozenset().union(*SimilarityIndex.ingredient_words(ingredients))
+
+    @staticmethod
+    def ingredient_words(ingredients):
+        """
+        Normalize an ingredient list into the words of every ingredient.
+
+        Args:
+            ingredients (list): List of ingredients.
+
+        Returns:
+            tuple: A frozenset of lowercase, singular words without stopwords per distinct
+                ingredient, leaving out the ingredients without such words.
+        """
+        items = {}
+        for item in ingredients:
+            words = frozenset(_singular(word) for word in re.findall(r"[a-z]+", str(item).lower())
+                              if word not in STOPWORDS)
+            if words:
+                items[words] = None
+        return tuple(items)
+
+    @staticmethod
+    def head_words(ingredients):
+        """
+        Normalize an ingredient list into the last word of every ingredient.
+
+        Args:
+            ingredients (list): List of ingredients.
+
+        Returns:
+            frozenset: The last lowercase, singular word without stopwords of every ingredient,
+                e.g. "tomato" for both "cherry tomatoes" and "tomato".
+        """
+        heads = set()
+        for item in ingredients:
+            words = [word for word in re.findall(r"[a-z]+", str(item).lower()) if word not in STOPWORDS]
+            if words:
+                heads.add(_singular(words[-1]))
+        return frozenset(heads)
+
+    @staticmethod
+    def similarity(items, other_items):
+        """
+        Compute the similarity of two ingredient lists.
+
+        Args:
+            items (tuple): The ingredient words of one list, as returned by ingredient_words.
+            other_items (tuple): The ingredient words of the other list.
+
+        Returns:
+            float: The number of shared ingredients divided by the number of distinct ingredients
+                of both lists, where an ingredient is shared when its words are all in an
+                ingredient of the other list or the other way round.
+        """
+        if not items or not other_items:
+            return 0.0
+
+        # Identical ingredients are paired first, so a more specific one stays free for a broader one
+        unmatched = [other for other in other_items if other not in items]
+        shared = len(other_items) - len(unmatched)
+        for words in items:
+            if words in other_items:
+                continue
+            for position, other in enumerate(unmatched):
+                if words <= other or other <= words:
+                    del unmatched[position]
+                    shared += 1
+                    break
+
+        return shared / (len(items) + len(other_items) - shared)
+
+    @staticmethod
+    def partition(dietary_preference=None, goal=None, profile="full"):
+        """
+        Build the part of a request that must match exactly.
+
+        Args:
+            dietary_preference (str, optional): Dietary preference.
+            goal (str, optional): Nutritional goal.
+            profile (str, optional): Generation profile. Defaults to "full".
+
+        Returns:
+            str: The normalized preference, goal and profile, e.g. "low carb|muscle gain|full".
+        """
+        def normalize(text):
+            return " ".join(_singular(word) for word in re.findall(r"[a-z]+", (text or "").lower()))
+
+        return f"{normalize(dietary_preference)}|{normalize(goal)}|{profile}"
+
+    def add(self, ingredients, content, dietary_preference=None, goal=None, profile="full"):
+        """
+        Store the recipe of a request.
+
+        Args:
+            ingredients (list): List of ingredients of the request.
+            content (str): The raw recipe text.
+            dietary_preference (str, optional): Dietary preference.
+            goal (str, optional): Nutritional goal.
+            profile (str, optional): Generation profile. Defaults to "full".
+        """
+        items = self.ingredient_words(ingredients)
+        if not items:
+            return
+
+        partition = self.partition(dietary_preference, goal, profile)
+        band_keys = self._band_keys(partition, self.head_words(ingredients))
+
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = (items, band_keys, list(ingredients), content)
+            for key in band_keys:
+                self._buckets.setdefault(key, set()).add(entry_id)
+
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def lookup(self, ingredients, dietary_preference=None, goal=None, profile="full"):
+        """
+        Find the stored request most similar to a request.
+
+        Args:
+            ingredients (list): List of ingredients of the request.
+            dietary_preference (str, optional): Dietary preference.
+            goal (str, optional): Nutritional goal.
+            profile (str, optional): Generation profile. Defaults to "full".
+
+        Returns:
+            tuple: A (content, similarity, ingredients) tuple of the best match at or above
+                the threshold, or None if there is none.
+        """
+        items = self.ingredient_words(ingredients)
+        if not items:
+            return None
+
+        partition = self.partition(dietary_preference, goal, profile)
+        band_keys = self._band_keys(partition, self.head_words(ingredients))
+
+        with self._lock:
+            candidates = set()
+            for key in band_keys:
+                candidates.update(self._buckets.get(key, ()))
+
+            best, best_similarity = None, self.threshold
+            for entry_id in candidates:
+                entry = self._entries[entry_id]
+                similarity = self.similarity(items, entry[0])
+                # Ties go to the most recent recipe
+                if similarity > best_similarity or (similarity == best_similarity and (best is None or entry_id > best)):
+                    best, best_similarity = entry_id, similarity
+
+            if best is None:
+                return None
+
+            _, _, matched_ingredients, content = self._entries[best]
+            return content, best_similarity, matched_ingredients
+
+    def clear(self):
+        """
+        Remove all stored requests.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._buckets.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _signature(self, tokens):
+        hashes = np.fromiter((zlib.crc32(token.encode('utf-8')) for token in tokens), dtype=np.uint64, count=len(tokens))
+        return ((self._a * hashes + self._b) % _PRIME).min(axis=1).astype(np.uint32)
+
+    def _band_keys(self, partition, tokens):
+        bands = self._signature(tokens).reshape(self.bands, -1)
+        return [(partition, band, row.tobytes()) for band, row in enumerate(bands)]
+
+    def _remove(self, entry_id):
+        _, band_keys, _, _ = self._entries.pop(entry_id)
+        for key in band_keys:
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket.discard(entry_id)
+                if not bucket:
+                    del self._buckets[key]
+
+def _singular(word):
+    if len(word) > 4 and word.endswith('ies'):
+        return word[:-3] + 'y'
+    if len(word) > 4 and word.endswith(('oes', 'ches', 'shes')):
+        return word[:-2]
+    if len(word) > 3 and word.endswith('s') and not word.endswith(('ss', 'us')):
+        return word[:-1]
+    return word
@@ -0,0 +1,244 @@
+import threading
+
+class CallCancelled(Exception):
+    """
+    Raised to late joiners of a stream whose every consumer went away.
+    """
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical calls into a single upstream call.
+
+    While a call for a key is in flight, further calls with the same key wait
+    for it and get its result instead of starting their own. Streaming calls
+    are shared the same way: a waiter joining mid-stream first receives the
+    chunks emitted so far, then the live tail.
+    """
+
+    def __init__(self):
+        """
+        Initialize the SingleFlight.
+        """
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._streams = {}
+
+    def do(self, key, func, *args, **kwargs):
+        """
+        Call a function, sharing the call with concurrent callers of the same key.
+
+        Args:
+            key: Hashable key identifying identical calls.
+            func (callable): The function to call.
+            *args: Positional arguments for the function.
+            **kwargs: Keyword arguments for the function.
+
+        Returns:
+            The result of the function. All callers of one flight share the same object.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func(*args, **kwargs)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stream(self, key, func, *args, **kwargs):
+        """
+        Stream from a generator function, sharing the stream with concurrent callers of the same key.
+
+        Args:
+            key: Hashable key identifying identical streams.
+            func (callable): The generator function.
+            *args: Positional arguments for the function.
+            **kwargs: Keyword arguments for the function.
+
+        Returns:
+            iterator: A generator-like iterator yielding every chunk of the shared stream
+                and returning its return value. Closing it leaves the stream, also before
+                its first chunk.
+        """
+        with self._lock:
+            broadcast = self._streams.get(key)
+            if broadcast is None:
+                broadcast = _Broadcast(lambda: func(*args, **kwargs), self._lock, lambda: self._remove_stream(key, broadcast))
+                self._streams[key] = broadcast
+            broadcast.consumers += 1
+
+        return _Consumer(broadcast)
+
+    def _remove_stream(self, key, broadcast):
+        # Called with the lock held
+        if self._streams.get(key) is broadcast:
+            del self._streams[key]
+
+class _Call:
+    """
+    State of a coalesced non-streaming call.
+    """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class _Consumer:
+    """
+    One consumer of a coalesced stream.
+
+    The consumer is counted as soon as it joins, but a generator that is closed
+    before it started never runs its finally clause. The consumer therefore
+    leaves the stream itself, exactly once, when its chunks end or it is closed.
+    """
+
+    def __init__(self, broadcast):
+        self._broadcast = broadcast
+        self._chunks = broadcast.consume()
+        self._left = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            return next(self._chunks)
+        except BaseException:
+            # The end of the stream, its error, or its cancellation
+            self._leave()
+            raise
+
+    def close(self):
+        """
+        Stop consuming, closing the upstream stream if this was its last consumer.
+        """
+        self._chunks.close()
+        self._leave()
+
+    def __del__(self):
+        self.close()
+
+    def _leave(self):
+        if not self._left:
+            self._left = True
+            self._broadcast._leave()
+
+class _Broadcast:
+    """
+    State of a coalesced stream.
+
+    The upstream iterator is driven by its consumers: whichever consumer needs
+    a chunk that has not arrived yet pulls it, while the others wait. Every
+    chunk is kept so that late joiners can replay the prefix. The upstream
+    iterator is closed as soon as the last consumer goes away.
+    """
+
+    def __init__(self, start, registry_lock, unregister):
+        # Number of consumers, guarded by the registry lock
+        self.consumers = 0
+
+        self._start = start
+        self._registry_lock = registry_lock
+        self._unregister = unregister
+        self._iterator = None
+        self._chunks = []
+        self._finished = False
+        self._result = None
+        self._error = None
+        self._pulling = False
+        self._condition = threading.Condition()
+
+    def consume(self):
+        """
+        Yield the chunks of the stream from the beginning. The consumer leaves through its _Consumer.
+
+        Returns:
+            generator: A generator yielding chunks and returning the stream's return value.
+        """
+        index = 0
+        while True:
+            with self._condition:
+                while index >= len(self._chunks) and not self._finished and self._pulling:
+                    self._condition.wait()
+
+                if index < len(self._chunks):
+                    chunk = self._chunks[index]
+                elif self._finished:
+                    if self._error is not None:
+                        raise self._error
+                    return self._result
+                else:
+                    chunk = None
+                    self._pulling = True
+
+            if chunk is None:
+                self._pull()
+                continue
+
+            index += 1
+            yield chunk
+
+    def _pull(self):
+        """
+        Fetch the next upstream chunk and wake up the waiting consumers.
+        """
+        try:
+            if self._iterator is None:
+                self._iterator = self._start()
+            chunk = next(self._iterator)
+        except StopIteration as e:
+            self._finish(result=e.value)
+        except Exception as e:
+            self._finish(error=e)
+        else:
+            with self._condition:
+                self._chunks.append(chunk)
+                self._pulling = False
+                self._condition.notify_all()
+
+    def _finish(self, result=None, error=None):
+        # Later calls start a new stream
+        with self._registry_lock:
+            self._unregister()
+
+        with self._condition:
+            self._finished = True
+            self._result = result
+            self._error = error
+            self._pulling = False
+            self._condition.notify_all()
+
+    def _leave(self):
+        """
+        Unregister a consumer, stopping the upstream stream if nobody is left.
+        """
+        with self._registry_lock:
+            self.consumers -= 1
+            abandoned = self.consumers == 0 and not self._finished
+            if abandoned:
+                # Stop new consumers from joining before closing the upstream iterator
+                self._unregister()
+
+        if abandoned:
+            with self._condition:
+                self._finished = True
+                self._error = CallCancelled("Stream cancelled by all consumers")
+                self._condition.notify_all()
+            if self._iterator is not None and hasattr(self._iterator, 'close'):
+                self._iterator.close()
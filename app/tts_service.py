@@ -1,8 +1,18 @@
 import os
-import base64
-import dashscope
-from dashscope.audio.qwen_tts import SpeechSynthesizer
+import time
+import contextlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from app import metrics
 from app.llm_logger import LLMLogger
+from app.backends import DashScopeBackend, get_backend
+from app.governor import UpstreamThrottled, get_governor
+from app.text_segmenter import segment_text
+from app.audio_cache import AudioCache
+from app.single_flight import SingleFlight
+from app.wav_stream import parse_wav, WavStreamReader, WavFormatError
+from app.audio_buffer import ChunkCoalescer
+from app.audio_formats import AudioConverter, OUTPUT_FORMATS, DEFAULT_FORMAT
 
 class TTSService:
     """
@@ -12,36 +22,73 @@ class TTSService:
     # Maximum token limit for the TTS API (approximately 500 characters)
     MAX_TOKEN_LENGTH = 500
 
-    def __init__(self, api_key=None, log_dir="logs"):
+    # Size of the chunks used when streaming cached audio
+    CACHED_CHUNK_SIZE = 16 * 1024
+
+    # Streamed audio is coalesced into frames of this size, held back at most STREAM_MAX_LATENCY seconds
+    STREAM_FRAME_SIZE = 8 * 1024
+    STREAM_MAX_LATENCY = 0.05
+
+    # Format of the raw audio of the streaming API, 24 kHz 16-bit mono PCM
+    STREAM_PARAMS = {'channels': 1, 'sample_width': 2, 'framerate': 24000}
+
+    def __init__(self, api_key=None, log_dir="logs", audio_cache=None, max_concurrency=4, backend=None, governor=None):
         """
         Initialize the TTSService with an API key.
 
         Args:
             api_key (str, optional): The API key for dashscope. If None, it will use the environment variable.
             log_dir (str, optional): Directory to store logs. Defaults to "logs".
+            audio_cache (AudioCache, optional): Cache for synthesized audio. If None, every segment calls the API.
+            max_concurrency (int, optional): Maximum number of segments of one request synthesized in parallel.
+                1 synthesizes the segments one after another. Defaults to 4.
+            backend (optional): Upstream backend, e.g. a FakeBackend. If None, the backend selected by
+                RECIPE_GEN_BACKEND is used, which defaults to DashScope.
+            governor (UpstreamGovernor, optional): Paces the TTS calls. Defaults to the shared "tts" governor.
         """
+        self.backend = backend or get_backend()
+        self.governor = governor or get_governor("tts")
+
+        # A local backend does not need a key
         self.api_key = api_key or os.getenv("DASHSCOPE_API_KEY")
-        if not self.api_key:
+        if not self.api_key and isinstance(self.backend, DashScopeBackend):
             raise ValueError("API key is required. Set it as an argument or as DASHSCOPE_API_KEY environment variable.")
 
         # Initialize logger
         self.logger = LLMLogger(log_dir=log_dir)
 
+        self.audio_cache = audio_cache
+        self.max_concurrency = max(1, max_concurrency)
+
+        # Identical segments in flight at the same time share one API call
+        self._flights = SingleFlight()
+
+        # Fills the cache from upstream URLs without delaying the response
+        self._cache_fill_executor = ThreadPoolExecutor(max_workers=2) if audio_cache is not None else None
+
     def _split_text(self, text):
         """
         Split text into segments based on newlines and maximum token length.
 
+        Short lines are packed together and long lines are split at sentence or
+        clause boundaries, so that each segment stays within MAX_TOKEN_LENGTH.
+
         Args:
             text (str): The text to split.
 
         Returns:
             list: A list of text segments.
         """
-        # First split by newlines
-        lines = text.split('\n')
-        return lines
+        segments = segment_text(text, self.MAX_TOKEN_LENGTH)
+
+        # Report how many API calls the packing saves compared to one call per line
+        lines = sum(1 for line in text.split('\n') if line.strip())
+        self.logger.logger.info(f"TTS Segmentation - Lines: {lines}, Segments: {len(segments)}")
+        metrics.TTS_SEGMENTS.observe(len(segments))
+
+        return segments
 
-    def text_to_speech(self, text, voice="Ethan", stream=False):
+    def text_to_speech(self, text, voice="Ethan", stream=False, audio_format=DEFAULT_FORMAT):
         """
         Convert text to speech.
 
@@ -49,19 +96,95 @@ class TTSService:
             text (str): The text to convert to speech.
             voice (str, optional): The voice to use. Defaults to "Ethan".
             stream (bool, optional): Whether to stream the audio. Defaults to False.
+            audio_format (str, optional): A key of OUTPUT_FORMATS the streamed audio is converted to.
+                Defaults to "wav", the audio as synthesized.
 
         Returns:
             If stream=False, returns a list of URLs to the audio files.
-            If stream=True, returns a generator yielding audio chunks.
+            If stream=True, returns a generator yielding a single progressive WAV file in chunks.
         """
+        if audio_format not in OUTPUT_FORMATS:
+            raise ValueError(f"Unknown audio format: {audio_format}")
+
         # Split text into segments
         segments = self._split_text(text)
 
         if stream:
-            return self._stream_tts_segments(segments, voice)
+            return self._progressive_wav(self._stream_tts_segments(segments, voice), audio_format)
         else:
             return self._tts_segments(segments, voice)
 
+    def _progressive_wav(self, frames, audio_format):
+        """
+        Assemble streamed audio frames into one WAV file that can be played while it downloads.
+
+        The file has a single header with the streaming size convention, sent
+        together with the first frames so that the first chunk is already playable.
+
+        Args:
+            frames (iterable): The (params, frames) of the audio of every segment, in order.
+            audio_format (str): A key of OUTPUT_FORMATS.
+
+        Returns:
+            generator: A generator yielding the WAV file in chunks.
+        """
+        converter = None
+        header = None
+        for params, chunk in frames:
+            if converter is None:
+                converter = AudioConverter(params, audio_format)
+                header = converter.header()
+            elif params != converter.params:
+                raise WavFormatError("The segments have different audio formats")
+
+            output = converter.convert(chunk)
+            if not output:
+                continue
+
+            metrics.TTS_OUTPUT_BYTES.inc(audio_format, amount=len(output))
+            if header is not None:
+                output = header + output
+                header = None
+            # Response bodies must be bytes, this is the only copy of the frames
+            yield bytes(output)
+
+    def prefetch(self, text, voice="Ethan"):
+        """
+        Synthesize the segments of a text that are not cached yet into the audio cache.
+
+        Both the complete files of the URL and download endpoints and the stream
+        chunks of the streaming endpoint are cached, so later requests for the
+        same text are served from the cache by all of them.
+
+        Args:
+            text (str): The text to synthesize.
+            voice (str, optional): The voice to use. Defaults to "Ethan".
+
+        Returns:
+            tuple: The number of segments that were already cached in both forms, and the total number of segments.
+        """
+        if self.audio_cache is None:
+            raise ValueError("Prefetching requires an audio cache")
+
+        segments = self._split_text(text)
+        cached = 0
+        for segment in segments:
+            wav_cached = self.audio_cache.contains(self.audio_cache.make_key(segment, voice, "qwen-tts"))
+            stream_cached = self.audio_cache.contains(self.audio_cache.make_key(segment, voice, "qwen-tts", kind="stream"))
+            if wav_cached and stream_cached:
+                cached += 1
+                continue
+
+            if not wav_cached:
+                self._segment_audio(segment, voice)
+            if not stream_cached:
+                # Reading the stream to the end stores it
+                with contextlib.closing(self._stream_tts_single(segment, voice)) as stream:
+                    for _ in stream:
+                        pass
+
+        return cached, len(segments)
+
     def _tts_segments(self, segments, voice):
         """
         Convert text segments to speech and return URLs to the audio files.
@@ -75,19 +198,58 @@ class TTSService:
         """
         audio_urls = []
 
-        for segment in segments:
-            if not segment.strip():
-                continue
-
-            url = self._tts_single(segment, voice)
+        for url, error in self.iter_segment_urls(segments, voice):
+            if error is not None:
+                raise error
             audio_urls.append(url)
 
         return audio_urls
 
+    def iter_segment_urls(self, segments, voice):
+        """
+        Synthesize text segments in parallel and yield their results in segment order.
+
+        Up to max_concurrency segments are synthesized at the same time. Each result is
+        yielded as soon as it and every earlier segment are ready, and a failed segment
+        does not stop the following ones.
+
+        Args:
+            segments (list): List of text segments to convert to speech.
+            voice (str): The voice to use.
+
+        Returns:
+            generator: A generator yielding (url, error) tuples, where error is None on success.
+        """
+        segments = [segment for segment in segments if segment.strip()]
+        if not segments:
+            return
+
+        executor = ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(segments)))
+        # Identical segments within one request are synthesized once
+        futures = {}
+        try:
+            for segment in segments:
+                if segment not in futures:
+                    futures[segment] = executor.submit(self._tts_single, segment, voice)
+
+            for segment in segments:
+                try:
+                    yield futures[segment].result(), None
+                except Exception as e:
+                    yield None, e
+        finally:
+            # Drop the segments nobody is waiting for anymore, the running ones still fill the cache
+            skipped = [segment for segment, future in futures.items() if future.cancel()]
+            executor.shutdown(wait=False)
+            if skipped:
+                self._log_skipped("url", len(segments), skipped)
+
     def _tts_single(self, text, voice):
         """
         Convert a single text segment to speech and return a URL to the audio file.
 
+        Concurrent calls for the same segment and voice share one synthesis.
+
         Args:
             text (str): The text segment to convert to speech.
             voice (str): The voice to use.
@@ -95,15 +257,125 @@ class TTSService:
         Returns:
             str: URL to the audio file.
         """
+        key = ("url", AudioCache.normalize_text(text), voice)
+        return self._flights.do(key, self._cached_tts_single, text, voice)
+
+    def _cached_tts_single(self, text, voice):
+        """
+        Convert a single text segment to speech, using the audio cache if available.
+
+        Cached segments are served from the local cache URL. Otherwise the upstream
+        URL is returned and the audio is downloaded into the cache in the background.
+
+        Args:
+            text (str): The text segment to convert to speech.
+            voice (str): The voice to use.
+
+        Returns:
+            str: URL to the audio file.
+        """
+        if self.audio_cache is None:
+            return self._synthesize_url(text, voice)
+
+        key = self.audio_cache.make_key(text, voice, "qwen-tts")
+        if self.audio_cache.contains(key):
+            return self.audio_cache.url_for(key)
+
+        url = self._synthesize_url(text, voice)
+        self._cache_fill_executor.submit(self._fill_cache, key, url)
+        return url
+
+    def _segment_audio(self, text, voice):
+        """
+        Get the WAV data of a single text segment, from the cache if possible.
+
+        Concurrent calls for the same segment and voice share one download.
+
+        Args:
+            text (str): The text segment to convert to speech.
+            voice (str): The voice to use.
+
+        Returns:
+            bytes: The WAV data of the segment.
+        """
+        key = ("wav", AudioCache.normalize_text(text), voice)
+        return self._flights.do(key, self._cached_segment_audio, text, voice)
+
+    def _cached_segment_audio(self, text, voice):
+        """
+        Get the WAV data of a single text segment, using the audio cache if available.
+
+        Args:
+            text (str): The text segment to convert to speech.
+            voice (str): The voice to use.
+
+        Returns:
+            bytes: The WAV data of the segment.
+        """
+        if self.audio_cache is None:
+            return self._download_audio(self._synthesize_url(text, voice))
+
+        key = self.audio_cache.make_key(text, voice, "qwen-tts")
+        audio_data = self.audio_cache.get(key)
+        if audio_data is None:
+            audio_data = self._download_audio(self._synthesize_url(text, voice))
+            self.audio_cache.put(key, audio_data)
+
+        return audio_data
+
+    def _fill_cache(self, key, url):
+        """
+        Download an upstream audio file into the cache.
+
+        Args:
+            key (str): The cache key.
+            url (str): URL of the upstream audio file.
+        """
+        try:
+            self.audio_cache.put(key, self._download_audio(url))
+        except Exception as e:
+            # The upstream URL is still served, so a failed fill is not fatal
+            self.logger.logger.warning(f"Failed to cache TTS audio: {str(e)}")
+
+    def _download_audio(self, url):
+        """
+        Download an audio file.
+
+        Args:
+            url (str): URL of the audio file.
+
+        Returns:
+            bytes: The audio data.
+        """
+        # The backend reuses pooled connections
+        with metrics.TTS_SEGMENT_SECONDS.time("download"):
+            audio_data = self.backend.fetch_audio(url)
+
+        metrics.TTS_AUDIO_BYTES.inc("download", amount=len(audio_data))
+        return audio_data
+
+    def _synthesize_url(self, text, voice):
+        """
+        Call the TTS API for a single text segment.
+
+        Args:
+            text (str): The text segment to convert to speech.
+            voice (str): The voice to use.
+
+        Returns:
+            str: URL to the upstream audio file.
+        """
         # Log the input
         self.logger.log_tts(input_text=text, voice=voice, model="qwen-tts")
 
-        response = SpeechSynthesizer.call(
-            model="qwen-tts",
-            api_key=self.api_key,
-            text=text,
-            voice=voice,
-        )
+        with metrics.TTS_SEGMENT_SECONDS.time("url"):
+            response = self.governor.call(
+                self.backend.speech_call,
+                model="qwen-tts",
+                api_key=self.api_key,
+                text=text,
+                voice=voice,
+            )
 
         if hasattr(response, 'output') and hasattr(response.output, 'audio') and 'url' in response.output.audio:
             url = response.output.audio["url"]
@@ -113,15 +385,19 @@ class TTSService:
 
             return url
         else:
+            code = str(getattr(response, 'code', None) or "unknown")
+
             # Log the error
             self.logger.log_tts(
                 input_text=text, 
                 output_url=None, 
                 voice=voice, 
-                model="qwen-tts"
+                model="qwen-tts",
+                error=code
             )
 
-            raise Exception("Failed to generate speech")
+            metrics.UPSTREAM_ERRORS.inc("tts", code)
+            self._raise_error(response, "Failed to generate speech")
 
     def _stream_tts_segments(self, segments, voice):
         """
@@ -132,17 +408,128 @@ class TTSService:
             voice (str): The voice to use.
 
         Returns:
-            generator: A generator yielding audio chunks.
+            generator: A generator yielding the (params, frames) of the audio chunks of every
+                segment in order, with the WAV header of each segment stripped.
         """
-        for segment in segments:
-            if not segment.strip():
-                continue
+        segments = [segment for segment in segments if segment.strip()]
 
-            yield from self._stream_tts_single(segment, voice)
+        # Identical segments within one request are synthesized once, and their audio
+        # is only kept until their last use
+        last_use = {segment: index for index, segment in enumerate(segments)}
+        synthesized = {}
+        done = set()
+        current = 0
+
+        try:
+            for current, segment in enumerate(segments):
+                # Every segment is a separate upstream stream, which may start with its own header
+                reader = WavStreamReader(self.STREAM_PARAMS)
+
+                if segment in done:
+                    audio_data = synthesized[segment] if last_use[segment] > current else synthesized.pop(segment)
+                    for chunk in self._iter_chunks(audio_data):
+                        frames = reader.feed(chunk)
+                        if frames:
+                            yield reader.params, frames
+                    continue
+
+                # Only a segment that occurs again is buffered
+                chunks = [] if last_use[segment] > current else None
+                # Closing the segment stream stops its upstream call, unless another request shares it
+                with contextlib.closing(self._stream_tts_single(segment, voice)) as stream:
+                    for chunk in stream:
+                        if chunks is not None:
+                            chunks.append(chunk)
+                        frames = reader.feed(chunk)
+                        if frames:
+                            yield reader.params, frames
+                done.add(segment)
+                if chunks is not None:
+                    synthesized[segment] = b"".join(chunks)
+        except GeneratorExit:
+            # The consumer went away, the following segments are never synthesized
+            skipped = [segment for segment in dict.fromkeys(segments[current + 1:])
+                       if segment not in done and segment != segments[current]]
+            self._log_skipped("stream", len(segments), skipped)
+            raise
+
+    def _log_skipped(self, mode, total, skipped):
+        """
+        Log the segments of a cancelled request that are not synthesized.
+
+        Args:
+            mode (str): "stream" or "url".
+            total (int): Number of segments of the request.
+            skipped (list): The distinct segments that are not synthesized.
+        """
+        metrics.TTS_SEGMENTS_SKIPPED.inc(mode, amount=len(skipped))
+        self.logger.logger.info(f"TTS request cancelled - Mode: {mode}, Skipped segments: {len(skipped)} of {total}, "
+                                f"Skipped characters: {sum(len(segment) for segment in skipped)}")
 
     def _stream_tts_single(self, text, voice):
         """
-        Stream a single text segment to speech conversion.
+        Stream a single text segment to speech conversion, from the cache if possible.
+
+        Concurrent streams of the same segment and voice share one API call, a
+        stream joined midway first replays the chunks already received.
+
+        Args:
+            text (str): The text segment to convert to speech.
+            voice (str): The voice to use.
+
+        Returns:
+            generator: A generator yielding audio chunks.
+        """
+        key = ("stream", AudioCache.normalize_text(text), voice)
+        return self._flights.stream(key, self._cached_stream_tts_single, text, voice)
+
+    def _cached_stream_tts_single(self, text, voice):
+        """
+        Stream a single text segment to speech conversion, using the audio cache if available.
+
+        Args:
+            text (str): The text segment to convert to speech.
+            voice (str): The voice to use.
+
+        Returns:
+            generator: A generator yielding audio chunks.
+        """
+        if self.audio_cache is None:
+            yield from self._stream_synthesize(text, voice)
+            return
+
+        key = self.audio_cache.make_key(text, voice, "qwen-tts", kind="stream")
+        audio_data = self.audio_cache.get(key)
+        if audio_data is not None:
+            yield from self._iter_chunks(audio_data)
+            return
+
+        chunks = []
+        with contextlib.closing(self._stream_synthesize(text, voice)) as stream:
+            for chunk in stream:
+                chunks.append(chunk)
+                yield chunk
+
+        # Only complete segments are cached
+        self.audio_cache.put(key, b"".join(chunks))
+
+    def _iter_chunks(self, audio_data):
+        """
+        Split locally available audio into stream-sized chunks.
+
+        Args:
+            audio_data (bytes): The audio data.
+
+        Returns:
+            generator: A generator yielding audio chunks, as memoryview slices of the audio data.
+        """
+        view = memoryview(audio_data)
+        for start in range(0, len(view), self.CACHED_CHUNK_SIZE):
+            yield view[start:start + self.CACHED_CHUNK_SIZE]
+
+    def _stream_synthesize(self, text, voice):
+        """
+        Call the streaming TTS API for a single text segment.
 
         Args:
             text (str): The text segment to convert to speech.
@@ -154,7 +541,9 @@ class TTSService:
         # Log the input
         self.logger.log_tts(input_text=text, voice=voice, model="qwen-tts")
 
-        responses = SpeechSynthesizer.call(
+        start = time.perf_counter()
+        responses = self.governor.stream(
+            self.backend.speech_call,
             model="qwen-tts",
             api_key=self.api_key,
             text=text,
@@ -162,23 +551,31 @@ class TTSService:
             stream=True
         )
 
+        # Coalesce the many small upstream chunks into fewer, larger writes
+        coalescer = ChunkCoalescer(self.STREAM_FRAME_SIZE, self.STREAM_MAX_LATENCY)
+
         total_bytes = 0
         try:
             for chunk in responses:
                 if hasattr(chunk, 'output') and hasattr(chunk.output, 'audio') and 'data' in chunk.output.audio:
                     audio_string = chunk.output.audio["data"]
-                    wav_bytes = base64.b64decode(audio_string)
-                    total_bytes += len(wav_bytes)
-                    yield wav_bytes
+                    if total_bytes == 0:
+                        metrics.TTS_FIRST_CHUNK_SECONDS.observe(time.perf_counter() - start)
+                    for frame in coalescer.feed_base64(audio_string):
+                        total_bytes += len(frame)
+                        yield frame
                 else:
-                    # Log the error
-                    self.logger.log_tts(
-                        input_text=text, 
-                        output_data=None, 
-                        voice=voice, 
-                        model="qwen-tts"
-                    )
-                    raise Exception("Failed to generate speech chunk")
+                    # The error is logged once, by the handler below
+                    metrics.UPSTREAM_ERRORS.inc("tts", str(getattr(chunk, 'code', None) or "unknown"))
+                    self._raise_error(chunk, "Failed to generate speech chunk")
+
+            frame = coalescer.flush()
+            if frame:
+                total_bytes += len(frame)
+                yield frame
+
+            metrics.TTS_SEGMENT_SECONDS.observe(time.perf_counter() - start, "stream")
+            metrics.TTS_AUDIO_BYTES.inc("stream", amount=total_bytes)
 
             # Log the output after streaming is complete
             self.logger.log_tts(
@@ -187,15 +584,120 @@ class TTSService:
                 voice=voice, 
                 model="qwen-tts"
             )
+        except GeneratorExit:
+            # Nobody consumes the audio anymore, the rest of the segment is never synthesized
+            metrics.UPSTREAM_CANCELLED.inc("tts")
+            metrics.TTS_AUDIO_BYTES.inc("stream", amount=total_bytes)
+            self.logger.log_tts(input_text=text, voice=voice, model="qwen-tts", cancelled=True)
+            self.logger.logger.info(f"TTS stream cancelled - Received bytes: {total_bytes}, "
+                                    f"Characters: {len(text)}")
+            raise
         except Exception as e:
             # Log any exceptions
             self.logger.log_tts(
                 input_text=text, 
                 output_data=None, 
                 voice=voice, 
-                model="qwen-tts"
+                model="qwen-tts",
+                error=str(e)
             )
             raise e
+        finally:
+            # Give the governor slot back even if the consumer stops early
+            responses.close()
+
+    def _raise_error(self, response, message):
+        """
+        Raise the error of a failed API response.
+
+        Args:
+            response: The API response.
+            message (str): The error message.
+        """
+        if self.governor.is_throttled(response):
+            raise UpstreamThrottled(f"{message}: {response.code}", retry_after=self.governor.retry_after())
+        raise Exception(message)
+
+    def iter_segment_audio(self, segments, voice):
+        """
+        Fetch the WAV data of text segments concurrently and yield it in segment order.
+
+        At most max_concurrency segments are fetched or held at the same time, so
+        memory stays bounded regardless of the number of segments.
+
+        Args:
+            segments (list): List of text segments to convert to speech.
+            voice (str): The voice to use.
+
+        Returns:
+            generator: A generator yielding the WAV data of each segment.
+        """
+        segments = [segment for segment in segments if segment.strip()]
+        if not segments:
+            return
+
+        # Identical segments share one fetch, which is kept until its last use
+        last_use = {segment: index for index, segment in enumerate(segments)}
+        fetches = {}
+        window = deque()
+
+        executor = ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(segments)))
+        try:
+            next_index = 0
+            for index, segment in enumerate(segments):
+                # Keep the prefetch window full
+                while next_index < len(segments) and len(window) < self.max_concurrency:
+                    upcoming = segments[next_index]
+                    if upcoming not in fetches:
+                        fetches[upcoming] = executor.submit(self._segment_audio, upcoming, voice)
+                        window.append(upcoming)
+                    next_index += 1
+
+                # Only the first fetch of a segment occupies the window
+                if window and window[0] == segment:
+                    window.popleft()
+
+                audio_data = fetches[segment].result()
+                if last_use[segment] == index:
+                    del fetches[segment]
+
+                yield audio_data
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def iter_speech_wav(self, text, voice="Ethan", audio_format=DEFAULT_FORMAT):
+        """
+        Convert text to speech and stream it as a single WAV file.
+
+        The header of the first segment is replaced by a streaming header, then the
+        frames of every segment follow in order as soon as they are downloaded.
+
+        Args:
+            text (str): The text to convert to speech.
+            voice (str, optional): The voice to use. Defaults to "Ethan".
+            audio_format (str, optional): A key of OUTPUT_FORMATS. Defaults to "wav", the audio as synthesized.
+
+        Returns:
+            generator: A generator yielding the WAV header, then the audio frames.
+        """
+        if audio_format not in OUTPUT_FORMATS:
+            raise ValueError(f"Unknown audio format: {audio_format}")
+
+        converter = None
+        for audio_data in self.iter_segment_audio(self._split_text(text), voice):
+            params, frames = parse_wav(audio_data)
+            if converter is None:
+                converter = AudioConverter(params, audio_format)
+                yield converter.header()
+            elif params != converter.params:
+                # Frames of another format would corrupt the file
+                raise WavFormatError("The segments have different audio formats")
+
+            # The frames are copied once, by the conversion or out of the segment
+            output = bytes(converter.convert(frames))
+            if output:
+                metrics.TTS_OUTPUT_BYTES.inc(audio_format, amount=len(output))
+                yield output
 
     def text_to_speech_file(self, text, output_path, voice="Ethan"):
         """
@@ -209,53 +711,25 @@ class TTSService:
         Returns:
             str: The path to the saved audio file.
         """
-        import requests
         import wave
-        import io
-        import os
-
-        # Split text into segments
-        segments = self._split_text(text)
-        audio_urls = self._tts_segments(segments, voice)
 
-        # If there's only one segment, download it directly
-        if len(audio_urls) == 1:
-            try:
-                response = requests.get(audio_urls[0])
-                response.raise_for_status()
-
-                with open(output_path, 'wb') as f:
-                    f.write(response.content)
-
-                return output_path
-            except Exception as e:
-                raise Exception(f"Failed to download audio file: {str(e)}")
-
-        # If there are multiple segments, combine them into a single WAV file
         try:
-            # Create a list to store audio data
-            audio_data_list = []
+            with wave.open(output_path, 'wb') as outfile:
+                first = True
+                for audio_data in self.iter_segment_audio(self._split_text(text), voice):
+                    params, frames = parse_wav(audio_data)
 
-            # Download each audio file
-            for url in audio_urls:
-                response = requests.get(url)
-                response.raise_for_status()
-                audio_data_list.append(response.content)
+                    # Use the first file to set parameters
+                    if first:
+                        outfile.setnchannels(params['channels'])
+                        outfile.setsampwidth(params['sample_width'])
+                        outfile.setframerate(params['framerate'])
+                        first = False
 
-            # Combine audio files
-            with wave.open(output_path, 'wb') as outfile:
-                # Use the first file to set parameters
-                with wave.open(io.BytesIO(audio_data_list[0]), 'rb') as first_file:
-                    params = first_file.getparams()
-                    outfile.setparams(params)
-
-                    # Write the first file's frames
-                    outfile.writeframes(first_file.readframes(first_file.getnframes()))
-
-                # Append the rest of the files
-                for audio_data in audio_data_list[1:]:
-                    with wave.open(io.BytesIO(audio_data), 'rb') as infile:
-                        outfile.writeframes(infile.readframes(infile.getnframes()))
+                    outfile.writeframes(frames)
+
+                if first:
+                    raise Exception("No text to convert")
 
             return output_path
         except Exception as e:
@@ -0,0 +1,327 @@
+import os
+import re
+import sys
+import glob
+import logging
+import argparse
+import threading
+import subprocess
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import fcntl
+except ImportError:
+    # Windows, where the server runs in a single process
+    fcntl = None
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+from app.llm_logger import iter_log_entries
+from app.recipe_cache import RecipeCache
+
+logger = logging.getLogger("Warmup")
+
+_INGREDIENTS = re.compile(r"^Create a recipe using these ingredients: (.*?)\.(?: The recipe should be| Reply in| Please provide)")
+_PREFERENCE = re.compile(r" The recipe should be (.+?)\.(?: The recipe should support| Reply in| Please provide)")
+_GOAL = re.compile(r" The recipe should support (.+?)\.(?: Reply in| Please provide)")
+
+def parse_prompt(generator, prompt):
+    """
+    Recover the request that produced a logged prompt.
+
+    Args:
+        generator (RecipeGenerator): The generator whose prompt format is matched.
+        prompt (str): The user prompt.
+
+    Returns:
+        tuple: The (ingredients, dietary_preference, goal, profile) of the request, or None
+            if the prompt was not built by the current prompt format.
+    """
+    match = _INGREDIENTS.match(prompt)
+    if not match:
+        return None
+
+    ingredients = [item.strip() for item in match.group(1).split(",") if item.strip()]
+    preference = _PREFERENCE.search(prompt)
+    goal = _GOAL.search(prompt)
+    request = (ingredients, preference and preference.group(1), goal and goal.group(1))
+
+    # Only a prompt that is rebuilt exactly is the same request
+    for profile in generator.PROFILES:
+        if generator._construct_prompt(*request, profile) == prompt:
+            return request + (profile,)
+    return None
+
+def mine_requests(generator, log_dir="logs"):
+    """
+    Count the recipe requests recorded in the text generation logs.
+
+    Args:
+        generator (RecipeGenerator): The generator whose prompt format is matched.
+        log_dir (str, optional): Directory of the logs. Defaults to "logs".
+
+    Returns:
+        tuple: A Counter of requests by cache key, the request of each key, and the
+            last logged response text of each key that has one.
+    """
+    counts = Counter()
+    requests = {}
+    responses = {}
+    prompts = {}
+
+    files = sorted(glob.glob(os.path.join(log_dir, "text_generation_*.json")) +
+                   glob.glob(os.path.join(log_dir, "text_generation_*.jsonl")))
+    for log_file in files:
+        try:
+            # Entries are streamed, a log file is never loaded as a whole
+            for entry in iter_log_entries(log_file):
+                messages = entry.get("input") or []
+                prompt = next((message.get("content") for message in messages if message.get("role") == "user"), None)
+                if not prompt:
+                    continue
+
+                if prompt not in prompts:
+                    request = parse_prompt(generator, prompt)
+                    prompts[prompt] = request and RecipeCache.make_key(*request)
+                    if request:
+                        requests[prompts[prompt]] = request
+
+                key = prompts[prompt]
+                if key is None:
+                    continue
+
+                # Every call is logged once with its input, then with its output
+                output = entry.get("output")
+                if output is None:
+                    counts[key] += 1
+                elif output.get("content"):
+                    responses[key] = output["content"]
+        except (OSError, ValueError) as e:
+            logger.warning(f"Skipping the rest of unreadable log {log_file}: {str(e)}")
+
+    return counts, requests, responses
+
+def recipe_speech_text(recipe):
+    """
+    Build the text the frontend sends to the TTS endpoints for a recipe.
+
+    Args:
+        recipe (dict): The parsed recipe.
+
+    Returns:
+        str: The ingredients and instructions, in the layout of the frontend.
+    """
+    def plain(line):
+        # The frontend speaks the rendered list items, without markers or emphasis
+        line = re.sub(r"^\s*(?:[-*+]|\d+[.)])\s+", "", line)
+        return re.sub(r"[*_`]", "", line).strip()
+
+    text = "Ingredients: "
+    for line in recipe['ingredients']:
+        text += plain(line) + ";"
+    text += "\n Instructions: \n"
+    for line in recipe['instructions']:
+        text += plain(line) + "\n"
+    return text
+
+class WarmupJob:
+    """
+    Pre-warms the recipe and audio caches with the most frequent requests of the logs.
+
+    The recipes of the top requests are taken from their logged responses when
+    available, and generated otherwise. Their audio is then synthesized into the
+    audio cache. A few requests are warmed at the same time, so the job does
+    not take over the upstream quota of the live traffic.
+    """
+
+    def __init__(self, recipe_generator, tts_service=None, log_dir="logs", top=50, max_concurrency=2, voice="Ethan"):
+        """
+        Initialize the WarmupJob.
+
+        Args:
+            recipe_generator (RecipeGenerator): The generator whose cache is warmed. It needs a cache.
+            tts_service (TTSService, optional): The service whose audio cache is warmed. If None, no audio is synthesized.
+            log_dir (str, optional): Directory of the logs. Defaults to "logs".
+            top (int, optional): Number of most frequent requests to warm. Defaults to 50.
+            max_concurrency (int, optional): Number of requests warmed at the same time. Defaults to 2.
+            voice (str, optional): The voice of the audio. Defaults to "Ethan".
+        """
+        if recipe_generator.cache is None:
+            raise ValueError("Warming up requires a recipe cache")
+
+        self.recipe_generator = recipe_generator
+        self.tts_service = tts_service if tts_service is not None and tts_service.audio_cache is not None else None
+        self.log_dir = log_dir
+        self.top = top
+        self.max_concurrency = max(1, max_concurrency)
+        self.voice = voice
+
+    def run(self):
+        """
+        Warm the caches.
+
+        Returns:
+            dict: A report of the warmed requests and of the hit rates the logged
+                requests would have had before and after the warm-up.
+        """
+        counts, requests, responses = mine_requests(self.recipe_generator, self.log_dir)
+        total = sum(counts.values())
+
+        def hit_rate():
+            hits = sum(count for key, count in counts.items() if self._lookup(requests[key], key) is not None)
+            return hits / total if total else 0.0
+
+        report = {
+            'logged_requests': total,
+            'distinct_requests': len(counts),
+            'reused': 0,
+            'near': 0,
+            'generated': 0,
+            'failed': 0,
+            'audio_segments': 0,
+            'audio_segments_cached': 0,
+            'audio_failed': 0,
+            'recipe_hit_rate_before': hit_rate(),
+        }
+
+        top = [key for key, _ in counts.most_common(self.top)]
+        lock = threading.Lock()
+
+        def warm(key):
+            try:
+                outcome, content = self._warm_recipe(requests[key], key, responses.get(key))
+            except Exception as e:
+                logger.warning(f"Failed to warm recipe {key}: {str(e)}")
+                outcome, content = 'failed', None
+
+            cached = segments = failed = 0
+            if self.tts_service is not None and content is not None:
+                try:
+                    recipe = self.recipe_generator._parse_recipe_response(content)
+                    cached, segments = self.tts_service.prefetch(recipe_speech_text(recipe), self.voice)
+                except Exception as e:
+                    logger.warning(f"Failed to warm audio {key}: {str(e)}")
+                    failed = 1
+
+            with lock:
+                report[outcome] += 1
+                report['audio_segments_cached'] += cached
+                report['audio_segments'] += segments
+                report['audio_failed'] += failed
+
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            list(executor.map(warm, top))
+
+        report['warmed'] = report['reused'] + report['near'] + report['generated']
+        report['recipe_hit_rate_after'] = hit_rate()
+        return report
+
+    def _lookup(self, request, key):
+        """
+        Find the response a request would be served without an LLM call.
+
+        Args:
+            request (tuple): The (ingredients, dietary_preference, goal, profile) of the request.
+            key (str): The cache key of the request.
+
+        Returns:
+            tuple: The response text and whether it is a near match, or None.
+        """
+        content = self.recipe_generator.cache.get(key)
+        if content is not None:
+            return content, False
+
+        index = self.recipe_generator.similarity_index
+        match = index.lookup(*request) if index is not None else None
+        if match is not None:
+            return match[0], True
+        return None
+
+    def _warm_recipe(self, request, key, response=None):
+        """
+        Make sure a request is served without an LLM call.
+
+        Args:
+            request (tuple): The (ingredients, dietary_preference, goal, profile) of the request.
+            key (str): The cache key of the request.
+            response (str, optional): The logged response text of the request.
+
+        Returns:
+            tuple: How the recipe was obtained ("reused", "near" or "generated"), and its text.
+        """
+        found = self._lookup(request, key)
+        if found is not None:
+            content, near = found
+            return ('near' if near else 'reused'), content
+
+        ingredients, dietary_preference, goal, profile = request
+        if response is not None:
+            # The logged response is stored like a freshly generated one
+            self.recipe_generator._store(response, key, request)
+            return 'reused', response
+
+        self.recipe_generator.generate_recipe(ingredients, dietary_preference, goal, profile=profile)
+        return 'generated', self.recipe_generator.cache.get(key)
+
+def spawn_warmup(top=50, max_concurrency=2, log_dir="logs"):
+    """
+    Run the warm-up in a separate process, e.g. on server startup.
+
+    The process warms the shared audio cache and merges its recipes into the
+    persisted recipe cache, where the workers of the server find them. It does
+    not share the threads or upstream connections of the server, and it exits
+    at once if another warm-up is already running.
+
+    Args:
+        top (int, optional): Number of most frequent requests to warm. Defaults to 50.
+        max_concurrency (int, optional): Number of requests warmed at the same time. Defaults to 2.
+        log_dir (str, optional): Directory of the logs. Defaults to "logs".
+
+    Returns:
+        subprocess.Popen: The started process.
+    """
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [ROOT, os.getenv("PYTHONPATH")])))
+    return subprocess.Popen([sys.executable, "-m", "app.warmup", "--logs", log_dir, "--top", str(top),
+                             "--concurrency", str(max_concurrency)], env=env)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Pre-warm the recipe and audio caches from the request logs.")
+    parser.add_argument("--logs", default="logs", help="Directory of the logs (default: logs)")
+    parser.add_argument("--top", type=int, default=50, help="Number of most frequent requests to warm (default: 50)")
+    parser.add_argument("--concurrency", type=int, default=2, help="Requests warmed at the same time (default: 2)")
+    parser.add_argument("--no-audio", action="store_true", help="Only warm the recipe cache")
+    parser.add_argument("--lock", default=os.path.join("cache", "warmup.lock"),
+                        help="File locked while the warm-up runs, so that it runs once at a time (default: cache/warmup.lock)")
+    args = parser.parse_args()
+
+    # Every server process started at the same time, e.g. the workers of uvicorn, may start a warm-up
+    os.makedirs(os.path.dirname(args.lock) or ".", exist_ok=True)
+    # Held until the process exits
+    lock = open(args.lock, 'w')
+    if fcntl is not None:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            print(f"Another warm-up holds {args.lock}, skipping")
+            sys.exit(0)
+
+    # The services of the server, configured by the same environment variables
+    from server.services import get_services
+    services = get_services()
+
+    report = WarmupJob(
+        services.recipe_generator,
+        None if args.no_audio else services.tts_service,
+        log_dir=args.logs,
+        top=args.top,
+        max_concurrency=args.concurrency,
+    ).run()
+
+    print(f"Logged requests: {report['logged_requests']} ({report['distinct_requests']} distinct)")
+    print(f"Warmed: {report['warmed']} (reused {report['reused']}, near matches {report['near']}, "
+          f"generated {report['generated']}), failed: {report['failed']}")
+    print(f"Recipe hit rate of the logged requests: {report['recipe_hit_rate_before']:.1%} -> {report['recipe_hit_rate_after']:.1%}")
+    if report['audio_segments']:
+        print(f"Audio segments: {report['audio_segments'] - report['audio_segments_cached']} synthesized, "
+              f"{report['audio_segments_cached']} already cached, {report['audio_failed']} recipes failed")
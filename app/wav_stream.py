@@ -0,0 +1,173 @@
+import struct
+
+# Size field used for RIFF and data chunks whose final length is unknown while streaming
+STREAMING_SIZE = 0xFFFFFFFF
+
+# Size of the canonical 44 byte PCM WAV header
+WAV_HEADER_SIZE = 44
+
+class WavFormatError(Exception):
+    """
+    Raised when audio data is not a PCM WAV file that can be parsed.
+    """
+
+def wav_header(channels, sample_width, framerate, data_size=None, audio_format=1):
+    """
+    Build a canonical WAV header.
+
+    Args:
+        channels (int): Number of channels.
+        sample_width (int): Sample width in bytes.
+        framerate (int): Sample rate in Hz.
+        data_size (int, optional): Size of the audio frames in bytes. If None, the
+            streaming convention is used and both sizes are set to 0xFFFFFFFF.
+        audio_format (int, optional): The WAV format tag, 1 for PCM or 7 for μ-law. Defaults to 1.
+
+    Returns:
+        bytes: The 44 byte header.
+    """
+    if data_size is None:
+        riff_size = data_size = STREAMING_SIZE
+    else:
+        riff_size = data_size + WAV_HEADER_SIZE - 8
+
+    block_align = channels * sample_width
+    return struct.pack(
+        '<4sI4s4sIHHIIHH4sI',
+        b'RIFF', riff_size, b'WAVE',
+        b'fmt ', 16, audio_format, channels, framerate, framerate * block_align, block_align, sample_width * 8,
+        b'data', data_size,
+    )
+
+def _locate_data(view):
+    """
+    Find the format and the data chunk of a PCM WAV file.
+
+    Args:
+        view (memoryview): The start of the WAV file, from its RIFF header.
+
+    Returns:
+        tuple: A (params, offset, size) tuple with the format, the offset of the
+            frames and the size field of the data chunk, or None if the view ends
+            before the data chunk starts.
+    """
+    params = None
+    offset = 12
+    while offset + 8 <= len(view):
+        chunk_id = bytes(view[offset:offset + 4])
+        chunk_size = struct.unpack_from('<I', view, offset + 4)[0]
+        body = offset + 8
+
+        if chunk_id == b'fmt ':
+            if body + 16 > len(view):
+                return None
+            audio_format, channels, framerate, _, _, bits = struct.unpack_from('<HHIIHH', view, body)
+            if audio_format != 1:
+                raise WavFormatError(f"Unsupported WAV encoding: {audio_format}")
+            params = {'channels': channels, 'sample_width': bits // 8, 'framerate': framerate}
+        elif chunk_id == b'data':
+            if params is None:
+                raise WavFormatError("WAV data chunk before fmt chunk")
+            return params, body, chunk_size
+
+        # Chunks are padded to an even size
+        offset = body + chunk_size + (chunk_size & 1)
+
+    return None
+
+def parse_wav(data):
+    """
+    Locate the format and frames of a PCM WAV file without copying the frames.
+
+    Args:
+        data (bytes): The WAV file content.
+
+    Returns:
+        tuple: A (params, frames) tuple where params is a dict with channels,
+            sample_width and framerate, and frames is a memoryview of the audio frames.
+    """
+    view = memoryview(data)
+    if len(view) < 12 or view[0:4] != b'RIFF' or view[8:12] != b'WAVE':
+        raise WavFormatError("Not a WAV file")
+
+    located = _locate_data(view)
+    if located is None:
+        raise WavFormatError("WAV file has no data chunk")
+
+    # Streamed files may have a placeholder size, the frames then run to the end
+    params, body, size = located
+    end = len(view) if size == STREAMING_SIZE else min(body + size, len(view))
+    return params, view[body:end]
+
+class WavStreamReader:
+    """
+    Separates the frames of one streamed audio file from its WAV header, if it has one.
+
+    An upstream audio stream is either raw PCM or a WAV file sent in pieces. A
+    header is buffered until its data chunk starts, which is usually within the
+    first chunk. From then on the frames are returned as memoryview slices of
+    the incoming chunks, so stripping the header never copies the audio.
+    """
+
+    def __init__(self, default_params):
+        """
+        Initialize the WavStreamReader.
+
+        Args:
+            default_params (dict): The channels, sample_width and framerate of a stream without header.
+        """
+        self.default_params = default_params
+
+        # The format of the stream, known once its header or its first bytes arrived
+        self.params = None
+
+        self._pending = b""
+        # Bytes left in the data chunk, None if it runs to the end of the stream
+        self._remaining = None
+
+    def feed(self, chunk):
+        """
+        Add the next chunk of the stream.
+
+        Args:
+            chunk (bytes-like): The chunk.
+
+        Returns:
+            memoryview: The audio frames of the chunk, possibly empty.
+        """
+        if self.params is not None:
+            return self._frames(memoryview(chunk))
+
+        # Only a header split across chunks is ever joined
+        view = memoryview(self._pending + bytes(chunk) if self._pending else chunk).cast('B')
+
+        if bytes(view[:4]) != b'RIFF'[:len(view[:4])]:
+            self.params = self.default_params
+            self._pending = b""
+            return view
+
+        located = None
+        if len(view) >= 12:
+            if view[8:12] != b'WAVE':
+                raise WavFormatError("Not a WAV file")
+            located = _locate_data(view)
+
+        if located is None:
+            self._pending = bytes(view)
+            return view[:0]
+
+        self.params, body, size = located
+        self._pending = b""
+        # Streaming encoders leave the data size at a placeholder
+        self._remaining = None if size in (0, STREAMING_SIZE) else size
+        return self._frames(view[body:])
+
+    def _frames(self, view):
+        """
+        Limit frames to the data chunk, dropping trailing chunks of the file.
+        """
+        if self._remaining is None:
+            return view
+        size = min(len(view), self._remaining)
+        self._remaining -= size
+        return view[:size]
@@ -0,0 +1,88 @@
+"""
+Microbenchmark of the streamed TTS audio path.
+
+Compares the previous path, which base64-decodes every upstream chunk and
+writes it on its own, with the ChunkCoalescer, which copies the decoded
+chunks into fixed-size frames. Every output is written to a local socket,
+like a response writer would, and the number of bytes objects created along
+the way is counted.
+
+Usage:
+    python benchmarks/bench_audio_buffer.py [chunk_bytes] [frame_bytes]
+"""
+import os
+import sys
+import time
+import base64
+import socket
+import threading
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.audio_buffer import ChunkCoalescer
+
+# One minute of 24 kHz, 16-bit mono audio
+AUDIO_SECONDS = 60
+BYTES_PER_SECOND = 24000 * 2
+
+def make_chunks(chunk_bytes):
+    audio = os.urandom(AUDIO_SECONDS * BYTES_PER_SECOND)
+    return [base64.b64encode(audio[i:i + chunk_bytes]).decode() for i in range(0, len(audio), chunk_bytes)]
+
+def current_path(chunks, counter):
+    for chunk in chunks:
+        counter[0] += 1
+        yield base64.b64decode(chunk)
+
+def coalesced_path(chunks, frame_bytes, counter):
+    coalescer = ChunkCoalescer(frame_size=frame_bytes, max_latency=0.05)
+    for chunk in chunks:
+        # One temporary decoded chunk, plus one object per emitted frame
+        frames = coalescer.feed_base64(chunk)
+        counter[0] += 1 + len(frames)
+        yield from frames
+    frame = coalescer.flush()
+    if frame:
+        counter[0] += 1
+        yield frame
+
+def drain(sock):
+    while sock.recv(1 << 20):
+        pass
+
+def measure(name, make_writes, rounds=5):
+    """
+    Write a path to a socket and report its throughput, writes and allocations.
+    """
+    best = None
+    for _ in range(rounds):
+        writer, reader = socket.socketpair()
+        drainer = threading.Thread(target=drain, args=(reader,))
+        drainer.start()
+
+        counter = [0]
+        total = writes = 0
+        start = time.perf_counter()
+        for data in make_writes(counter):
+            writer.sendall(data)
+            total += len(data)
+            writes += 1
+        elapsed = time.perf_counter() - start
+
+        writer.close()
+        drainer.join()
+        reader.close()
+        best = elapsed if best is None else min(best, elapsed)
+
+    print(f"{name:<10} {total / best / 1e6:8.1f} MB/s {writes:7d} writes {counter[0]:7d} bytes objects")
+
+def main():
+    chunk_bytes = int(sys.argv[1]) if len(sys.argv) > 1 else 960
+    frame_bytes = int(sys.argv[2]) if len(sys.argv) > 2 else 8192
+    chunks = make_chunks(chunk_bytes)
+
+    print(f"{AUDIO_SECONDS}s of audio in {len(chunks)} chunks of {chunk_bytes} bytes, frames of {frame_bytes} bytes")
+    measure("current", lambda counter: current_path(chunks, counter))
+    measure("coalesced", lambda counter: coalesced_path(chunks, frame_bytes, counter))
+
+if __name__ == '__main__':
+    main()
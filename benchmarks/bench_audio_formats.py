@@ -0,0 +1,61 @@
+"""
+Benchmark of the TTS output formats: the bytes sent per second of speech and
+the CPU time the conversion costs per second of speech.
+
+A minute of speech-like 24 kHz 16-bit mono audio is fed to the AudioConverter
+in the 100 ms chunks of the streaming API, like /api/stream-tts does.
+
+Usage:
+    python benchmarks/bench_audio_formats.py [seconds] [chunk_bytes]
+"""
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.audio_formats import AudioConverter, OUTPUT_FORMATS
+
+SAMPLE_RATE = 24000
+
+def speech_like(seconds, rng):
+    """
+    Build a voiced signal with a wandering pitch, formant-like harmonics, syllable envelope and noise.
+    """
+    t = np.arange(seconds * SAMPLE_RATE) / SAMPLE_RATE
+    pitch = 120 + 30 * np.sin(2 * np.pi * 0.5 * t)
+    phase = 2 * np.pi * np.cumsum(pitch) / SAMPLE_RATE
+    signal = sum(np.sin(k * phase) / k for k in range(1, 30))
+    signal *= 0.5 + 0.5 * np.sin(2 * np.pi * 4 * t) ** 2
+    signal += 0.05 * rng.standard_normal(len(t))
+    return (signal / np.abs(signal).max() * 20000).astype('<i2').tobytes()
+
+def main():
+    seconds = int(sys.argv[1]) if len(sys.argv) > 1 else 60
+    chunk_bytes = int(sys.argv[2]) if len(sys.argv) > 2 else 4800
+
+    audio = speech_like(seconds, np.random.default_rng(0))
+    chunks = [audio[start:start + chunk_bytes] for start in range(0, len(audio), chunk_bytes)]
+    params = {'channels': 1, 'sample_width': 2, 'framerate': SAMPLE_RATE}
+    print(f"{seconds} s of 24 kHz 16-bit mono speech in {len(chunks)} chunks of {chunk_bytes} bytes")
+    print(f"{'format':<10} {'bytes/s':>9} {'kbit/s':>8} {'of wav':>7} {'CPU ms/s':>9} {'x realtime':>11}")
+
+    for audio_format in OUTPUT_FORMATS:
+        best = None
+        for _ in range(5):
+            converter = AudioConverter(params, audio_format)
+            size = 0
+            start = time.process_time()
+            for chunk in chunks:
+                size += len(converter.convert(chunk))
+            elapsed = time.process_time() - start
+            best = elapsed if best is None else min(best, elapsed)
+
+        bytes_per_second = (size + len(converter.header())) / seconds
+        cpu_per_second = best / seconds
+        print(f"{audio_format:<10} {bytes_per_second:>9.0f} {bytes_per_second * 8 / 1000:>8.0f} "
+              f"{bytes_per_second / (len(audio) / seconds):>7.0%} {cpu_per_second * 1000:>9.3f} "
+              f"{1 / max(cpu_per_second, 1e-9):>11.0f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,201 @@
+"""
+Benchmark of the cancellation of streaming requests whose client disconnects.
+
+The Flask app, and the ASGI app if uvicorn is installed, is served on a local
+port against the fake backend. Every streaming endpoint is requested once to
+the end, and then by clients that close the connection after the first chunk.
+For the cancelled requests, the time from the disconnect until the server
+closed the response and until the fake backend had no call in progress is
+reported, along with the upstream time, segments and tokens they did not spend.
+
+Usage:
+    python benchmarks/bench_cancellation.py [runs]
+
+The FAKE_* environment variables set the simulated upstream latencies.
+"""
+import io
+import os
+import sys
+import json
+import time
+import socket
+import logging
+import contextlib
+import tempfile
+import threading
+import statistics
+import http.client
+import importlib.util
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+os.environ.setdefault("RECIPE_GEN_BACKEND", "fake")
+os.environ.setdefault("FAKE_FIRST_TOKEN_LATENCY", "0.05")
+os.environ.setdefault("FAKE_CHUNK_INTERVAL", "0.02")
+os.environ.setdefault("FAKE_TTS_LATENCY", "0.2")
+os.environ.setdefault("FAKE_TTS_CHUNK_INTERVAL", "0.02")
+# Every request must reach the upstream, not a recipe generated for a similar one
+os.environ.setdefault("RECIPE_SIMILARITY_THRESHOLD", "0")
+os.chdir(tempfile.mkdtemp())
+
+from werkzeug.serving import make_server
+from app import metrics
+from server.app import create_app
+from server.services import get_services
+
+# Seconds a cancelled request may take to release its upstream calls before it counts as leaked
+RELEASE_TIMEOUT = 30.0
+
+_counter = iter(range(10 ** 9))
+
+def unique_text(sentences):
+    n = next(_counter)
+    return "\n".join(f"Step {step}: cook the vegetables of batch {n} for {step + 2} minutes, then stir well."
+                     for step in range(sentences))
+
+def unique_ingredients():
+    return ["chicken breast", "rice", f"herb mix {next(_counter)}"]
+
+# About 7 seconds of streamed audio, and 10 segments synthesized a few at a time
+ENDPOINTS = [
+    ("/api/stream-recipe", "stream_recipe", lambda: {"ingredients": unique_ingredients()}),
+    ("/api/stream-tts", "stream_tts", lambda: {"text": unique_text(8)}),
+    ("/api/stream-text-to-speech", "stream_text_to_speech", lambda: {"text": unique_text(60)}),
+]
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def start_flask():
+    port = free_port()
+    server = make_server("127.0.0.1", port, create_app(), threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return port, server.shutdown
+
+def start_asgi():
+    import uvicorn
+    from server.asgi import app
+
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+
+    def stop():
+        server.should_exit = True
+    return port, stop
+
+def post(port, path, payload):
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=RELEASE_TIMEOUT)
+    connection.request("POST", path, json.dumps(payload), {"Content-Type": "application/json"})
+    return connection, connection.getresponse()
+
+def counter_value(counter, *labels):
+    return counter.collect().get(labels, 0)
+
+def wait_for(condition):
+    """
+    Poll a condition, returning the seconds until it held or None on timeout.
+    """
+    start = time.perf_counter()
+    while time.perf_counter() - start < RELEASE_TIMEOUT:
+        if condition():
+            return time.perf_counter() - start
+        time.sleep(0.002)
+    return None
+
+def complete_request(port, path, payload):
+    """
+    Read a response to the end.
+
+    Returns:
+        tuple: Seconds to the first chunk and to the end.
+    """
+    start = time.perf_counter()
+    connection, response = post(port, path, payload)
+    response.read1(65536)
+    first = time.perf_counter() - start
+    response.read()
+    connection.close()
+    return first, time.perf_counter() - start
+
+def cancelled_request(port, path, endpoint, payload, backend):
+    """
+    Read the first chunk of a response, disconnect, and wait until the server let go of the request.
+
+    Returns:
+        tuple: Seconds from the disconnect until the response was closed and until no upstream call was left.
+    """
+    cancelled = counter_value(metrics.HTTP_STREAMS_CANCELLED, endpoint)
+    connection, response = post(port, path, payload)
+    response.read1(65536)
+
+    # Like a browser closing the tab, the socket is closed without reading the rest
+    response.close()
+    connection.close()
+
+    start = time.perf_counter()
+    closed = wait_for(lambda: counter_value(metrics.HTTP_STREAMS_CANCELLED, endpoint) > cancelled)
+    released = wait_for(lambda: backend.in_progress == 0)
+    if released is not None:
+        released = time.perf_counter() - start
+    return closed, released
+
+def saved_work():
+    return {
+        "budget tokens": counter_value(metrics.LLM_CANCELLED_TOKENS, "budget_left"),
+        "stream segments": counter_value(metrics.TTS_SEGMENTS_SKIPPED, "stream"),
+        "url segments": counter_value(metrics.TTS_SEGMENTS_SKIPPED, "url"),
+        "upstream streams": sum(metrics.UPSTREAM_CANCELLED.collect().values()),
+    }
+
+def milliseconds(values):
+    if any(value is None for value in values):
+        return f"{'timeout':>9}"
+    return f"{statistics.median(values) * 1000:>9.0f}"
+
+def run(name, port, runs, backend):
+    print(f"{name}, median of {runs} runs")
+    print(f"{'endpoint':<30} {'first ms':>9} {'full ms':>9} {'closed ms':>9} {'freed ms':>9} {'saved ms':>9}")
+    for path, endpoint, payload in ENDPOINTS:
+        # The server prints every TTS request
+        with contextlib.redirect_stdout(io.StringIO()):
+            complete = [complete_request(port, path, payload()) for _ in range(runs)]
+            cancelled = [cancelled_request(port, path, endpoint, payload(), backend) for _ in range(runs)]
+
+        first = statistics.median(result[0] for result in complete)
+        full = statistics.median(result[1] for result in complete)
+        released = [result[1] for result in cancelled]
+        saved = full - first - statistics.median(released) if None not in released else 0.0
+        print(f"{path:<30} {first * 1000:>9.0f} {full * 1000:>9.0f} {milliseconds([result[0] for result in cancelled])} "
+              f"{milliseconds(released)} {saved * 1000:>9.0f}")
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+
+    # The request and cancellation logs of every run would drown the results
+    logging.disable(logging.INFO)
+
+    backend = get_services().recipe_generator.backend
+    servers = [("Flask (WSGI)", start_flask)]
+    if importlib.util.find_spec("uvicorn") is not None:
+        servers.append(("ASGI", start_asgi))
+    else:
+        print("uvicorn is not installed, skipping the ASGI server")
+
+    for name, start in servers:
+        port, stop = start()
+        try:
+            run(name, port, runs, backend)
+        finally:
+            stop()
+
+    print("work not done by the cancelled requests: " +
+          ", ".join(f"{value:.0f} {name}" for name, value in saved_work().items()))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+"""
+Microbenchmarks of the pure-Python hot paths: prompt construction, recipe
+parsing and TTS text segmentation.
+
+Usage:
+    python benchmarks/bench_core.py
+"""
+import os
+import sys
+import timeit
+import tempfile
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.fake_backend import FakeBackend
+from app.recipe_generator import RecipeGenerator
+from app.tts_service import TTSService
+
+INGREDIENTS = ["chicken breast", "spinach", "tomatoes", "garlic", "lemon", "feta cheese"]
+
+def report(name, func, number):
+    """
+    Time a function and print the mean time per call.
+    """
+    best = min(timeit.repeat(func, number=number, repeat=5))
+    print(f"{name:<32} {best / number * 1e6:10.2f} us/call")
+
+def main():
+    log_dir = tempfile.mkdtemp()
+    backend = FakeBackend()
+    generator = RecipeGenerator(log_dir=log_dir, backend=backend)
+    tts_service = TTSService(log_dir=log_dir, backend=backend)
+
+    # Keep the per-call segmentation log line out of the measurement
+    tts_service.logger.logger.disabled = True
+
+    prompt = generator._construct_prompt(INGREDIENTS, "low-carb", "muscle gain")
+    recipe_text = backend.generation_call(messages=[{"role": "user", "content": prompt}]).output.choices[0].message.content
+    long_text = "\n".join([recipe_text] * 10)
+
+    report("_construct_prompt", lambda: generator._construct_prompt(INGREDIENTS, "low-carb", "muscle gain"), 20000)
+    report("_parse_recipe_response", lambda: generator._parse_recipe_response(recipe_text), 5000)
+    report("_parse_recipe_response (10x)", lambda: generator._parse_recipe_response(long_text), 500)
+    report("_split_text", lambda: tts_service._split_text(recipe_text), 5000)
+    report("_split_text (10x)", lambda: tts_service._split_text(long_text), 500)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""
+End-to-end benchmark of the API endpoints against the local fake backend.
+
+The server is imported with RECIPE_GEN_BACKEND=fake inside a temporary working
+directory, so no API key is needed and no cache or log files are left behind.
+Every request uses a different ingredient list to avoid recipe and audio cache
+hits. Latency percentiles and throughput are reported per endpoint.
+
+Usage:
+    python benchmarks/bench_endpoints.py [requests] [concurrency]
+
+The FAKE_* environment variables set the simulated upstream latencies.
+"""
+import io
+import os
+import sys
+import time
+import logging
+import contextlib
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+os.environ.setdefault("RECIPE_GEN_BACKEND", "fake")
+os.environ.setdefault("FAKE_FIRST_TOKEN_LATENCY", "0.05")
+os.environ.setdefault("FAKE_CHUNK_INTERVAL", "0.002")
+os.environ.setdefault("FAKE_TTS_LATENCY", "0.05")
+os.environ.setdefault("FAKE_TTS_CHUNK_INTERVAL", "0.005")
+os.chdir(tempfile.mkdtemp())
+
+from server.app import create_app
+
+INGREDIENTS = ["chicken breast", "salmon", "tofu", "spinach", "tomatoes", "rice", "quinoa", "broccoli",
+               "garlic", "lemon", "mushrooms", "bell pepper", "feta cheese", "chickpeas", "sweet potato"]
+
+_counter = iter(range(10 ** 9))
+_counter_lock = threading.Lock()
+
+def unique_ingredients():
+    """
+    Return an ingredient list that has not been requested before.
+    """
+    with _counter_lock:
+        n = next(_counter)
+    picked = [INGREDIENTS[(n + step * 7) % len(INGREDIENTS)] for step in range(3)]
+    return picked + [f"herb mix {n}"]
+
+def unique_text():
+    ingredients = unique_ingredients()
+    return f"Ingredients: {';'.join(ingredients)};\n Instructions: \nCook the {ingredients[0]} for 5 minutes.\n"
+
+ENDPOINTS = [
+    ("/api/generate-recipe", lambda: {"ingredients": unique_ingredients()}),
+    ("/api/stream-recipe", lambda: {"ingredients": unique_ingredients()}),
+    ("/api/stream-recipe (events)", lambda: {"ingredients": unique_ingredients(), "events": True}),
+    ("/api/speak-recipe", lambda: {"ingredients": unique_ingredients()}),
+    ("/api/text-to-speech", lambda: {"text": unique_text()}),
+    ("/api/stream-text-to-speech", lambda: {"text": unique_text()}),
+    ("/api/stream-tts", lambda: {"text": unique_text()}),
+    ("/api/download-tts", lambda: {"text": unique_text()}),
+]
+
+def request_once(client, path, payload):
+    """
+    Send one request and read the whole response.
+
+    Returns:
+        float: The latency in seconds.
+    """
+    start = time.perf_counter()
+    response = client.post(path, json=payload, buffered=True)
+    if response.status_code != 200:
+        raise RuntimeError(f"{path} returned {response.status_code}: {response.data[:200]!r}")
+    response.close()
+    return time.perf_counter() - start
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def run(name, make_payload, requests, concurrency):
+    path = name.split(" ")[0]
+    client = create_app().test_client()
+
+    # The server prints every request, keep that out of the report
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()), ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = list(executor.map(lambda _: request_once(client, path, make_payload()), range(requests)))
+    elapsed = time.perf_counter() - start
+
+    print(f"{name:<32} p50 {percentile(latencies, 0.5) * 1e3:8.1f} ms   "
+          f"p95 {percentile(latencies, 0.95) * 1e3:8.1f} ms   {requests / elapsed:8.1f} req/s")
+
+def main():
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 40
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+
+    logging.disable(logging.INFO)
+
+    print(f"{requests} requests per endpoint, {concurrency} concurrent")
+    for name, make_payload in ENDPOINTS:
+        run(name, make_payload, requests, concurrency)
+
+if __name__ == '__main__':
+    main()
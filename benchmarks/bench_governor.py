@@ -0,0 +1,62 @@
+"""
+Benchmark of the upstream governor against a throttling upstream.
+
+The fake backend throttles every call beyond a fixed number in progress,
+like a DashScope concurrency quota. Many clients then generate recipes at
+the same time, once with calls passed straight through and once paced by
+the adaptive governor, and the completed and failed requests are compared.
+
+Usage:
+    python benchmarks/bench_governor.py [requests] [clients] [quota]
+"""
+import os
+import sys
+import time
+import logging
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# The array log format serializes the request threads, keep it out of the measurement
+os.environ.setdefault("LLM_LOG_FORMAT", "jsonl")
+
+from app.fake_backend import FakeBackend
+from app.governor import UpstreamGovernor
+from app.recipe_generator import RecipeGenerator
+
+def run(name, governor, requests, clients, quota):
+    backend = FakeBackend(first_token_latency=0.05, chunk_interval=0.001, max_concurrent=quota)
+    generator = RecipeGenerator(log_dir=tempfile.mkdtemp(), backend=backend, governor=governor)
+
+    def request(index):
+        try:
+            generator.generate_recipe([f"ingredient {index}", "rice"])
+            return True
+        except Exception:
+            return False
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as executor:
+        results = list(executor.map(request, range(requests)))
+    elapsed = time.perf_counter() - start
+
+    completed = sum(results)
+    print(f"{name:<14} completed {completed:5d}   failed {requests - completed:5d}   "
+          f"{completed / elapsed:7.1f} recipes/s   final limit {governor.limit}")
+
+def main():
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 400
+    clients = int(sys.argv[2]) if len(sys.argv) > 2 else 32
+    quota = int(sys.argv[3]) if len(sys.argv) > 3 else 8
+
+    logging.disable(logging.INFO)
+    print(f"{requests} requests from {clients} clients, upstream quota of {quota} calls in progress")
+
+    passthrough = UpstreamGovernor("passthrough", initial_concurrency=clients, min_concurrency=clients,
+                                   max_concurrency=clients, max_retries=0, latency_tolerance=0)
+    run("passthrough", passthrough, requests, clients, quota)
+    run("governor", UpstreamGovernor("governor", seed=0), requests, clients, quota)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+"""
+Benchmark of the log analytics: a month of synthetic array-format logs is
+queried by loading every file with json.load, then converted once into
+columnar partitions and queried again.
+
+Usage:
+    python benchmarks/bench_log_analytics.py [days] [calls_per_day]
+"""
+import os
+import sys
+import json
+import time
+import random
+import datetime
+import tempfile
+import statistics
+from collections import Counter
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.log_analytics import convert_logs, LogStore
+
+FOODS = ["chicken breast", "salmon", "tofu", "rice", "spinach", "tomatoes", "garlic", "quinoa", "broccoli",
+         "eggs", "beef", "lentils", "sweet potato", "avocado", "feta cheese", "mushrooms"]
+SYSTEM = ("You are a helpful cooking assistant that creates recipes based on available ingredients and dietary "
+          "preferences. You also provide nutritional analysis and suggestions for modifications.")
+RECIPE = "# Grilled Chicken Bowl\n\n## Ingredients\n- 300g chicken breast\n" + "Cook it well and season to taste.\n" * 30
+
+def write_logs(log_dir, days, calls_per_day, rng):
+    """
+    Write pretty-printed JSON array logs like LLMLogger, with the start and end entry of every call.
+    """
+    first_day = datetime.datetime(2024, 1, 1)
+    for day in range(days):
+        date = first_day + datetime.timedelta(days=day)
+        generation, tts = [], []
+        for call in range(calls_per_day):
+            start = date + datetime.timedelta(seconds=call * 86400 / calls_per_day)
+            prompt = f"Create a recipe using these ingredients: {', '.join(rng.sample(FOODS, 3))}. Please provide the following information:\n"
+            messages = [{"role": "system", "content": SYSTEM}, {"role": "user", "content": prompt}]
+            end = start + datetime.timedelta(seconds=rng.lognormvariate(1, 0.4))
+            output = {"error": "Throttling.RateQuota - Requests rate limit exceeded"} if rng.random() < 0.02 else {"content": RECIPE}
+            generation.append({"timestamp": start.isoformat(), "type": "text_generation", "model": "qwen-turbo", "input": messages, "output": None})
+            generation.append({"timestamp": end.isoformat(), "type": "text_generation", "model": "qwen-turbo", "input": messages, "output": output})
+
+            text = f"Segment {call}: " + "Season the chicken with salt and pepper. " * 8
+            voice = rng.choice(["Ethan", "Chelsie", "Cherry"])
+            end = start + datetime.timedelta(seconds=rng.lognormvariate(0, 0.3))
+            tts.append({"timestamp": start.isoformat(), "type": "tts", "model": "qwen-tts", "voice": voice, "input": text})
+            tts.append({"timestamp": end.isoformat(), "type": "tts", "model": "qwen-tts", "voice": voice, "input": text,
+                        "output_url": f"https://example.com/{day}/{call}.wav"})
+
+        stamp = date.strftime('%Y%m%d')
+        for log_type, entries in (("text_generation", generation), ("tts", tts)):
+            with open(os.path.join(log_dir, f"{log_type}_{stamp}.json"), 'w', encoding='utf-8') as f:
+                json.dump(entries, f, ensure_ascii=False, indent=2)
+
+def naive_queries(log_dir):
+    """
+    Answer the queries the way it was done before: load every file whole and aggregate in Python.
+    """
+    latencies, starts, ingredients = [], {}, Counter()
+    for name in sorted(os.listdir(log_dir)):
+        if not name.endswith(".json"):
+            continue
+        with open(os.path.join(log_dir, name), 'r', encoding='utf-8') as f:
+            entries = json.load(f)
+        for entry in entries:
+            if entry["type"] == "tts":
+                key = (entry["input"], entry["voice"])
+                if "output_url" in entry:
+                    started = starts.pop(key)
+                    latencies.append((datetime.datetime.fromisoformat(entry["timestamp"]) - started).total_seconds())
+                else:
+                    starts[key] = datetime.datetime.fromisoformat(entry["timestamp"])
+            elif entry["output"] is None:
+                prompt = entry["input"][1]["content"]
+                ingredients.update(prompt.split(": ", 1)[1].split(".")[0].split(", "))
+    return statistics.quantiles(latencies, n=20)[-1], ingredients.most_common(5)
+
+def main():
+    days = int(sys.argv[1]) if len(sys.argv) > 1 else 30
+    calls_per_day = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+
+    log_dir = tempfile.mkdtemp()
+    write_logs(log_dir, days, calls_per_day, random.Random(0))
+    size = sum(os.path.getsize(os.path.join(log_dir, name)) for name in os.listdir(log_dir))
+    print(f"{days} days, {days * calls_per_day} calls per type, {size / 1e6:.0f} MB of logs")
+
+    start = time.perf_counter()
+    p95, _ = naive_queries(log_dir)
+    print(f"{'json.load, p95 + ingredients':<36} {time.perf_counter() - start:8.2f} s   (p95 {p95 * 1000:.0f} ms)")
+
+    start = time.perf_counter()
+    convert_logs(log_dir)
+    print(f"{'convert to columnar (once)':<36} {time.perf_counter() - start:8.2f} s")
+
+    out_dir = os.path.join(log_dir, "columnar")
+    size = sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(out_dir) for name in names)
+    print(f"{'columnar size':<36} {size / 1e6:8.1f} MB")
+
+    start = time.perf_counter()
+    convert_logs(log_dir)
+    print(f"{'convert again (nothing changed)':<36} {time.perf_counter() - start:8.3f} s")
+
+    store = LogStore(out_dir)
+    queries = [
+        ("p95 TTS latency", lambda: store.latency_percentiles("tts")),
+        ("calls per voice", lambda: store.counts_by("tts", "voice")),
+        ("top ingredients", lambda: store.ingredient_frequencies(top=5)),
+        ("hourly generation error rate", lambda: store.error_rates("text_generation", "hour")),
+    ]
+    for name, query in queries:
+        start = time.perf_counter()
+        result = query()
+        elapsed = time.perf_counter() - start
+        detail = f"(p95 {result['p95'] * 1000:.0f} ms)" if name.startswith("p95") else ""
+        print(f"{name:<36} {elapsed * 1000:8.1f} ms  {detail}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+"""
+Benchmark of LLMLogger writes in the array (json) and JSON-Lines (jsonl) formats.
+
+Reports the time a request thread spends per log call as the daily file grows.
+
+Usage:
+    python benchmarks/bench_logger.py [entries]
+"""
+import os
+import sys
+import time
+import logging
+import tempfile
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.llm_logger import LLMLogger
+
+MESSAGES = [
+    {"role": "system", "content": "You are a helpful cooking assistant."},
+    {"role": "user", "content": "Create a recipe using these ingredients: chicken breast, spinach, tomatoes."},
+]
+
+def measure(log_format, entries):
+    logger = LLMLogger(log_dir=tempfile.mkdtemp(), log_format=log_format)
+    logger.logger.setLevel(logging.WARNING)
+
+    checkpoints = {entries // 10, entries // 2, entries}
+    start = time.perf_counter()
+    for index in range(1, entries + 1):
+        logger.log_text_generation(input_data=MESSAGES, output_data={"content": "x" * 1500}, model="qwen-turbo")
+        if index in checkpoints:
+            now = time.perf_counter()
+            print(f"{log_format:<6} entries {index:6d}: {(now - start) / index * 1e6:10.1f} us/call on average")
+
+    flush_start = time.perf_counter()
+    logger.flush()
+    print(f"{log_format:<6} flush: {(time.perf_counter() - flush_start) * 1e3:.1f} ms")
+
+def main():
+    entries = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    measure("json", entries)
+    measure("jsonl", entries)
+
+if __name__ == '__main__':
+    main()
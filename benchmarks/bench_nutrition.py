@@ -0,0 +1,69 @@
+"""
+Benchmark of the local nutrition engine: time per recipe, with and without
+memoized name lookups, and batch throughput.
+
+Usage:
+    python benchmarks/bench_nutrition.py [--recipes 5000]
+"""
+import os
+import sys
+import time
+import random
+import timeit
+import argparse
+import tempfile
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.fake_backend import FakeBackend
+from app.nutrition import NutritionTable
+from app.recipe_generator import RecipeGenerator
+
+INGREDIENT_LINES = [
+    "200g chicken breast, diced", "1 cup rice", "2 tbsp olive oil", "3 cloves garlic, minced",
+    "1 can (about 400g) chopped tomatoes", "2 large eggs", "1/2 cup milk", "100g feta cheese",
+    "2 cups fresh spinach", "1 medium onion", "1 lemon", "Salt to taste", "1 lb ground beef",
+    "2-3 medium carrots", "1 tsp ground cumin", "150g quinoa", "1 avocado", "50g almonds",
+    "4 boneless chicken thighs", "1 1/2 cups broccoli florets", "2 tbsp butter", "1 sweet potato",
+]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--recipes", type=int, default=5000)
+    args = parser.parse_args()
+
+    # Ingredient lines as the fake LLM writes them
+    generator = RecipeGenerator(log_dir=tempfile.mkdtemp(), backend=FakeBackend())
+    prompt = generator._construct_prompt(["chicken breast", "spinach", "tomatoes", "garlic", "lemon"], None, None)
+    content = generator.backend.generation_call(messages=[{"role": "user", "content": prompt}]).output.choices[0].message.content
+    generated = generator._parse_recipe_response(content)['ingredients']
+
+    rng = random.Random(0)
+    recipes = [rng.sample(INGREDIENT_LINES, rng.randint(5, 12)) for _ in range(args.recipes)]
+
+    number = 2000
+    table = NutritionTable.load()
+    best = min(timeit.repeat(lambda: table.analyze(generated), number=number, repeat=5))
+    print(f"{'analyze (generated recipe)':<32} {best / number * 1e6:10.2f} us/recipe")
+
+    # Every call parses the lines and resolves the names from scratch
+    def analyze_cold():
+        table._lookup_cache.clear()
+        table._line_cache.clear()
+        table.analyze(generated)
+
+    best = min(timeit.repeat(analyze_cold, number=200, repeat=5))
+    print(f"{'analyze (uncached lookups)':<32} {best / 200 * 1e6:10.2f} us/recipe")
+
+    start = time.perf_counter()
+    for recipe in recipes:
+        table.analyze(recipe)
+    elapsed = time.perf_counter() - start
+    print(f"{'analyze (one by one)':<32} {len(recipes) / elapsed:10.0f} recipes/s")
+
+    start = time.perf_counter()
+    table.analyze_batch(recipes)
+    elapsed = time.perf_counter() - start
+    print(f"{'analyze_batch':<32} {len(recipes) / elapsed:10.0f} recipes/s")
+
+if __name__ == '__main__':
+    main()
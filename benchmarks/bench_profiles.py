@@ -0,0 +1,58 @@
+"""
+Benchmark of time to first token and total generation time per generation profile.
+
+Runs against the local fake backend by default. Set RECIPE_GEN_BACKEND=dashscope
+and DASHSCOPE_API_KEY to measure the real API instead.
+
+Usage:
+    python benchmarks/bench_profiles.py [requests]
+"""
+import os
+import sys
+import time
+import logging
+import tempfile
+import statistics
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.backends import get_backend
+from app.recipe_generator import RecipeGenerator
+
+INGREDIENTS = ["chicken breast", "salmon", "tofu", "spinach", "tomatoes", "rice", "quinoa", "broccoli"]
+
+def measure(generator, profile, index):
+    """
+    Stream one recipe.
+
+    Returns:
+        tuple: Time to first chunk and total time in seconds, and the number of characters.
+    """
+    ingredients = [INGREDIENTS[index % len(INGREDIENTS)], INGREDIENTS[(index + 3) % len(INGREDIENTS)], f"herb mix {index}"]
+
+    start = time.perf_counter()
+    first = None
+    length = 0
+    for chunk in generator.generate_recipe(ingredients, "high-protein", "muscle gain", stream=True, profile=profile):
+        if first is None:
+            first = time.perf_counter() - start
+        length += len(chunk)
+    return first, time.perf_counter() - start, length
+
+def main():
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+
+    logging.disable(logging.INFO)
+    backend = get_backend(os.getenv("RECIPE_GEN_BACKEND", "fake"))
+    generator = RecipeGenerator(log_dir=tempfile.mkdtemp(), backend=backend)
+
+    print(f"{requests} streamed recipes per profile on the {os.getenv('RECIPE_GEN_BACKEND', 'fake')} backend")
+    for profile, max_tokens in RecipeGenerator.PROFILES.items():
+        results = [measure(generator, profile, index) for index in range(requests)]
+        first = statistics.median(result[0] for result in results)
+        total = statistics.median(result[1] for result in results)
+        length = statistics.median(result[2] for result in results)
+        print(f"{profile:<8} max_tokens {max_tokens:5d}   first chunk {first * 1e3:7.1f} ms   "
+              f"total {total * 1e3:7.1f} ms   {length:6.0f} characters")
+
+if __name__ == '__main__':
+    main()
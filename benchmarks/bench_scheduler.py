@@ -0,0 +1,143 @@
+"""
+Benchmark of the request scheduler under overload, with and without admission control.
+
+Two scenarios run against the fake backend, whose upstream capacity is fixed
+by the governors, each in a fresh interpreter with the scheduler disabled and
+enabled:
+
+- greedy: one client loops /api/generate-recipe from many threads while two
+  polite clients send one request at a time. Reports the latency of the polite
+  clients, the throughput of the greedy one and the requests shed.
+- bulk: one client loops /api/download-tts from many threads while two
+  listeners request /api/stream-tts. Reports the time to the first audio chunk
+  of the listeners.
+
+Clients are told apart by an X-Client-Id header.
+
+Usage:
+    python benchmarks/bench_scheduler.py [seconds] [greedy_threads]
+"""
+import os
+import sys
+import json
+import time
+import tempfile
+import threading
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ENV = dict(os.environ, PYTHONPATH=ROOT, RECIPE_GEN_BACKEND="fake", RECIPE_SIMILARITY_THRESHOLD="0",
+           FAKE_FIRST_TOKEN_LATENCY="0.2", FAKE_CHUNK_INTERVAL="0.002", FAKE_TTS_LATENCY="0.1",
+           FAKE_TTS_CHUNK_INTERVAL="0.005",
+           # A fixed upstream capacity of 8 calls per API, and a scheduler of the same size
+           UPSTREAM_CONCURRENCY="8", UPSTREAM_MAX_CONCURRENCY="8", UPSTREAM_QUEUE_TIMEOUT="120",
+           SCHEDULER_MAX_ACTIVE="8", SCHEDULER_CLIENT_HEADER="X-Client-Id")
+
+def percentile(values, fraction):
+    if not values:
+        return float('nan')
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+def run_scenario(scenario, seconds, greedy_threads):
+    """
+    Run a scenario in this interpreter and print its results as JSON.
+    """
+    import io
+    import logging
+    import contextlib
+    os.chdir(tempfile.mkdtemp())
+    logging.disable(logging.INFO)
+
+    from server.app import create_app
+    app = create_app()
+
+    counter = iter(range(10 ** 9))
+    counter_lock = threading.Lock()
+    stop = threading.Event()
+    results = {"latency": [], "statuses": {}, "greedy": 0}
+    results_lock = threading.Lock()
+
+    def unique():
+        with counter_lock:
+            return next(counter)
+
+    def request(client, path, payload, first_chunk=False):
+        start = time.perf_counter()
+        response = app.test_client().post(path, json=payload, headers={"X-Client-Id": client}, buffered=False)
+        chunks = iter(response.response)
+        if first_chunk:
+            next(chunks, None)
+        elapsed = time.perf_counter() - start
+        for _ in chunks:
+            pass
+        response.close()
+        with results_lock:
+            results["statuses"][f"{client} {response.status_code}"] = \
+                results["statuses"].get(f"{client} {response.status_code}", 0) + 1
+        return response.status_code, elapsed
+
+    def greedy():
+        while not stop.is_set():
+            if scenario == "greedy":
+                status, _ = request("greedy", "/api/generate-recipe", {"ingredients": ["rice", f"herb {unique()}"]})
+            else:
+                text = "\n".join(f"Step {step} of batch {unique()}: simmer and stir." for step in range(40))
+                status, _ = request("greedy", "/api/download-tts", {"text": text})
+            if status == 200:
+                with results_lock:
+                    results["greedy"] += 1
+            else:
+                # A shed request is retried after a short pause, like a client honoring Retry-After loosely
+                time.sleep(0.05)
+
+    def polite(name):
+        while not stop.is_set():
+            if scenario == "greedy":
+                status, elapsed = request(name, "/api/generate-recipe", {"ingredients": ["tofu", f"leek {unique()}"]})
+            else:
+                status, elapsed = request(name, "/api/stream-tts", {"text": f"Serve dish {unique()} warm."},
+                                          first_chunk=True)
+            if status == 200:
+                with results_lock:
+                    results["latency"].append(elapsed)
+            time.sleep(0.2)
+
+    threads = [threading.Thread(target=greedy) for _ in range(greedy_threads)]
+    threads += [threading.Thread(target=polite, args=(f"polite-{n}",)) for n in range(2)]
+    with contextlib.redirect_stdout(io.StringIO()):
+        for thread in threads:
+            thread.start()
+        time.sleep(seconds)
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+    print(json.dumps(results))
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "--run":
+        run_scenario(sys.argv[2], float(sys.argv[3]), int(sys.argv[4]))
+        return
+
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 10
+    greedy_threads = int(sys.argv[2]) if len(sys.argv) > 2 else 24
+
+    print(f"{seconds:.0f} s per run, {greedy_threads} greedy threads, upstream capacity 8 calls per API")
+    print(f"{'scenario':<9} {'scheduler':<10} {'polite p50':>11} {'polite p95':>11} {'polite n':>9} "
+          f"{'greedy/s':>9}  shed")
+    for scenario in ("greedy", "bulk"):
+        for enabled in (False, True):
+            env = dict(ENV, SCHEDULER_MAX_ACTIVE=ENV["SCHEDULER_MAX_ACTIVE"] if enabled else "0")
+            output = subprocess.run([sys.executable, __file__, "--run", scenario, str(seconds), str(greedy_threads)],
+                                    env=env, capture_output=True, text=True, check=True)
+            result = json.loads(output.stdout.strip().splitlines()[-1])
+            latency = result["latency"]
+            shed = {key: count for key, count in result["statuses"].items() if not key.endswith(" 200")}
+            print(f"{scenario:<9} {'on' if enabled else 'off':<10} {percentile(latency, 0.5) * 1000:>8.0f} ms "
+                  f"{percentile(latency, 0.95) * 1000:>8.0f} ms {len(latency):>9} {result['greedy'] / seconds:>9.1f}  "
+                  f"{', '.join(f'{key}: {count}' for key, count in sorted(shed.items())) or '-'}")
+
+if __name__ == '__main__':
+    main()
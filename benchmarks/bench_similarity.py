@@ -0,0 +1,79 @@
+"""
+Benchmark of the near-duplicate request index: lookup time as the number of
+stored requests grows, compared with a linear scan, and the share of slightly
+changed requests that find their original.
+
+Usage:
+    python benchmarks/bench_similarity.py [max_entries]
+"""
+import os
+import sys
+import time
+import random
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.similarity_index import SimilarityIndex
+
+FOODS = [
+    "chicken breast", "chicken thigh", "salmon", "tuna", "shrimp", "tofu", "tempeh", "beef", "pork", "lamb",
+    "egg", "spinach", "kale", "broccoli", "cauliflower", "carrot", "zucchini", "eggplant", "bell pepper",
+    "onion", "garlic", "ginger", "tomato", "potato", "sweet potato", "rice", "quinoa", "pasta", "oats",
+    "lentil", "chickpea", "black bean", "feta cheese", "parmesan", "yogurt", "milk", "butter", "olive oil",
+    "lemon", "lime", "avocado", "mushroom", "pea", "corn", "cucumber", "lettuce", "cabbage", "apple",
+    "banana", "almond", "walnut", "peanut butter", "coconut milk", "soy sauce", "honey", "basil", "cilantro",
+]
+GARNISHES = ["parsley", "chives", "sesame seeds", "mint", "dill"]
+PREFERENCES = [None, "vegan", "low-carb", "high-protein"]
+
+def random_request(rng):
+    return rng.sample(FOODS, rng.randint(4, 8)), rng.choice(PREFERENCES)
+
+def lookup_time(lookup, queries):
+    start = time.perf_counter()
+    for ingredients, preference in queries:
+        lookup(ingredients, preference)
+    return (time.perf_counter() - start) / len(queries)
+
+def main():
+    max_entries = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    rng = random.Random(0)
+
+    index = SimilarityIndex(max_entries=max_entries)
+    stored = []
+    queries = [random_request(rng) for _ in range(1000)]
+
+    print(f"{'entries':>8} {'index us/lookup':>16} {'scan us/lookup':>15}")
+    for size in sorted({min(size, max_entries) for size in (1000, 10000, 100000, max_entries)}):
+        while len(stored) < size:
+            ingredients, preference = random_request(rng)
+            index.add(ingredients, "recipe", preference)
+            stored.append((SimilarityIndex.ingredient_words(ingredients), SimilarityIndex.partition(preference)))
+
+        def scan(ingredients, preference):
+            items = SimilarityIndex.ingredient_words(ingredients)
+            partition = SimilarityIndex.partition(preference)
+            return max((SimilarityIndex.similarity(items, other) for other, other_partition in stored
+                        if other_partition == partition), default=0)
+
+        # The scan is slow, time fewer queries as the index grows
+        scan_queries = queries[:max(10, 100000 // size)]
+        print(f"{size:>8} {lookup_time(index.lookup, queries) * 1e6:>16.1f} {lookup_time(scan, scan_queries) * 1e6:>15.1f}")
+
+    # Requests with one extra garnish, or one plural changed, should find their original
+    recall = SimilarityIndex()
+    originals = [random_request(rng) for _ in range(2000)]
+    for ingredients, preference in originals:
+        recall.add(ingredients, "recipe", preference)
+
+    hits = expected = 0
+    for ingredients, preference in originals:
+        changed = ingredients + [rng.choice(GARNISHES)] if rng.random() < 0.5 else [item + "s" for item in ingredients]
+        similarity = SimilarityIndex.similarity(SimilarityIndex.ingredient_words(changed),
+                                                SimilarityIndex.ingredient_words(ingredients))
+        expected += similarity >= recall.threshold
+        hits += recall.lookup(changed, preference) is not None
+    print(f"near matches: {hits} found, {expected} above the threshold, of {len(originals)} requests "
+          f"with a garnish added or plurals changed")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+"""
+Benchmark of the server start-up: import time, the first request of a process
+with and without preloading, and a gunicorn cold start.
+
+Every measurement runs in a fresh interpreter on the fake backend, so nothing
+is cached between runs. The gunicorn part compares the memory of the workers
+forked from a preloaded master with workers that each load the app.
+
+Usage:
+    python benchmarks/bench_startup.py [runs] [workers]
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import socket
+import tempfile
+import importlib.util
+import statistics
+import subprocess
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ENV = dict(os.environ, PYTHONPATH=ROOT, RECIPE_GEN_BACKEND="fake", FAKE_FIRST_TOKEN_LATENCY="0",
+           FAKE_CHUNK_INTERVAL="0", FAKE_TTS_LATENCY="0", FAKE_TTS_CHUNK_INTERVAL="0")
+
+# Runs in a fresh interpreter and prints its timings as JSON
+PROBE = '''
+import sys, json, time, logging
+start = time.perf_counter()
+from server.app import create_app
+from server.services import preload
+imported = time.perf_counter()
+logging.disable(logging.INFO)
+heavy = {name: name in sys.modules for name in ("dashscope", "requests")}
+if PRELOAD:
+    preload()
+preloaded = time.perf_counter()
+client = create_app().test_client()
+created = time.perf_counter()
+client.post("/api/generate-recipe", json={"ingredients": ["chicken", "rice"]})
+first = time.perf_counter()
+client.post("/api/generate-recipe", json={"ingredients": ["tofu", "rice"]})
+second = time.perf_counter()
+print(json.dumps({"import": imported - start, "preload": preloaded - imported, "create_app": created - preloaded,
+                  "first_request": first - created, "second_request": second - first, "heavy": heavy}))
+'''
+
+SDK_PROBE = '''
+import json, time
+start = time.perf_counter()
+from app.backends import preload_backend
+preload_backend("dashscope")
+print(json.dumps({"sdk": time.perf_counter() - start}))
+'''
+
+def probe(code, workdir, **replace):
+    for name, value in replace.items():
+        code = code.replace(name, repr(value))
+    output = subprocess.run([sys.executable, "-c", code], cwd=workdir, env=ENV, capture_output=True, text=True, check=True)
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+def median(results, key):
+    return statistics.median(result[key] for result in results) * 1000
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def children(pid):
+    with open(f"/proc/{pid}/task/{pid}/children") as f:
+        return [int(child) for child in f.read().split()]
+
+def pss_kb(pid):
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            if line.startswith("Pss:"):
+                return int(line.split()[1])
+    return 0
+
+def gunicorn_start(workdir, workers, preload):
+    """
+    Start gunicorn, wait for its first response, and measure the memory of its processes once every worker served.
+
+    Returns:
+        tuple: Seconds to the first response and the total PSS of master and workers in MB.
+    """
+    port = free_port()
+    command = [sys.executable, "-m", "gunicorn", "server.wsgi:app", "-c", os.path.join(ROOT, "gunicorn.conf.py"),
+               "--bind", f"127.0.0.1:{port}", "--workers", str(workers), "--access-logfile", "/dev/null"]
+    env = dict(ENV, GUNICORN_PRELOAD="1" if preload else "0")
+
+    start = time.perf_counter()
+    server = subprocess.Popen(command, cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        url = f"http://127.0.0.1:{port}/api/generate-recipe"
+        ready = None
+        for attempt in range(2000):
+            try:
+                request = urllib.request.Request(url, data=json.dumps({"ingredients": [f"kale {attempt}"]}).encode(),
+                                                 headers={"Content-Type": "application/json"})
+                urllib.request.urlopen(request, timeout=5).read()
+                if ready is None:
+                    ready = time.perf_counter() - start
+                # Keep sending until every worker created its services
+                if attempt > workers * 20:
+                    break
+            except OSError:
+                time.sleep(0.01)
+
+        pids = [server.pid] + children(server.pid)
+        return ready, sum(pss_kb(pid) for pid in pids) / 1024
+    finally:
+        server.terminate()
+        server.wait()
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+
+    workdir = tempfile.mkdtemp()
+    try:
+        lazy = [probe(PROBE, workdir, PRELOAD=False) for _ in range(runs)]
+        preloaded = [probe(PROBE, workdir, PRELOAD=True) for _ in range(runs)]
+        sdk = [probe(SDK_PROBE, workdir) for _ in range(runs)]
+
+        print(f"median of {runs} fresh interpreters, fake backend")
+        print(f"{'import server.app':<40} {median(lazy, 'import'):8.1f} ms   "
+              f"(dashscope loaded: {lazy[0]['heavy']['dashscope']}, requests loaded: {lazy[0]['heavy']['requests']})")
+        print(f"{'create_app()':<40} {median(lazy, 'create_app'):8.1f} ms")
+        print(f"{'first request, services created':<40} {median(lazy, 'first_request'):8.1f} ms")
+        print(f"{'second request':<40} {median(lazy, 'second_request'):8.1f} ms")
+        print(f"{'preload() before forking':<40} {median(preloaded, 'preload'):8.1f} ms")
+        print(f"{'first request after preload()':<40} {median(preloaded, 'first_request'):8.1f} ms")
+        print(f"{'DashScope SDK import, preloaded':<40} {median(sdk, 'sdk'):8.1f} ms")
+
+        if importlib.util.find_spec("gunicorn") is None:
+            print("gunicorn is not installed, skipping the cold start")
+            return
+
+        for preload in (True, False):
+            ready, memory = gunicorn_start(workdir, workers, preload)
+            name = f"gunicorn {workers} workers, {'preloaded' if preload else 'no preload'}"
+            print(f"{name:<40} {ready * 1000:8.1f} ms to first response, {memory:6.1f} MB PSS in total")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""
+Benchmark of the cache warm-up: the recipe and audio hit rates and latency of
+a restarted server, with and without warming it from the request logs first.
+
+A history of requests with a few popular ingredient combinations is written
+to the logs by the fake backend, then the same kind of traffic is replayed
+against fresh caches, cold and after a warm-up.
+
+Usage:
+    python benchmarks/bench_warmup.py [history] [replayed] [top]
+"""
+import os
+import sys
+import time
+import random
+import logging
+import tempfile
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.fake_backend import FakeBackend
+from app.recipe_generator import RecipeGenerator
+from app.recipe_cache import RecipeCache
+from app.tts_service import TTSService
+from app.audio_cache import AudioCache
+from app.warmup import WarmupJob, recipe_speech_text
+
+FOODS = ["chicken breast", "salmon", "tofu", "rice", "spinach", "tomatoes", "garlic", "quinoa", "broccoli",
+         "eggs", "beef", "lentils", "sweet potato", "avocado", "feta cheese", "mushrooms"]
+
+def sample_traffic(rng, combinations, count):
+    """
+    Draw requests with a long-tailed popularity, a few combinations account for most of them.
+    """
+    weights = [1 / (rank + 1) for rank in range(len(combinations))]
+    return rng.choices(combinations, weights=weights, k=count)
+
+def services(workdir, backend):
+    generator = RecipeGenerator(log_dir=os.path.join(workdir, "logs"), backend=backend,
+                                cache=RecipeCache(max_entries=1000))
+    tts_service = TTSService(log_dir=os.path.join(workdir, "logs"), backend=backend,
+                             audio_cache=AudioCache(cache_dir=os.path.join(workdir, "audio"), url_prefix="/audio/"))
+    return generator, tts_service
+
+def replay(generator, tts_service, traffic):
+    """
+    Serve a recipe and its audio URLs for every request.
+
+    Returns:
+        tuple: The recipe hit rate, the audio segment hit rate and the mean latency in seconds.
+    """
+    recipe_hits = audio_hits = segments = 0
+    start = time.perf_counter()
+    for ingredients in traffic:
+        key = RecipeCache.make_key(ingredients)
+        recipe_hits += generator.cache.get(key) is not None
+        recipe = generator.generate_recipe(ingredients)
+
+        recipe_segments = tts_service._split_text(recipe_speech_text(recipe))
+        for segment in recipe_segments:
+            audio_hits += tts_service.audio_cache.contains(tts_service.audio_cache.make_key(segment, "Ethan", "qwen-tts"))
+        segments += len(recipe_segments)
+        list(tts_service.iter_segment_urls(recipe_segments, "Ethan"))
+    return recipe_hits / len(traffic), audio_hits / max(1, segments), (time.perf_counter() - start) / len(traffic)
+
+def main():
+    history = int(sys.argv[1]) if len(sys.argv) > 1 else 400
+    replayed = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    top = int(sys.argv[3]) if len(sys.argv) > 3 else 20
+
+    logging.disable(logging.INFO)
+    rng = random.Random(0)
+    combinations = [rng.sample(FOODS, 3) for _ in range(100)]
+    backend = FakeBackend(first_token_latency=0.05, chunk_interval=0.0005, tts_latency=0.05)
+
+    workdir = tempfile.mkdtemp()
+
+    # Every historical request reaches the LLM and is logged
+    generator = RecipeGenerator(log_dir=os.path.join(workdir, "logs"), backend=backend)
+    for ingredients in sample_traffic(rng, combinations, history):
+        generator.generate_recipe(ingredients)
+    generator.logger.flush()
+
+    traffic = sample_traffic(rng, combinations, replayed)
+    print(f"{history} logged requests, {replayed} replayed requests, top {top} warmed")
+    print(f"{'':<10} {'recipe hits':>12} {'audio hits':>11} {'latency ms':>11}")
+
+    cold = tempfile.mkdtemp()
+    recipe_rate, audio_rate, latency = replay(*services(cold, backend), traffic)
+    print(f"{'cold':<10} {recipe_rate:>12.1%} {audio_rate:>11.1%} {latency * 1000:>11.1f}")
+
+    warm = tempfile.mkdtemp()
+    generator, tts_service = services(warm, backend)
+    start = time.perf_counter()
+    report = WarmupJob(generator, tts_service, log_dir=os.path.join(workdir, "logs"), top=top, max_concurrency=4).run()
+    elapsed = time.perf_counter() - start
+    recipe_rate, audio_rate, latency = replay(generator, tts_service, traffic)
+    print(f"{'warmed':<10} {recipe_rate:>12.1%} {audio_rate:>11.1%} {latency * 1000:>11.1f}")
+    print(f"warm-up took {elapsed:.1f} s: {report['warmed']} recipes, "
+          f"{report['audio_segments'] - report['audio_segments_cached']} audio segments")
+
+if __name__ == '__main__':
+    main()
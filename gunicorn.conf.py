@@ -0,0 +1,40 @@
+"""
+Production serving configuration, read by gunicorn from the working directory:
+
+    gunicorn server.wsgi:app
+
+Every setting can be overridden on the command line, e.g. --workers 8.
+"""
+import os
+import multiprocessing
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:5000")
+
+# Worker processes, WEB_CONCURRENCY like most platforms set it, or one per CPU
+workers = int(os.getenv("WEB_CONCURRENCY", str(multiprocessing.cpu_count())))
+
+# Streaming responses hold a thread while they wait for upstream chunks, so each worker serves many at once
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", "32"))
+
+# Load server.wsgi once in the master and fork the workers from it, GUNICORN_PRELOAD=0 loads it in every worker
+preload_app = os.getenv("GUNICORN_PRELOAD", "1") == "1"
+
+# Workers are only restarted when they stop responding, long streams keep their thread busy but not the worker
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "60"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+keepalive = 5
+
+accesslog = "-"
+
+_warmup = None
+
+def when_ready(server):
+    # The master starts the warm-up once, however many workers it forks and restarts
+    global _warmup
+    from server.services import start_warmup
+    _warmup = start_warmup()
+
+def on_exit(server):
+    if _warmup is not None and _warmup.poll() is None:
+        _warmup.terminate()
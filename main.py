@@ -4,9 +4,13 @@ import sys
 # Add the current directory to the Python path
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-# Import the Flask app
-from server.app import app
+# Import the Flask app factory
+from server.app import create_app
+from server.services import start_warmup
 
 if __name__ == '__main__':
-    # Run the Flask app
-    app.run(debug=True, host='0.0.0.0', port=5000)
+    # Run the development server, see server/wsgi.py for production
+    if not os.environ.get("WERKZEUG_RUN_MAIN"):
+        # Once in the reloader process, not on every reload
+        start_warmup()
+    create_app().run(debug=True, host='0.0.0.0', port=5000)
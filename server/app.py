@@ -1,30 +1,129 @@
-import logging
 import os
 import json
-import tempfile
-from flask import Flask, request, jsonify, send_file, render_template, Response, stream_with_context
+import logging
+import contextlib
+from flask import Flask, Blueprint, request, jsonify, send_file, render_template, Response, stream_with_context, g
 
 # Import the core functionality from the app package
 import sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from app.recipe_generator import RecipeGenerator
-from app.tts_service import TTSService
+from app.audio_cache import AudioCache
+from app.audio_formats import OUTPUT_FORMATS
+from app.recipe_parser import IncrementalRecipeParser
+from app import metrics
+from app.governor import UpstreamThrottled, governor_status
+from app.scheduler import Overloaded, SCHEDULED_ENDPOINTS, get_scheduler, client_identity
+from server.services import get_services, BATCH_MAX_CONCURRENCY
+
+# The routes, registered on the app by create_app
+routes = Blueprint('recipes', __name__)
+
+# The services of the process, created on the first request that uses them
+services = get_services()
+
+logger = logging.getLogger("Server")
+
+def create_app():
+    """
+    Create the Flask application.
+
+    No service is created here, each process creates its own on first use,
+    so the app can be loaded once before the worker processes are forked.
 
-# Initialize Flask app
-app = Flask(__name__, 
-            static_folder='../frontend/static',
-            template_folder='../frontend/templates')
+    Returns:
+        Flask: The application.
+    """
+    app = Flask(__name__,
+                static_folder='../frontend/static',
+                template_folder='../frontend/templates')
+    app.register_blueprint(routes)
+    return app
+
+def count_stream_errors(chunks, endpoint, admission=None):
+    """
+    Count the exceptions and client disconnects that end a streaming response after its headers were sent.
 
-# Initialize services
-recipe_generator = RecipeGenerator()
-tts_service = TTSService()
+    The WSGI server closes the response as soon as a write to a disconnected
+    client fails, and the close reaches the upstream iterators of the route.
+    The server writes every chunk while this generator is suspended, so the
+    scheduler slot of the request is lent out meanwhile.
+    """
+    waiting_on_client = admission.waiting_on_client if admission is not None else contextlib.nullcontext
+    sent = 0
+    try:
+        for chunk in chunks:
+            with waiting_on_client():
+                yield chunk
+            sent += 1
+    except GeneratorExit:
+        metrics.HTTP_STREAMS_CANCELLED.inc(endpoint)
+        logger.debug(f"Client disconnected from {endpoint} after {sent} chunks, cancelling the request")
+        close = getattr(chunks, 'close', None)
+        if close is not None:
+            close()
+        raise
+    except Exception:
+        metrics.HTTP_STREAM_ERRORS.inc(endpoint)
+        raise
+
+def error_response(e):
+    """
+    Build the JSON response of a failed request.
 
-@app.route('/')
+    Throttling by the upstream API is reported as 429 with a Retry-After
+    header, so clients back off instead of treating it as a server error.
+    A request shed by the scheduler gets its 429 or 503 with a Retry-After.
+    """
+    if isinstance(e, (UpstreamThrottled, Overloaded)):
+        response = jsonify({"error": str(e)})
+        response.headers["Retry-After"] = str(e.retry_after)
+        return response, getattr(e, 'status', 429)
+    return jsonify({"error": str(e)}), 500
+
+def endpoint_name():
+    """The endpoint of the request without the blueprint name, as used in metrics and by the scheduler."""
+    return (request.endpoint or "unmatched").rpartition(".")[2]
+
+@routes.before_app_request
+def admit_request():
+    """Wait for the request scheduler before running an expensive endpoint, or shed the request."""
+    endpoint_class = SCHEDULED_ENDPOINTS.get(endpoint_name())
+    scheduler = get_scheduler() if endpoint_class else None
+    if scheduler is None:
+        return None
+
+    try:
+        g.admission = scheduler.admit(endpoint_class, client_identity(request.headers, request.remote_addr))
+    except Overloaded as e:
+        return error_response(e)
+    return None
+
+@routes.teardown_app_request
+def release_request(error):
+    """Give the scheduler slot back once the response is complete, after the end of a stream."""
+    admission = g.pop('admission', None)
+    if admission is not None:
+        admission.release()
+
+@routes.after_app_request
+def record_request(response):
+    """Count every response by endpoint and status."""
+    endpoint = endpoint_name()
+    metrics.HTTP_REQUESTS.inc(endpoint, str(response.status_code))
+
+    # Files sent with send_file are passed through untouched
+    if response.is_streamed and not response.direct_passthrough:
+        response.response = count_stream_errors(response.response, endpoint, g.get('admission'))
+
+    return response
+
+@routes.route('/')
 def index():
     """Render the main page."""
     return render_template('index.html')
 
-@app.route('/favicon.ico')
+@routes.route('/favicon.ico')
 def favicon():
     """
     Handle favicon.ico requests.
@@ -32,7 +131,17 @@ def favicon():
     """
     return '', 204
 
-@app.route('/api/generate-recipe', methods=['POST'])
+@routes.route('/metrics')
+def metrics_page():
+    """Report the request, upstream and logging metrics in the Prometheus text format."""
+    return Response(metrics.REGISTRY.render(), content_type=metrics.CONTENT_TYPE)
+
+@routes.route('/api/upstream-status')
+def upstream_status():
+    """Report the current limits, calls in flight and queue depth of the upstream governors."""
+    return jsonify(governor_status())
+
+@routes.route('/api/generate-recipe', methods=['POST'])
 def generate_recipe():
     """
     Generate a recipe based on the provided ingredients and preferences.
@@ -41,7 +150,8 @@ def generate_recipe():
     {
         "ingredients": ["ingredient1", "ingredient2", ...],
         "dietary_preference": "optional preference",
-        "goal": "optional goal"
+        "goal": "optional goal",
+        "profile": "optional, full (default), concise or compact"
     }
     """
     try:
@@ -49,21 +159,26 @@ def generate_recipe():
         ingredients = data.get('ingredients', [])
         dietary_preference = data.get('dietary_preference')
         goal = data.get('goal')
+        profile = data.get('profile', 'full')
 
         if not ingredients:
             return jsonify({"error": "No ingredients provided"}), 400
 
-        recipe = recipe_generator.generate_recipe(
+        if profile not in RecipeGenerator.PROFILES:
+            return jsonify({"error": f"Unknown profile: {profile}"}), 400
+
+        recipe = services.recipe_generator.generate_recipe(
             ingredients=ingredients,
             dietary_preference=dietary_preference,
-            goal=goal
+            goal=goal,
+            profile=profile
         )
 
         return jsonify(recipe)
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return error_response(e)
 
-@app.route('/api/stream-recipe', methods=['POST'])
+@routes.route('/api/stream-recipe', methods=['POST'])
 def stream_recipe():
     """
     Stream a recipe generation response.
@@ -72,33 +187,218 @@ def stream_recipe():
     {
         "ingredients": ["ingredient1", "ingredient2", ...],
         "dietary_preference": "optional preference",
-        "goal": "optional goal"
+        "goal": "optional goal",
+        "profile": "optional, full (default), concise or compact",
+        "events": "optional, true to also send structured recipe events"
     }
+
+    With "events", a {"event": {"type": ..., "value": ...}} message follows the
+    chunk that completes each recipe name, ingredient, instruction, nutrition
+    field (with a "field") or suggestion line, and a final "nutrition_facts"
+    event carries the nutrition computed from the ingredients.
     """
     try:
         data = request.json
         ingredients = data.get('ingredients', [])
         dietary_preference = data.get('dietary_preference')
         goal = data.get('goal')
+        profile = data.get('profile', 'full')
+        send_events = bool(data.get('events'))
 
         if not ingredients:
             return jsonify({"error": "No ingredients provided"}), 400
 
+        if profile not in RecipeGenerator.PROFILES:
+            return jsonify({"error": f"Unknown profile: {profile}"}), 400
+
         def generate():
-            for chunk in recipe_generator.generate_recipe(
+            parser = IncrementalRecipeParser() if send_events else None
+
+            with contextlib.closing(services.recipe_generator.generate_recipe(
                 ingredients=ingredients,
                 dietary_preference=dietary_preference,
                 goal=goal,
-                stream=True
-            ):
-                yield f"data: {json.dumps({'chunk': chunk})}\n\n"
+                stream=True,
+                profile=profile
+            )) as chunks:
+                for chunk in chunks:
+                    yield f"data: {json.dumps({'chunk': chunk})}\n\n"
+
+                    if parser is not None:
+                        for event in parser.feed(chunk):
+                            yield f"data: {json.dumps({'event': event})}\n\n"
+
+            if parser is not None:
+                for event in parser.close():
+                    yield f"data: {json.dumps({'event': event})}\n\n"
+
+                facts = services.recipe_generator.nutrition_table.analyze(parser.recipe['ingredients'])
+                yield f"data: {json.dumps({'event': {'type': 'nutrition_facts', 'value': facts}})}\n\n"
 
         return Response(stream_with_context(generate()), 
                        content_type='text/event-stream')
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return error_response(e)
+
+@routes.route('/api/generate-recipes', methods=['POST'])
+def generate_recipes():
+    """
+    Generate many recipes concurrently and stream each result as soon as it is ready.
+
+    Expected JSON payload:
+    {
+        "items": [
+            {"ingredients": [...], "dietary_preference": "optional", "goal": "optional", "profile": "optional"},
+            ...
+        ],
+        "profile": "optional, profile of the items that do not name one, full (default), concise or compact",
+        "max_concurrency": "optional, capped by the server limit"
+    }
+
+    Returns:
+    A stream of JSON lines in completion order, each containing the index of the
+    item and its recipe ({"index": ..., "recipe": ...}) or error ({"index": ..., "error": ...}),
+    followed by an end signal.
+    """
+    try:
+        data = request.json
+        items = data.get('items', [])
+        profile = data.get('profile', 'full')
+
+        try:
+            max_concurrency = min(int(data.get('max_concurrency', BATCH_MAX_CONCURRENCY)), BATCH_MAX_CONCURRENCY)
+        except (TypeError, ValueError):
+            return jsonify({"error": "Invalid max_concurrency"}), 400
+
+        if not items:
+            return jsonify({"error": "No items provided"}), 400
+
+        if profile not in RecipeGenerator.PROFILES:
+            return jsonify({"error": f"Unknown profile: {profile}"}), 400
+
+        def generate():
+            for index, recipe, error in services.recipe_generator.generate_batch(items, max_concurrency=max_concurrency, profile=profile):
+                if error is None:
+                    yield json.dumps({'index': index, 'recipe': recipe}) + '\n'
+                else:
+                    metrics.HTTP_STREAM_ERRORS.inc("generate_recipes")
+                    yield json.dumps({'index': index, 'error': str(error)}) + '\n'
+
+            # Send an end event to signal that every item has been processed
+            yield json.dumps({'end': True}) + '\n'
+
+        return Response(stream_with_context(generate()), 
+                       content_type='application/x-ndjson')
+    except Exception as e:
+        return error_response(e)
+
+@routes.route('/api/nutrition', methods=['POST'])
+def nutrition():
+    """
+    Compute the nutrition of ingredient lists locally, without an LLM call.
+
+    Expected JSON payload:
+    {
+        "ingredients": ["200g chicken breast", "1 cup rice", ...],
+        "servings": "optional, positive number of servings, defaults to 1"
+    }
+    or, for many recipes at once:
+    {
+        "recipes": [["200g chicken breast", ...], ...]
+    }
+
+    Returns:
+    The calories, protein, carbs and fat per serving with the unmatched ingredients,
+    or {"recipes": [{"calories": ..., "protein": ..., "carbs": ..., "fat": ...}, ...]}.
+    """
+    try:
+        data = request.json
+        table = services.recipe_generator.nutrition_table
+
+        if data.get('recipes'):
+            totals = table.analyze_batch(data['recipes'])
+            return jsonify({"recipes": [
+                {nutrient: round(float(value), 1) for nutrient, value in zip(table.NUTRIENTS, row)}
+                for row in totals
+            ]})
+
+        ingredients = data.get('ingredients', [])
+        if not ingredients:
+            return jsonify({"error": "No ingredients provided"}), 400
+
+        try:
+            servings = int(data.get('servings', 1))
+        except (TypeError, ValueError):
+            servings = 0
+        if servings < 1:
+            return jsonify({"error": "Invalid servings"}), 400
+
+        return jsonify(table.analyze(ingredients, servings=servings))
+    except Exception as e:
+        return error_response(e)
+
+@routes.route('/api/speak-recipe', methods=['POST'])
+def speak_recipe():
+    """
+    Generate a recipe and stream its text and audio at the same time.
+
+    Sentences are sent to text-to-speech as soon as they are complete, while
+    the recipe is still being generated.
 
-@app.route('/api/text-to-speech', methods=['POST'])
+    Expected JSON payload:
+    {
+        "ingredients": ["ingredient1", "ingredient2", ...],
+        "dietary_preference": "optional preference",
+        "goal": "optional goal",
+        "voice": "optional voice name",
+        "profile": "optional, full (default), concise or compact"
+    }
+
+    Returns:
+    A stream of JSON lines, each containing a text chunk ({"text": ...}),
+    an audio URL in sentence order ({"audio": {"index": ..., "text": ..., "url": ...}}),
+    a failed sentence ({"audio": {"index": ..., "text": ..., "error": ...}}), an error or the end signal.
+    """
+    try:
+        data = request.json
+        ingredients = data.get('ingredients', [])
+        dietary_preference = data.get('dietary_preference')
+        goal = data.get('goal')
+        voice = data.get('voice', 'Ethan')
+        profile = data.get('profile', 'full')
+
+        if not ingredients:
+            return jsonify({"error": "No ingredients provided"}), 400
+
+        if profile not in RecipeGenerator.PROFILES:
+            return jsonify({"error": f"Unknown profile: {profile}"}), 400
+
+        def generate():
+            try:
+                with contextlib.closing(services.recipe_speaker.speak_recipe(
+                    ingredients=ingredients,
+                    dietary_preference=dietary_preference,
+                    goal=goal,
+                    voice=voice,
+                    profile=profile
+                )) as events:
+                    for event in events:
+                        yield json.dumps(event) + '\n'
+            except Exception as e:
+                logger.exception(f"Error speaking recipe: {str(e)}")
+                metrics.HTTP_STREAM_ERRORS.inc("speak_recipe")
+
+                yield json.dumps({'error': str(e)}) + '\n'
+
+            # Send an end event to signal that the recipe is complete
+            yield json.dumps({'end': True}) + '\n'
+
+        return Response(stream_with_context(generate()), 
+                       content_type='application/x-ndjson')
+    except Exception as e:
+        return error_response(e)
+
+@routes.route('/api/text-to-speech', methods=['POST'])
 def text_to_speech():
     """
     Convert text to speech and return the audio URLs.
@@ -123,13 +423,13 @@ def text_to_speech():
         if not text:
             return jsonify({"error": "No text provided"}), 400
 
-        audio_urls = tts_service.text_to_speech(text=text, voice=voice)
+        audio_urls = services.tts_service.text_to_speech(text=text, voice=voice)
 
         return jsonify({"audio_urls": audio_urls})
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return error_response(e)
 
-@app.route('/api/stream-text-to-speech', methods=['POST'])
+@routes.route('/api/stream-text-to-speech', methods=['POST'])
 def stream_text_to_speech():
     """
     Stream text-to-speech conversion and return audio URLs as they become available.
@@ -153,27 +453,21 @@ def stream_text_to_speech():
 
         def generate():
             # Split text into segments
-            segments = tts_service._split_text(text)
-
-            for segment in segments:
-                if not segment.strip():
-                    continue
-
-                try:
-                    # Generate audio URL for this segment
-                    url = tts_service._tts_single(segment, voice)
-
-                    # Send the URL as a JSON chunk
-                    yield json.dumps({'url': url}) + '\n'
-                except Exception as e:
-                    # Log the error
-                    print(f"Error generating audio for segment: {str(e)}")
-
-                    # Send an error event
-                    yield json.dumps({'error': str(e)}) + '\n'
-
-                    # Continue with the next segment
-                    continue
+            segments = services.tts_service._split_text(text)
+
+            # Segments are synthesized in parallel, results arrive in segment order
+            with contextlib.closing(services.tts_service.iter_segment_urls(segments, voice)) as results:
+                for url, error in results:
+                    if error is None:
+                        # Send the URL as a JSON chunk
+                        yield json.dumps({'url': url}) + '\n'
+                    else:
+                        # Log the error
+                        print(f"Error generating audio for segment: {str(error)}")
+                        metrics.HTTP_STREAM_ERRORS.inc("stream_text_to_speech")
+
+                        # Send an error event and continue with the next segment
+                        yield json.dumps({'error': str(error)}) + '\n'
 
             # Send an end event to signal that all segments have been processed
             yield json.dumps({'end': True}) + '\n'
@@ -181,9 +475,9 @@ def stream_text_to_speech():
         return Response(stream_with_context(generate()), 
                        content_type='application/x-ndjson')
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return error_response(e)
 
-@app.route('/api/stream-tts', methods=['POST'])
+@routes.route('/api/stream-tts', methods=['POST'])
 def stream_tts():
     """
     Stream text-to-speech conversion.
@@ -191,7 +485,8 @@ def stream_tts():
     Expected JSON payload:
     {
         "text": "Text to convert to speech",
-        "voice": "optional voice name"
+        "voice": "optional voice name",
+        "format": "optional output format: wav (default), wav-mono, wav-16k, wav-8k or ulaw-8k"
     }
     """
     try:
@@ -199,20 +494,47 @@ def stream_tts():
         text = data.get('text', '')
         print(f"Received text for TTS: {text}")
         voice = data.get('voice', 'Ethan')
+        audio_format = data.get('format', 'wav')
 
         if not text:
             return jsonify({"error": "No text provided"}), 400
+        if audio_format not in OUTPUT_FORMATS:
+            return jsonify({"error": f"Unknown audio format: {audio_format}"}), 400
+
+        # One progressive WAV file, whose first chunk is the header and the first frames
+        audio = services.tts_service.text_to_speech(text=text, voice=voice, stream=True, audio_format=audio_format)
+
+        # Wait for the first chunk, so that a failure of the first segment is still reported as an error
+        first = next(audio, None)
+        if first is None:
+            return jsonify({"error": "No text provided"}), 400
 
         def generate():
-            for chunk in tts_service.text_to_speech(text=text, voice=voice, stream=True):
-                yield chunk
+            # Closing stops the upstream streams, also when the client leaves after the first chunk
+            with contextlib.closing(audio):
+                yield first
+                yield from audio
 
         return Response(stream_with_context(generate()), 
                        content_type='audio/wav')
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return error_response(e)
 
-@app.route('/api/download-tts', methods=['POST'])
+@routes.route('/api/tts-cache/<key>.wav')
+def tts_cache_file(key):
+    """
+    Serve a cached TTS audio file.
+    """
+    if not AudioCache.is_valid_key(key) or not services.tts_service.audio_cache.contains(key):
+        return jsonify({"error": "Audio not found"}), 404
+
+    try:
+        return send_file(os.path.abspath(services.tts_service.audio_cache.path_for(key)), mimetype="audio/wav")
+    except FileNotFoundError:
+        # Evicted by another worker process since the check
+        return jsonify({"error": "Audio not found"}), 404
+
+@routes.route('/api/download-tts', methods=['POST'])
 def download_tts():
     """
     Convert text to speech and provide a downloadable file.
@@ -220,44 +542,43 @@ def download_tts():
     Expected JSON payload:
     {
         "text": "Text to convert to speech",
-        "voice": "optional voice name"
+        "voice": "optional voice name",
+        "format": "optional output format: wav (default), wav-mono, wav-16k, wav-8k or ulaw-8k"
     }
     """
     try:
         data = request.json
         text = data.get('text', '')
         voice = data.get('voice', 'Ethan')
+        audio_format = data.get('format', 'wav')
         print(f"Received text for TTS: {text}")
 
         if not text:
             return jsonify({"error": "No text provided"}), 400
+        if audio_format not in OUTPUT_FORMATS:
+            return jsonify({"error": f"Unknown audio format: {audio_format}"}), 400
 
-        # Create a temporary file
-        fd, temp_path = tempfile.mkstemp(suffix='.wav')
-        os.close(fd)
+        # Segments are fetched concurrently and streamed as one WAV file in order
+        audio = services.tts_service.iter_speech_wav(text=text, voice=voice, audio_format=audio_format)
 
-        try:
-            # Generate the audio file
-            tts_service.text_to_speech_file(text=text, output_path=temp_path, voice=voice)
-
-            # Send the file
-            return send_file(
-                temp_path,
-                as_attachment=True,
-                download_name="recipe_audio.wav",
-                mimetype="audio/wav"
-            )
-        finally:
-            # Clean up the temporary file (this will execute after the response is sent)
-            @app.after_request
-            def remove_file(response):
-                try:
-                    os.remove(temp_path)
-                except:
-                    pass
-                return response
+        # Wait for the header, so that a failure of the first segment is still reported as an error
+        header = next(audio, None)
+        if header is None:
+            return jsonify({"error": "No text provided"}), 400
+
+        def generate():
+            with contextlib.closing(audio):
+                yield header
+                yield from audio
+
+        return Response(
+            stream_with_context(generate()),
+            mimetype="audio/wav",
+            headers={"Content-Disposition": 'attachment; filename="recipe_audio.wav"'}
+        )
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return error_response(e)
 
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=5000)
+    # The development server, see server/wsgi.py for production
+    create_app().run(debug=True, host='0.0.0.0', port=5000)
@@ -0,0 +1,719 @@
+"""
+Asynchronous (ASGI) serving mode for the recipe generator.
+
+This module exposes the same routes and payloads as server/app.py, but every
+connection is a coroutine on a single event loop instead of a thread. Blocking
+DashScope calls run on a bounded pool of upstream workers, one step at a time:
+a streaming response only holds a worker while it waits for the next upstream
+chunk, and never while it writes to a slow client or waits in the queue.
+
+Run it with any ASGI server, for example:
+
+    uvicorn server.asgi:app --host 0.0.0.0 --port 5000 --limit-concurrency 10000
+
+Concurrency ceiling: at most ASGI_UPSTREAM_WORKERS (default 64) upstream calls
+or upstream chunk reads are in progress at any time, further requests wait in
+the executor queue without holding a thread. Idle or slow streaming clients
+only cost a coroutine, a socket and their buffered chunk, so the number of
+open connections is bounded by the ASGI server's --limit-concurrency and the
+process file descriptor limit (ulimit -n), not by threads.
+
+The request scheduler admits at most SCHEDULER_MAX_ACTIVE (default 16)
+requests of the expensive endpoints working at the same time. A stream lends
+its slot out while it waits for its client to take a chunk, so slow or idle
+listeners do not count against it: the limit bounds the streams waiting on
+the upstream, not the open streams.
+"""
+import os
+import json
+import asyncio
+import logging
+import contextlib
+import contextvars
+import functools
+import mimetypes
+from concurrent.futures import ThreadPoolExecutor
+from flask import render_template
+
+# Import the core functionality and the shared services from the Flask server
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app import metrics
+from app.audio_cache import AudioCache
+from app.audio_formats import OUTPUT_FORMATS
+from app.governor import UpstreamThrottled, governor_status
+from app.scheduler import Overloaded, SCHEDULED_ENDPOINTS, get_scheduler, client_identity
+from app.recipe_parser import IncrementalRecipeParser
+from app.recipe_generator import RecipeGenerator
+from server.app import create_app
+from server.services import get_services, preload, start_warmup, BATCH_MAX_CONCURRENCY
+
+# The Flask app renders the page templates and locates the static files
+flask_app = create_app()
+
+# The services of the process, created on the first request that uses them
+services = get_services()
+
+logger = logging.getLogger("Server")
+
+# Maximum number of upstream calls in progress at the same time
+UPSTREAM_WORKERS = int(os.getenv("ASGI_UPSTREAM_WORKERS", "64"))
+
+_upstream_executor = ThreadPoolExecutor(max_workers=UPSTREAM_WORKERS, thread_name_prefix="upstream")
+
+# Marker returned by next() once a blocking iterator is exhausted
+_DONE = object()
+
+# Name of the handler serving the current request, used to label its metrics
+_current_endpoint = contextvars.ContextVar("endpoint", default="unmatched")
+
+# Scheduler admission of the current request, lent out while a stream waits for its client
+_current_admission = contextvars.ContextVar("admission", default=None)
+
+class HTTPError(Exception):
+    """
+    An error that is sent to the client as a JSON response.
+    """
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+class ClientDisconnected(Exception):
+    """
+    Raised when the client closed the connection during a streaming response.
+    """
+
+class StreamAborted(Exception):
+    """
+    Raised when a streaming response fails after its headers were sent.
+
+    It reaches the ASGI server, which closes the connection without ending the
+    body, so the client sees a broken response instead of a complete one.
+    """
+
+async def run_upstream(func, *args, **kwargs):
+    """
+    Run a blocking call on the upstream worker pool.
+
+    Args:
+        func (callable): The blocking function.
+        *args: Positional arguments for the function.
+        **kwargs: Keyword arguments for the function.
+
+    Returns:
+        The result of the function.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_upstream_executor, functools.partial(func, *args, **kwargs))
+
+async def iterate_upstream(iterator):
+    """
+    Consume a blocking iterator, pulling one item at a time on the upstream pool.
+
+    Args:
+        iterator (iterator): The blocking iterator, e.g. a streaming service generator.
+
+    Returns:
+        async generator: An async generator yielding the items of the iterator.
+    """
+    try:
+        while True:
+            item = await run_upstream(next, iterator, _DONE)
+            if item is _DONE:
+                return
+            yield item
+    finally:
+        # Stop the upstream work if the consumer goes away early
+        close = getattr(iterator, 'close', None)
+        if close is not None:
+            await run_upstream(close)
+
+async def read_json(receive):
+    """
+    Read and decode the JSON request body.
+
+    Args:
+        receive (callable): The ASGI receive callable.
+
+    Returns:
+        dict: The decoded payload.
+    """
+    body = b""
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            raise ClientDisconnected()
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            break
+
+    try:
+        data = json.loads(body or b"null")
+    except ValueError:
+        raise HTTPError(400, "Invalid JSON payload")
+
+    if not isinstance(data, dict):
+        raise HTTPError(400, "Invalid JSON payload")
+
+    return data
+
+def read_audio_format(data):
+    """
+    Get the audio output format of a request.
+
+    Args:
+        data (dict): The decoded payload.
+
+    Returns:
+        str: The format, "wav" if the request does not name one.
+    """
+    audio_format = data.get('format', 'wav')
+    if audio_format not in OUTPUT_FORMATS:
+        raise HTTPError(400, f"Unknown audio format: {audio_format}")
+    return audio_format
+
+def read_profile(data):
+    """
+    Get the generation profile of a request.
+
+    Args:
+        data (dict): The decoded payload.
+
+    Returns:
+        str: The profile, "full" if the request does not name one.
+    """
+    profile = data.get('profile', 'full')
+    if profile not in RecipeGenerator.PROFILES:
+        raise HTTPError(400, f"Unknown profile: {profile}")
+    return profile
+
+async def send_response(send, status, body, content_type, headers=()):
+    """
+    Send a complete response.
+
+    Args:
+        send (callable): The ASGI send callable.
+        status (int): The HTTP status code.
+        body (bytes): The response body.
+        content_type (str): The response content type.
+        headers (iterable, optional): Additional (name, value) header tuples.
+    """
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", content_type.encode()),
+            (b"content-length", str(len(body)).encode()),
+            *[(name.encode(), value.encode()) for name, value in headers],
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+async def send_json(send, payload, status=200, headers=()):
+    """
+    Send a JSON response.
+
+    Args:
+        send (callable): The ASGI send callable.
+        payload: The JSON-serializable payload.
+        status (int, optional): The HTTP status code. Defaults to 200.
+        headers (iterable, optional): Additional (name, value) header tuples.
+    """
+    await send_response(send, status, json.dumps(payload).encode('utf-8'), "application/json", headers)
+
+async def send_stream(receive, send, chunks, content_type, headers=()):
+    """
+    Send a streaming response, stopping as soon as the client disconnects.
+
+    An error of the chunks aborts the response with StreamAborted, since a clean
+    end of the body would make a truncated stream look complete.
+
+    Args:
+        receive (callable): The ASGI receive callable.
+        send (callable): The ASGI send callable.
+        chunks (async iterable): The body chunks, as str or bytes.
+        content_type (str): The response content type.
+        headers (iterable, optional): Additional (name, value) header tuples.
+    """
+    disconnected = asyncio.Event()
+
+    async def watch_disconnect():
+        while (await receive())["type"] != "http.disconnect":
+            pass
+        disconnected.set()
+
+    watcher = asyncio.create_task(watch_disconnect())
+
+    await send({
+        "type": "http.response.start",
+        "status": 200,
+        "headers": [
+            (b"content-type", content_type.encode()),
+            *[(name.encode(), value.encode()) for name, value in headers],
+        ],
+    })
+
+    admission = _current_admission.get()
+    sent = 0
+    try:
+        async for chunk in chunks:
+            if disconnected.is_set():
+                # Closing the chunks below stops the upstream work of the request
+                metrics.HTTP_STREAMS_CANCELLED.inc(_current_endpoint.get())
+                logger.debug(f"Client disconnected from {_current_endpoint.get()} after {sent} chunks, "
+                             f"cancelling the request")
+                break
+            sent += 1
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            if admission is None:
+                await send({"type": "http.response.body", "body": chunk, "more_body": True})
+            else:
+                # A slow client holds its connection, but not a scheduler slot
+                with admission.waiting_on_client():
+                    await send({"type": "http.response.body", "body": chunk, "more_body": True})
+    except Exception as e:
+        # The headers are already sent, so the error can only abort the stream
+        logger.exception(f"Error while streaming response: {str(e)}")
+        metrics.HTTP_STREAM_ERRORS.inc(_current_endpoint.get())
+        raise StreamAborted(str(e)) from e
+    finally:
+        watcher.cancel()
+        # Close the chunk generator so the upstream iterator is closed too
+        aclose = getattr(chunks, 'aclose', None)
+        if aclose is not None:
+            await aclose()
+
+    if not disconnected.is_set():
+        await send({"type": "http.response.body", "body": b""})
+
+async def send_file(send, path, content_type, headers=(), chunk_size=64 * 1024):
+    """
+    Send a file from disk.
+
+    Args:
+        send (callable): The ASGI send callable.
+        path (str): Path to the file.
+        content_type (str): The response content type.
+        headers (iterable, optional): Additional (name, value) header tuples.
+        chunk_size (int, optional): Size of the chunks read from the file.
+    """
+    # Opened before the headers are sent, so a missing file is still reported by the caller
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [
+                (b"content-type", content_type.encode()),
+                (b"content-length", str(size).encode()),
+                *[(name.encode(), value.encode()) for name, value in headers],
+            ],
+        })
+
+        while True:
+            chunk = await asyncio.to_thread(f.read, chunk_size)
+            await send({"type": "http.response.body", "body": chunk, "more_body": bool(chunk)})
+            if not chunk:
+                break
+
+@functools.lru_cache(maxsize=1)
+def render_index():
+    """
+    Render the main page once with the Flask templates.
+
+    Returns:
+        bytes: The rendered page.
+    """
+    with flask_app.test_request_context('/'):
+        return render_template('index.html').encode('utf-8')
+
+async def index(scope, receive, send):
+    """Render the main page."""
+    await send_response(send, 200, render_index(), "text/html; charset=utf-8")
+
+async def favicon(scope, receive, send):
+    """Return a 204 No Content response to prevent 404 errors."""
+    await send({"type": "http.response.start", "status": 204, "headers": []})
+    await send({"type": "http.response.body", "body": b""})
+
+async def static_file(scope, receive, send):
+    """Serve a file from the frontend static folder."""
+    static_root = os.path.realpath(flask_app.static_folder)
+    path = os.path.realpath(os.path.join(static_root, scope["path"][len("/static/"):]))
+
+    if not path.startswith(static_root + os.sep) or not os.path.isfile(path):
+        raise HTTPError(404, "Not found")
+
+    content_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+    await send_file(send, path, content_type)
+
+async def metrics_page(scope, receive, send):
+    """Report the request, upstream and logging metrics in the Prometheus text format."""
+    await send_response(send, 200, metrics.REGISTRY.render().encode('utf-8'), metrics.CONTENT_TYPE)
+
+async def upstream_status(scope, receive, send):
+    """Report the current limits, calls in flight and queue depth of the upstream governors."""
+    await send_json(send, governor_status())
+
+async def generate_recipe(scope, receive, send):
+    """Generate a recipe based on the provided ingredients and preferences."""
+    data = await read_json(receive)
+    ingredients = data.get('ingredients', [])
+
+    if not ingredients:
+        raise HTTPError(400, "No ingredients provided")
+
+    recipe = await run_upstream(
+        services.recipe_generator.generate_recipe,
+        ingredients=ingredients,
+        dietary_preference=data.get('dietary_preference'),
+        goal=data.get('goal'),
+        profile=read_profile(data)
+    )
+
+    await send_json(send, recipe)
+
+async def stream_recipe(scope, receive, send):
+    """Stream a recipe generation response."""
+    data = await read_json(receive)
+    ingredients = data.get('ingredients', [])
+
+    if not ingredients:
+        raise HTTPError(400, "No ingredients provided")
+
+    profile = read_profile(data)
+
+    async def generate():
+        parser = IncrementalRecipeParser() if data.get('events') else None
+
+        async with contextlib.aclosing(iterate_upstream(services.recipe_generator.generate_recipe(
+            ingredients=ingredients,
+            dietary_preference=data.get('dietary_preference'),
+            goal=data.get('goal'),
+            stream=True,
+            profile=profile
+        ))) as chunks:
+            async for chunk in chunks:
+                yield f"data: {json.dumps({'chunk': chunk})}\n\n"
+
+                if parser is not None:
+                    for event in parser.feed(chunk):
+                        yield f"data: {json.dumps({'event': event})}\n\n"
+
+        if parser is not None:
+            for event in parser.close():
+                yield f"data: {json.dumps({'event': event})}\n\n"
+
+            facts = services.recipe_generator.nutrition_table.analyze(parser.recipe['ingredients'])
+            yield f"data: {json.dumps({'event': {'type': 'nutrition_facts', 'value': facts}})}\n\n"
+
+    await send_stream(receive, send, generate(), 'text/event-stream')
+
+async def generate_recipes(scope, receive, send):
+    """Generate many recipes concurrently and stream each result as soon as it is ready."""
+    data = await read_json(receive)
+    items = data.get('items', [])
+
+    try:
+        max_concurrency = min(int(data.get('max_concurrency', BATCH_MAX_CONCURRENCY)), BATCH_MAX_CONCURRENCY)
+    except (TypeError, ValueError):
+        raise HTTPError(400, "Invalid max_concurrency")
+
+    if not items:
+        raise HTTPError(400, "No items provided")
+
+    profile = read_profile(data)
+
+    async def generate():
+        async with contextlib.aclosing(iterate_upstream(
+            services.recipe_generator.generate_batch(items, max_concurrency=max_concurrency, profile=profile)
+        )) as results:
+            async for index, recipe, error in results:
+                if error is None:
+                    yield json.dumps({'index': index, 'recipe': recipe}) + '\n'
+                else:
+                    metrics.HTTP_STREAM_ERRORS.inc("generate_recipes")
+                    yield json.dumps({'index': index, 'error': str(error)}) + '\n'
+
+        yield json.dumps({'end': True}) + '\n'
+
+    await send_stream(receive, send, generate(), 'application/x-ndjson')
+
+async def nutrition(scope, receive, send):
+    """Compute the nutrition of ingredient lists locally, without an LLM call."""
+    data = await read_json(receive)
+    table = services.recipe_generator.nutrition_table
+
+    if data.get('recipes'):
+        totals = table.analyze_batch(data['recipes'])
+        await send_json(send, {"recipes": [
+            {nutrient: round(float(value), 1) for nutrient, value in zip(table.NUTRIENTS, row)}
+            for row in totals
+        ]})
+        return
+
+    ingredients = data.get('ingredients', [])
+    if not ingredients:
+        raise HTTPError(400, "No ingredients provided")
+
+    try:
+        servings = int(data.get('servings', 1))
+    except (TypeError, ValueError):
+        servings = 0
+    if servings < 1:
+        raise HTTPError(400, "Invalid servings")
+
+    await send_json(send, table.analyze(ingredients, servings=servings))
+
+async def speak_recipe(scope, receive, send):
+    """Generate a recipe and stream its text and audio at the same time."""
+    data = await read_json(receive)
+    ingredients = data.get('ingredients', [])
+
+    if not ingredients:
+        raise HTTPError(400, "No ingredients provided")
+
+    profile = read_profile(data)
+
+    async def generate():
+        try:
+            async with contextlib.aclosing(iterate_upstream(services.recipe_speaker.speak_recipe(
+                ingredients=ingredients,
+                dietary_preference=data.get('dietary_preference'),
+                goal=data.get('goal'),
+                voice=data.get('voice', 'Ethan'),
+                profile=profile
+            ))) as events:
+                async for event in events:
+                    yield json.dumps(event) + '\n'
+        except Exception as e:
+            metrics.HTTP_STREAM_ERRORS.inc("speak_recipe")
+            yield json.dumps({'error': str(e)}) + '\n'
+
+        yield json.dumps({'end': True}) + '\n'
+
+    await send_stream(receive, send, generate(), 'application/x-ndjson')
+
+async def text_to_speech(scope, receive, send):
+    """Convert text to speech and return the audio URLs."""
+    data = await read_json(receive)
+    text = data.get('text', '')
+
+    if not text:
+        raise HTTPError(400, "No text provided")
+
+    audio_urls = await run_upstream(services.tts_service.text_to_speech, text=text, voice=data.get('voice', 'Ethan'))
+
+    await send_json(send, {"audio_urls": audio_urls})
+
+async def stream_text_to_speech(scope, receive, send):
+    """Stream text-to-speech conversion and return audio URLs as they become available."""
+    data = await read_json(receive)
+    text = data.get('text', '')
+    voice = data.get('voice', 'Ethan')
+
+    if not text:
+        raise HTTPError(400, "No text provided")
+
+    async def generate():
+        segments = await run_upstream(services.tts_service._split_text, text)
+
+        async with contextlib.aclosing(iterate_upstream(services.tts_service.iter_segment_urls(segments, voice))) as results:
+            async for url, error in results:
+                if error is None:
+                    yield json.dumps({'url': url}) + '\n'
+                else:
+                    metrics.HTTP_STREAM_ERRORS.inc("stream_text_to_speech")
+                    yield json.dumps({'error': str(error)}) + '\n'
+
+        yield json.dumps({'end': True}) + '\n'
+
+    await send_stream(receive, send, generate(), 'application/x-ndjson')
+
+async def stream_tts(scope, receive, send):
+    """Stream text-to-speech conversion."""
+    data = await read_json(receive)
+    text = data.get('text', '')
+
+    if not text:
+        raise HTTPError(400, "No text provided")
+
+    audio_format = read_audio_format(data)
+
+    # One progressive WAV file, whose first chunk is the header and the first frames
+    audio = services.tts_service.text_to_speech(text=text, voice=data.get('voice', 'Ethan'), stream=True, audio_format=audio_format)
+
+    # Wait for the first chunk, so that a failure of the first segment is still reported as an error
+    first = await run_upstream(next, audio, None)
+    if first is None:
+        raise HTTPError(400, "No text provided")
+
+    async def generate():
+        try:
+            yield first
+            async with contextlib.aclosing(iterate_upstream(audio)) as chunks:
+                async for chunk in chunks:
+                    yield chunk
+        finally:
+            # Stops the upstream streams also when the client leaves after the first chunk
+            await run_upstream(audio.close)
+
+    await send_stream(receive, send, generate(), 'audio/wav')
+
+async def download_tts(scope, receive, send):
+    """Convert text to speech and provide a downloadable file."""
+    data = await read_json(receive)
+    text = data.get('text', '')
+
+    if not text:
+        raise HTTPError(400, "No text provided")
+
+    audio_format = read_audio_format(data)
+
+    audio = services.tts_service.iter_speech_wav(text=text, voice=data.get('voice', 'Ethan'), audio_format=audio_format)
+
+    # Wait for the header, so that a failure of the first segment is still reported as an error
+    header = await run_upstream(next, audio, None)
+    if header is None:
+        raise HTTPError(400, "No text provided")
+
+    async def generate():
+        try:
+            yield header
+            async with contextlib.aclosing(iterate_upstream(audio)) as frames:
+                async for chunk in frames:
+                    yield chunk
+        finally:
+            await run_upstream(audio.close)
+
+    await send_stream(
+        receive,
+        send,
+        generate(),
+        "audio/wav",
+        headers=[("content-disposition", 'attachment; filename="recipe_audio.wav"')]
+    )
+
+async def tts_cache_file(scope, receive, send):
+    """Serve a cached TTS audio file."""
+    key = scope["path"][len("/api/tts-cache/"):].removesuffix(".wav")
+
+    if not AudioCache.is_valid_key(key) or not services.tts_service.audio_cache.contains(key):
+        raise HTTPError(404, "Audio not found")
+
+    try:
+        await send_file(send, services.tts_service.audio_cache.path_for(key), "audio/wav")
+    except FileNotFoundError:
+        # Evicted by another worker process since the check
+        raise HTTPError(404, "Audio not found")
+
+# Routes matched by method and exact path
+ROUTES = {
+    ('GET', '/'): index,
+    ('GET', '/favicon.ico'): favicon,
+    ('GET', '/metrics'): metrics_page,
+    ('GET', '/api/upstream-status'): upstream_status,
+    ('POST', '/api/generate-recipe'): generate_recipe,
+    ('POST', '/api/stream-recipe'): stream_recipe,
+    ('POST', '/api/generate-recipes'): generate_recipes,
+    ('POST', '/api/nutrition'): nutrition,
+    ('POST', '/api/speak-recipe'): speak_recipe,
+    ('POST', '/api/text-to-speech'): text_to_speech,
+    ('POST', '/api/stream-text-to-speech'): stream_text_to_speech,
+    ('POST', '/api/stream-tts'): stream_tts,
+    ('POST', '/api/download-tts'): download_tts,
+}
+
+# Routes matched by method and path prefix
+PREFIX_ROUTES = [
+    ('GET', '/static/', static_file),
+    ('GET', '/api/tts-cache/', tts_cache_file),
+]
+
+def resolve(method, path):
+    """
+    Find the handler of a request.
+
+    Args:
+        method (str): The HTTP method.
+        path (str): The request path.
+
+    Returns:
+        callable: The handler, or None if no route matches.
+    """
+    handler = ROUTES.get((method, path))
+    if handler is not None:
+        return handler
+
+    for route_method, prefix, prefix_handler in PREFIX_ROUTES:
+        if method == route_method and path.startswith(prefix):
+            return prefix_handler
+
+    return None
+
+async def app(scope, receive, send):
+    """
+    The ASGI application.
+    """
+    if scope["type"] == "lifespan":
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                # Load the upstream client before the first request instead of during it
+                await run_upstream(preload)
+                # In its own process, started by the server and not by its first request
+                start_warmup()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                _upstream_executor.shutdown(wait=False, cancel_futures=True)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    if scope["type"] != "http":
+        return
+
+    handler = resolve(scope["method"], scope["path"])
+    endpoint = handler.__name__ if handler is not None else "unmatched"
+    _current_endpoint.set(endpoint)
+
+    async def send_counted(message):
+        # Count every response by endpoint and status, like the Flask server
+        if message["type"] == "http.response.start":
+            metrics.HTTP_REQUESTS.inc(endpoint, str(message["status"]))
+        await send(message)
+
+    if handler is None:
+        await send_json(send_counted, {"error": "Not found"}, status=404)
+        return
+
+    endpoint_class = SCHEDULED_ENDPOINTS.get(endpoint)
+    scheduler = get_scheduler() if endpoint_class else None
+    admission = None
+
+    try:
+        if scheduler is not None:
+            # Waits without blocking the loop, the slot is held until the response is complete,
+            # except while a stream waits for its client
+            headers = {name.decode('latin-1').lower(): value.decode('latin-1') for name, value in scope["headers"]}
+            client = scope.get("client")
+            admission = await scheduler.admit_async(endpoint_class, client_identity(headers, client and client[0]))
+            _current_admission.set(admission)
+        await handler(scope, receive, send_counted)
+    except ClientDisconnected:
+        pass
+    except StreamAborted:
+        # No error response can follow the headers, the server aborts the connection
+        raise
+    except Overloaded as e:
+        await send_json(send_counted, {"error": str(e)}, status=e.status, headers=[("retry-after", str(e.retry_after))])
+    except HTTPError as e:
+        await send_json(send_counted, {"error": str(e)}, status=e.status)
+    except UpstreamThrottled as e:
+        await send_json(send_counted, {"error": str(e)}, status=429, headers=[("retry-after", str(e.retry_after))])
+    except Exception as e:
+        await send_json(send_counted, {"error": str(e)}, status=500)
+    finally:
+        if admission is not None:
+            admission.release()
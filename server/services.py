@@ -0,0 +1,144 @@
+"""
+The services shared by the routes of both servers.
+
+They are created on first use, once per process: importing the servers or
+creating their apps does not build any service, start any thread or open
+any connection, so a production server can load the app once and fork its
+worker processes from it. preload() loads the read-only state the workers
+can share before they are forked.
+"""
+import os
+import sys
+import threading
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.backends import get_backend, preload_backend
+from app.nutrition import get_nutrition_table
+from app.recipe_generator import RecipeGenerator
+from app.recipe_cache import RecipeCache
+from app.similarity_index import SimilarityIndex
+from app.tts_service import TTSService
+from app.audio_cache import AudioCache
+from app.recipe_speaker import RecipeSpeaker
+from app.warmup import spawn_warmup
+
+# Minimum similarity of a previous request whose recipe is served, 0 to only serve identical requests
+SIMILARITY_THRESHOLD = float(os.getenv("RECIPE_SIMILARITY_THRESHOLD", "0.75"))
+
+# Warm the caches with the most frequent logged requests in a separate process on startup, 0 to skip
+WARMUP_TOP = int(os.getenv("RECIPE_WARMUP_TOP", "0"))
+
+# Maximum number of recipes of one batch request generated at the same time
+BATCH_MAX_CONCURRENCY = int(os.getenv("RECIPE_BATCH_MAX_CONCURRENCY", "8"))
+
+class Services:
+    """
+    Creates the recipe generator, TTS service and recipe speaker of the process on first use.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._services = None
+
+    @property
+    def recipe_generator(self):
+        """RecipeGenerator: The recipe generator."""
+        return self._get()['recipe_generator']
+
+    @property
+    def tts_service(self):
+        """TTSService: The TTS service."""
+        return self._get()['tts_service']
+
+    @property
+    def recipe_speaker(self):
+        """RecipeSpeaker: The recipe speaker."""
+        return self._get()['recipe_speaker']
+
+    @property
+    def started(self):
+        """bool: Whether the services of this process were created."""
+        return self._services is not None
+
+    def reset(self):
+        """
+        Forget the services, e.g. in a forked child whose copies lost their threads.
+        """
+        self._lock = threading.Lock()
+        self._services = None
+
+    def _get(self):
+        services = self._services
+        if services is None:
+            with self._lock:
+                if self._services is None:
+                    self._services = self._create()
+                services = self._services
+        return services
+
+    def _create(self):
+        """
+        Create the services, sharing the upstream backend selected by RECIPE_GEN_BACKEND.
+
+        Returns:
+            dict: The services by name.
+        """
+        backend = get_backend()
+        recipe_generator = RecipeGenerator(backend=backend, cache=RecipeCache(
+            max_entries=int(os.getenv("RECIPE_CACHE_SIZE", "256")),
+            ttl=float(os.getenv("RECIPE_CACHE_TTL", str(24 * 60 * 60))),
+            persist_path=os.getenv("RECIPE_CACHE_PATH", os.path.join("cache", "recipes.json")),
+        ), similarity_index=SimilarityIndex(
+            threshold=SIMILARITY_THRESHOLD,
+            max_entries=int(os.getenv("RECIPE_SIMILARITY_MAX_ENTRIES", "100000")),
+        ) if SIMILARITY_THRESHOLD > 0 else None)
+        tts_service = TTSService(backend=backend, audio_cache=AudioCache(
+            cache_dir=os.getenv("TTS_CACHE_DIR", os.path.join("cache", "audio")),
+            max_bytes=int(os.getenv("TTS_CACHE_MAX_BYTES", str(256 * 1024 * 1024))),
+            url_prefix="/api/tts-cache/",
+        ), max_concurrency=int(os.getenv("TTS_MAX_CONCURRENCY", "4")))
+
+        return {
+            'recipe_generator': recipe_generator,
+            'tts_service': tts_service,
+            'recipe_speaker': RecipeSpeaker(recipe_generator, tts_service),
+        }
+
+_services = Services()
+
+# Services created before a fork hold threads and executors that do not survive it
+os.register_at_fork(after_in_child=_services.reset)
+
+def get_services():
+    """
+    Get the services of the process.
+
+    Returns:
+        Services: The lazily created services.
+    """
+    return _services
+
+def preload():
+    """
+    Load the read-only state of the services, e.g. in a server process before it forks its workers.
+
+    The modules of the upstream client and the food table are then loaded once
+    and shared copy-on-write by the workers, instead of being loaded by each
+    worker on its first request. No service is created.
+    """
+    preload_backend()
+    get_nutrition_table()
+
+def start_warmup():
+    """
+    Start warming the caches if RECIPE_WARMUP_TOP is set, once when a server starts.
+
+    The warm-up runs in its own process, so the server is ready while it runs
+    and no request waits for it.
+
+    Returns:
+        subprocess.Popen: The warm-up process, or None if the warm-up is disabled.
+    """
+    if WARMUP_TOP <= 0:
+        return None
+    return spawn_warmup(top=WARMUP_TOP, max_concurrency=int(os.getenv("RECIPE_WARMUP_CONCURRENCY", "2")))
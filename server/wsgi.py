@@ -0,0 +1,28 @@
+"""
+Production (WSGI) entry point of the recipe generator.
+
+Run it with gunicorn, which reads gunicorn.conf.py from the repository root:
+
+    gunicorn server.wsgi:app
+
+The gunicorn master imports this module once and forks the worker processes
+from it. The app, the upstream client modules, the food table and the
+compiled page template are loaded here, so the workers share them and none
+of them loads them again. The services themselves are created by each
+worker on its first request, with their own threads and connections.
+"""
+import os
+import gc
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from server.app import create_app
+from server.services import preload
+
+app = create_app()
+
+preload()
+app.jinja_env.get_template('index.html')
+
+# Collections would write to the headers of the preloaded objects, copying their shared pages into every worker
+gc.freeze()
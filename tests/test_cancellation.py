@@ -0,0 +1,107 @@
+"""
+A streaming request whose client disconnects after the first chunk must
+release its upstream calls, governor slots and scheduler slot.
+"""
+import os
+import json
+import time
+import socket
+import tempfile
+import threading
+import http.client
+
+import pytest
+
+os.environ["RECIPE_GEN_BACKEND"] = "fake"
+os.environ["FAKE_FIRST_TOKEN_LATENCY"] = "0.05"
+os.environ["FAKE_CHUNK_INTERVAL"] = "0.05"
+os.environ["FAKE_TTS_LATENCY"] = "0.1"
+os.environ["FAKE_TTS_CHUNK_INTERVAL"] = "0.05"
+# Every request must reach the upstream, not a recipe generated for a similar one
+os.environ["RECIPE_SIMILARITY_THRESHOLD"] = "0"
+
+from werkzeug.serving import make_server
+from app import metrics
+from app.llm_logger import get_shared_writer
+from app.governor import governor_status
+from app.scheduler import get_scheduler
+from server.app import create_app
+from server.services import get_services
+
+# Seconds a cancelled request may take to release everything it holds
+RELEASE_TIMEOUT = 5.0
+
+_counter = iter(range(10 ** 9))
+
+def unique_ingredients():
+    return ["chicken breast", "rice", f"herb mix {next(_counter)}"]
+
+def unique_text(sentences):
+    n = next(_counter)
+    return "\n".join(f"Step {step}: cook the vegetables of batch {n} for {step + 2} minutes, then stir well."
+                     for step in range(sentences))
+
+ENDPOINTS = [
+    ("/api/stream-recipe", "stream_recipe", lambda: {"ingredients": unique_ingredients()}),
+    ("/api/speak-recipe", "speak_recipe", lambda: {"ingredients": unique_ingredients()}),
+    ("/api/stream-tts", "stream_tts", lambda: {"text": unique_text(20)}),
+]
+
+@pytest.fixture(scope="module")
+def port():
+    # The caches and logs are written relative to the working directory
+    cwd = os.getcwd()
+    os.chdir(tempfile.mkdtemp())
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+
+    server = make_server("127.0.0.1", port, create_app(), threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield port
+    server.shutdown()
+    thread.join()
+
+    # Write what is pending before pytest goes back to the repository
+    get_shared_writer().flush()
+    get_services().recipe_generator.cache.flush()
+    os.chdir(cwd)
+
+def released(backend):
+    """Whether no upstream call, governor slot or scheduler slot is held."""
+    scheduler = get_scheduler()
+    return (backend.in_progress == 0
+            and all(status['in_flight'] == 0 for status in governor_status().values())
+            and (scheduler is None or all(status['active'] == 0 and status['queued'] == 0
+                                          for status in scheduler.status().values())))
+
+def wait_for(condition):
+    deadline = time.monotonic() + RELEASE_TIMEOUT
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return condition()
+
+@pytest.mark.parametrize("path, endpoint, payload", ENDPOINTS, ids=[path for path, _, _ in ENDPOINTS])
+def test_disconnected_stream_releases_its_slots(port, path, endpoint, payload):
+    backend = get_services().recipe_generator.backend
+    cancelled = metrics.HTTP_STREAMS_CANCELLED.collect().get((endpoint,), 0)
+
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=RELEASE_TIMEOUT)
+    connection.request("POST", path, json.dumps(payload()), {"Content-Type": "application/json"})
+    response = connection.getresponse()
+    assert response.status == 200
+    assert response.read1(65536)
+    assert backend.in_progress > 0
+
+    # Like a browser closing the tab, the socket is closed without reading the rest
+    response.close()
+    connection.close()
+
+    assert wait_for(lambda: metrics.HTTP_STREAMS_CANCELLED.collect().get((endpoint,), 0) > cancelled)
+    assert wait_for(lambda: released(backend)), (
+        f"in progress: {backend.in_progress}, governors: {governor_status()}, "
+        f"scheduler: {get_scheduler().status()}")
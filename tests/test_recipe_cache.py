@@ -0,0 +1,50 @@
+from app.recipe_cache import RecipeCache
+
+
+def test_workers_sharing_a_file_keep_each_others_entries(tmp_path):
+    path = str(tmp_path / "recipes.json")
+    first, second = RecipeCache(persist_path=path), RecipeCache(persist_path=path)
+
+    first.put("a", "recipe a")
+    second.put("b", "recipe b")
+    first.flush()
+    second.flush()
+
+    restarted = RecipeCache(persist_path=path)
+    assert restarted.get("a") == "recipe a"
+    assert restarted.get("b") == "recipe b"
+
+
+def test_newer_entry_wins_and_clear_drops_older_entries_of_the_file(tmp_path):
+    path = str(tmp_path / "recipes.json")
+    first, second = RecipeCache(persist_path=path), RecipeCache(persist_path=path)
+
+    first.put("a", "old recipe a")
+    first.flush()
+    second.put("a", "new recipe a")
+    second.flush()
+    # The stale copy of the first worker does not replace the newer recipe
+    first.put("b", "recipe b")
+    first.flush()
+    assert RecipeCache(persist_path=path).get("a") == "new recipe a"
+
+    second.clear()
+    second.put("c", "recipe c")
+    second.flush()
+
+    restarted = RecipeCache(persist_path=path)
+    assert restarted.get("a") is None
+    assert restarted.get("b") is None
+    assert restarted.get("c") == "recipe c"
+
+
+def test_recipe_written_by_another_process_is_found_after_a_miss(tmp_path):
+    path = str(tmp_path / "recipes.json")
+    worker = RecipeCache(persist_path=path)
+    assert worker.get("a") is None
+
+    warmup = RecipeCache(persist_path=path)
+    warmup.put("a", "recipe a")
+    warmup.flush()
+
+    assert worker.get("a") == "recipe a"
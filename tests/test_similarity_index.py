@@ -0,0 +1,26 @@
+from app.similarity_index import SimilarityIndex
+
+
+def test_plural_of_a_more_specific_ingredient_matches():
+    index = SimilarityIndex()
+    index.add(["chicken breast", "spinach", "cherry tomato"], "recipe")
+
+    match = index.lookup(["chicken breast", "spinach", "tomatoes"])
+
+    assert match is not None
+    content, similarity, ingredients = match
+    assert content == "recipe"
+    assert similarity == 1.0
+    assert ingredients == ["chicken breast", "spinach", "cherry tomato"]
+
+
+def test_one_extra_garnish_matches_at_the_default_threshold():
+    index = SimilarityIndex()
+    index.add(["chicken", "rice", "broccoli"], "recipe")
+
+    match = index.lookup(["chicken", "rice", "broccoli", "green onion"])
+
+    assert match is not None
+    content, similarity, _ = match
+    assert content == "recipe"
+    assert similarity == 0.75